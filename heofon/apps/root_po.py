@@ -1,6 +1,6 @@
 import logging
-import importlib
 import time
+from urllib.parse import urlsplit
 import pytest
 import pdb
 # from axe_selenium_python import Axe
@@ -11,25 +11,45 @@ from heofon.framework.exceptions import PageLoadException
 # from heofon.framework.exceptions import ControlInteractionException
 #
 # from heofon.framework import checks
-from heofon.framework import utils, utils_file, utils_playwright
+from heofon.framework import utils, utils_file, utils_playwright, run_context
+from heofon.framework import routing, screenshots, visual
 
 logger = logging.getLogger(__name__)
 
 
+def same_url(current_url, target_url):
+    """
+        Compare two urls the way a browser would treat them as the same
+        document: the scheme and host are case-insensitive, and an empty
+        path is the same as '/'.
+
+        :param current_url: str, url the browser is at
+        :param target_url: str, url we want to go to
+        :return: bool
+    """
+    current = urlsplit(current_url)
+    target = urlsplit(target_url)
+    return (current.scheme.lower(), current.netloc.lower(),
+            current.path or '/', current.query, current.fragment) == \
+           (target.scheme.lower(), target.netloc.lower(),
+            target.path or '/', target.query, target.fragment)
+
+
 class RootPageObject(object):
+    # acceleration profile for this page: a name from
+    # heofon.framework.acceleration.PROFILES, an AccelerationProfile, or None
+    # for no acceleration; wrapper base classes set one for all their pages
+    acceleration_profile = None
 
     def resolve_po(self, po_id, cross_auth_boundary=False, **opts):
         """
             Using the string id of the pageobject for the desired page,
             identify the pageobject's class and instantiate it.
 
-            The importing of the modules and classes has to be done
-            dynamically -- and in this method -- in order to avoid
-            recursive import loops on start up.
-
-            This uses the data model in the PO's wrapper routings.py for
-            a mapping between the page/PO name with the module and
-            the object name for that PO.
+            The mapping between the page/PO name and the PO's class comes
+            from the data model in the PO's wrapper routings.py, compiled
+            once per session into the route table (see
+            heofon.framework.routing), so this is a dict lookup.
 
             What makes this method a little more complicated is the fact
             that the PO instantiation has to be aware of crossing the
@@ -46,64 +66,32 @@ class RootPageObject(object):
             :param opts: dict, pass-through parameters for the PO's __init__()
             :return: page object for the target page
         """
-        # import the routings module for the appropriate wrapper
-        # the path (minus the file name) lives in this wrapper's BasePageObject
-        import_path_to_routings = self.routings_path + 'routings'
-        logger.info(f"\nPath to routings module for this wrapper:\n{import_path_to_routings}")
-        routings = importlib.import_module(import_path_to_routings)
-
-        routing_map = None
-        root_path_to_module = None
-
-        # load the correct mapping dict from the wrapper's routings.py file,
-        # based on whether the next PO will be noauth or auth
+        # pick the routing map, based on whether the next PO will be
+        # noauth or auth
         if self.page_auth_mode == 'noauth':
-            if cross_auth_boundary:
-                # handle the auth boundary crossing here if needed
-                # need to load the auth map
-                routing_map = routings.auth_pageobjects
-                root_path_to_module = routings.AUTH_PATH
-                pass
-            else:
-                # load the noauth map
-                routing_map = routings.noauth_pageobjects
-                root_path_to_module = routings.NOAUTH_PATH
+            # crossing the auth boundary from a noauth page loads the auth map
+            target_auth_mode = 'auth' if cross_auth_boundary else 'noauth'
         elif self.page_auth_mode == 'auth':
-            if cross_auth_boundary:
-                # handle the auth boundary crossing here if needed
-                # need to load the noauth map
-                routing_map = routings.noauth_pageobjects
-                root_path_to_module = routings.NOAUTH_PATH
-            else:
-                # load the auth map
-                routing_map = routings.auth_pageobjects
-                root_path_to_module = routings.AUTH_PATH
+            # crossing the auth boundary from an auth page loads the noauth map
+            target_auth_mode = 'noauth' if cross_auth_boundary else 'auth'
         else:
             msg = f"page_auth_mode can only be 'noauth' or 'auth'; " \
                   f"'{self.page_auth_mode}' is not valid."
             logger.error(msg)
             raise ValueError(msg)
 
-        # get the str module name for the new PO
-        page_object_data = routing_map[po_id]
-
-        # assemble the str dot-notation path for the module
-        module_path = root_path_to_module + page_object_data['module']
-
-        # dynamically import the module `module_path`
-        logger.info(f"\nPath to page object: {module_path} --> '{po_id}'.")
-        path_to_module = importlib.import_module(module_path)
-
-        # dynamically translate from the str name of the PO
-        # to the PO's class
-        pageobject_class = getattr(path_to_module, page_object_data['object'])
+        # translate from the str name of the PO to the PO's class, using the
+        # route table compiled from the wrappers' routings.py files
+        pageobject_class = routing.resolve_route(
+            self.routings_path, target_auth_mode, po_id)
+        logger.debug(f"\nRoute for '{po_id}' --> {pageobject_class.__name__}.")
 
         # instantiate a class instance for the PageObject.
         # Note: at this point, in this method, `self` refers to the old PO
         unvalidated_pageobject = pageobject_class(self.pwpage)
         return unvalidated_pageobject
 
-    def load_po(self, po_id, cross_auth_boundary=False, **opts):
+    def load_po(self, po_id, cross_auth_boundary=False, trigger=None, **opts):
         """
             Load the page object for the page that has been navigated to,
             and return it.
@@ -130,6 +118,8 @@ class RootPageObject(object):
             :param po_id: str, key for the page object in the POM data model
             :param cross_auth_boundary: bool, true to trigger a switch between
                                         auth and noath routing, or vice versa
+            :param trigger: str, what caused the transition, for the page
+                            metrics, e.g. "clicked 'basket link'"
             :param opts: dict, pass-through parameters for the PO's __init__()
             :return: page object for the target page
         """
@@ -145,25 +135,148 @@ class RootPageObject(object):
         # TODO: actually verify page load
         event = f"loaded page '{po_id}'"
 
+        testcase = run_context.current_testcase()
+        # what the new page blocked while it loaded; from here on, the new
+        # page's profile applies (e.g. to a single-page-app transition)
+        acceleration = None
+        if testcase.accelerator is not None:
+            acceleration = testcase.accelerator.drain()
+            testcase.accelerator.activate(
+                new_pageobject_instance.acceleration_profile)
+
         # perform a series of data collection and file-writes for the NEW page
         # which has NOT YET been instantiated as a page object
 
-        # write the cookies FOR THE NEW PAGE to a file
-        new_pageobject_instance.save_cookies(filename=event)
+        # write the cookies, browser console logs and webstorage FOR THE
+        # NEW PAGE to files, from a single snapshot of the browser state
+        new_pageobject_instance.save_browser_state(event=event)
+
+        # the requests made since the last transition
+        if testcase.network_recorder is not None:
+            new_pageobject_instance.save_network(event)
 
-        # write browser console logs FOR THE NEW PAGE to files
-        new_pageobject_instance.save_browser_logs(filename=event)
+        # page-load timings for the new page, for performance monitoring
+        if testcase.page_metrics is not None:
+            testcase.page_metrics.record(new_pageobject_instance.name, event,
+                                         trigger=trigger,
+                                         acceleration=acceleration)
 
-        # write webstorage FOR THE NEW PAGE to files
-        new_pageobject_instance.save_webstorage(event=event, set_this_event=False)
+        # the page transition is a step boundary for a chunked trace
+        if testcase.tracer is not None:
+            testcase.tracer.step(event)
 
         # with this return, the page object model is now in sync
         # with the browser
         return new_pageobject_instance
 
+    # #######################################
+    # navigation methods
+    # #######################################
+    def open(self):
+        """
+            Navigate the browser to this page object's url.
+
+            Page objects never navigate when they are constructed, because
+            they are also constructed to model a page the browser has already
+            loaded (see load_po()). Call open() when the test needs to send
+            the browser to the page.
+
+            :return self: this page object, for chaining
+        """
+        self.accelerate(self.acceleration_profile)
+        self.goto(self.url)
+        return self
+
+    def goto(self, url):
+        """
+            Load `url` in the browser, unless the browser is already there.
+
+            :param url: str, the url to navigate to
+            :return: Playwright Response for the navigation, or None if the
+                     navigation was skipped
+        """
+        if same_url(self.pwpage.url, url):
+            logger.info(f"\nAlready at '{url}'; skipped navigation.")
+            return None
+        logger.info(f"\nNavigating to '{url}'.")
+        return self.pwpage.goto(url)
+
+    def accelerate(self, profile):
+        """
+            Make `profile` the active acceleration profile for the test's
+            context, ahead of a navigation (see heofon.framework.acceleration).
+
+            :param profile: AccelerationProfile, profile name, or None
+            :return: AccelerationProfile, the active profile, or None if
+                     acceleration is off
+        """
+        accelerator = run_context.current_testcase().accelerator
+        if accelerator is None:
+            return None
+        return accelerator.activate(profile)
+
     # #######################################
     # browser data methods
     # #######################################
+    def _capture_is_off(self, what):
+        """
+            Check the test's capture policy before capturing an artifact.
+
+            :param what: str, the artifact, for the log
+            :return: bool, True if artifacts are not captured for this test
+        """
+        if run_context.current_testcase().capture_policy == 'off':
+            logger.debug(f"\nCapture policy is 'off'; not saving {what}.")
+            return True
+        return False
+
+    def capture_browser_state(self):
+        """
+            Take a single snapshot of the browser state for the current page
+            (cookies, local and session storage, console log), and keep the
+            cookies on the PO.
+
+            If the test drains web storage mutations from the page (see
+            storage_journal), the storage is only scanned when the test's
+            delta journals are due for a baseline.
+
+            :return state: BrowserState snapshot
+        """
+        testcase = run_context.current_testcase()
+        journal = testcase.storage_journal
+        recorder = testcase.delta_recorder
+        scan = bool(journal and recorder and
+                    (recorder.needs_baseline('local') or
+                     recorder.needs_baseline('session')))
+        state = utils_playwright.get_browser_state(
+            self.pwpage, journal=journal, scan=scan,
+            console=testcase.console_recorder)
+        self.cookies = state.cookies
+        return state
+
+    def save_browser_state(self, event):
+        """
+            Snapshot the browser state for the current page and write it
+            to the cookies, console and webstorage files, using the event as
+            the base for the file names.
+
+            This costs two browser round trips, instead of the four that
+            save_cookies(), save_browser_logs() and save_webstorage() make
+            when they are called one after the other.
+
+            :param event: str, name of the event
+            :return state: BrowserState snapshot, or None if the capture
+                           policy is 'off'
+        """
+        if self._capture_is_off('the browser state'):
+            return None
+        state = self.capture_browser_state()
+        utils_file.write_browser_state_to_files(state,
+                                                current_url=self.url,
+                                                pageobject_name=self.name,
+                                                event=event)
+        return state
+
     def save_cookies(self, filename=''):
         """
             Get the current page's cookies and save to a file.
@@ -178,6 +291,8 @@ class RootPageObject(object):
                              defaults to PO name
             :return: None
         """
+        if self._capture_is_off('cookies'):
+            return
         fname = filename if filename else self.name
         # get the cookies from the driver and save to the PO
         self.cookies = self.pwpage.context.cookies()
@@ -199,6 +314,8 @@ class RootPageObject(object):
             :param set_this_event: bool, true to call set_event for this event
             :return: None
         """
+        if self._capture_is_off('web storage'):
+            return
         data = self.get_webstorage()
         if set_this_event:
             self.set_event(event)
@@ -220,21 +337,51 @@ class RootPageObject(object):
 
     def save_browser_logs(self, filename=''):
         """
-            Grab the Chrome driver console and network logs and write them
-            to files.
+            Write the console messages, page errors and failed requests
+            recorded since the last capture to a file.
 
             :param filename: str filename for the log file;
                              defaults to PO name
             :return:
         """
+        if self._capture_is_off('the console log'):
+            return
         # set the cleaned file name
         fname = filename if filename else self.name
 
-        console_log = utils_playwright.get_console_log(self.pwpage)
+        recorder = run_context.current_testcase().console_recorder
+        if recorder is None:
+            logger.info(f"\nNo console recorder for this page; "
+                        f"skipping the console log.")
+            return
+        console_log, dropped = utils_playwright.get_console_log(recorder)
 
         # write the scan logs to /console
         utils_file.write_console_log_to_file(log=console_log,
-                                             url=self.url, fname=fname)
+                                             url=self.url, fname=fname,
+                                             dropped=dropped)
+
+    def save_network(self, event):
+        """
+            Write the requests recorded since the last page transition to
+            the network file, and log their summary.
+
+            :param event: str, name of the event
+            :return: dict, summary of the requests (see
+                     network_capture.summarize()), or None if the network
+                     is not recorded
+        """
+        recorder = run_context.current_testcase().network_recorder
+        if recorder is None:
+            return None
+        chunk = recorder.flush(self.name, event)
+        summary = chunk.summary
+        logger.info(f"\nnetwork for {event}: {summary['requests']} requests "
+                    f"({summary['failed']} failed), {summary['bytes']} bytes; "
+                    f"by type: {summary['by_type']}; "
+                    f"slowest: {summary['slowest']}")
+        utils_file.write_network_to_file(chunk)
+        return summary
 
     # #######################################
     # page object transition methods
@@ -264,6 +411,12 @@ class RootPageObject(object):
         """
         pwpage = self.pwpage  # minor disambiguation
 
+        # the target page's acceleration profile applies to the navigation
+        # the click triggers
+        target_class = routing.resolve_route(
+            self.routings_path, self.page_auth_mode, po_selector)
+        self.accelerate(target_class.acceleration_profile)
+
         # perform the click action
         # wait = WebDriverWait(driver, 20)
         if change_url:
@@ -311,12 +464,13 @@ class RootPageObject(object):
 
         # load and return the PO for the next page
         logger.info(f"\nLoading page object for '{po_selector}'.")
+        trigger = f"clicked '{name}' on '{self.name}'"
         if actions.get('pass through to PO'):
             # In some special cases a PO's __init__() might require
             # additional args
-            next_page = self.load_po(po_selector, **actions)
+            next_page = self.load_po(po_selector, trigger=trigger, **actions)
         else:
-            next_page = self.load_po(po_selector)
+            next_page = self.load_po(po_selector, trigger=trigger)
         return next_page
 
     def set_event(self, event_name, page_name=None):
@@ -341,7 +495,7 @@ class RootPageObject(object):
             'event': event_name,
             'on page': page_name if page_name else self.name
         }
-        logger.info(f"\nbrowser interaction event:\n{utils.plog(this_event)}")
+        logger.info("\nbrowser interaction event:\n%s", utils.lazy_plog(this_event))
 
     # #######################################
     # interaction event wrappers
@@ -368,29 +522,85 @@ class RootPageObject(object):
         #         self._unhover(x=x, y=y)
         #         # self.save_screenshot(f"after unhover {name}")
 
-    def save_screenshot(self, filename=''):
+    def save_screenshot(self, filename='', element=None):
         """
             Wrap the PW Page's screenshot functionality to generate and save
             the screenshot.
 
-            There's alot not yet supported;
-            see https://playwright.dev/python/docs/api/class-page#page-screenshot
+            The format, quality, full-page or viewport mode and downscaling
+            come from the test's screenshot settings (see screenshots and the
+            `--screenshot-*` CLI options). A screenshot that is identical to
+            the previous one is skipped.
+
+            See https://playwright.dev/python/docs/api/class-page#page-screenshot
             for more details.
 
             :param filename: str filename for the screenshot (not including
                              the path)
+            :param element: str selector, or Playwright Locator, to capture
+                            only that element
             :return: None
         """
-        # the current test's screenshot folder
-        logger.info(f"\namespace:\n{utils.plog(pytest.custom_namespace)}")
-        path = pytest.custom_namespace['current test case']['screenshots folder']
-
+        if self._capture_is_off('a screenshot'):
+            return
         # set the filename
         fname = filename if filename else self.name
-        clean_name = utils_file.path_proof_name(fname + '.png')
-        logger.info(f"\nGenerating screenshot for '{clean_name}'.")
-
-        path_to_screenshot = path / clean_name
+        logger.info(f"\nGenerating screenshot for '{fname}'.")
+
+        testcase = run_context.current_testcase()
+        if testcase.screenshots is None:
+            testcase.screenshots = screenshots.ScreenshotPipeline()
+        pipeline = testcase.screenshots
+        if isinstance(element, str):
+            element = self.pwpage.locator(element)
+
+        # use the PW Page object that's attached to our pageobject to
+        # screenshot, and hand the image to the background artifact writer
+        job = pipeline.capture(self.pwpage, element=element)
+        if job is None:
+            logger.info(f"\nScreenshot unchanged since the last one; skipped.")
+            return
+        path_to_screenshot = utils_file.write_screenshot_to_file(
+            job, fname, suffix=pipeline.settings.suffix,
+            serializer=screenshots.encoded_bytes)
         logger.info(f"\nfull path: '{path_to_screenshot}'.")
-        # use the PW Page object that's attached to our pageobject to screenshot
-        self.pwpage.screenshot(path=path_to_screenshot, full_page=True)
+
+    def check_visual(self, name='', ignore_regions=None, full_page=True,
+                     **options):
+        """
+            Compare the page against its baseline image.
+
+            The screenshot is always a lossless png, whatever the screenshot
+            settings. The comparison itself runs at the end of the session
+            (see visual and the `--visual-*` CLI options), so a difference
+            fails the run, not this test. If there is no baseline yet, the
+            check is reported as 'missing baseline'; run with
+            `--visual-update` to store the screenshots as the baselines.
+
+            :param name: str, name of the check; defaults to the page
+                         object's name; must be unique within the test
+            :param ignore_regions: list of (x, y, width, height) tuples for
+                                   parts of the page that are expected to
+                                   change, e.g. a clock or a carousel
+            :param full_page: bool, False to check only the viewport
+            :param options: dict, compare_arrays() keyword arguments to
+                            override the session's, e.g. pixel_tolerance
+            :return: None
+        """
+        visual.require_engine()
+        name = name if name else self.name
+        logger.info(f"\nQueueing visual check '{name}'.")
+
+        testcase = run_context.current_testcase()
+        settings = visual.settings()
+        image = self.pwpage.screenshot(type='png', full_page=full_page)
+        path = utils_file.write_visual_check_to_file(image, name)
+        job = visual.ComparisonJob(
+            testcase.nodeid, name,
+            baseline=settings['store'].path_for(testcase.nodeid, name),
+            actual=path,
+            diff=path.with_name(f"{path.stem}_diff.png"),
+            ignore_regions=ignore_regions,
+            update=settings['update'],
+            **{**settings['options'], **options})
+        visual.queue_comparison(job)
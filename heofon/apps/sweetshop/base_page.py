@@ -73,21 +73,20 @@ class PomBootPage(BaseWrapperPageObject):
             :param page_id: str, key for the page object in the POM data model
             :return new_pageobject_instance: page object for the target page
         """
-        # step 1: using the page id, instantiate that page's pageobject
+        # step 1: using the page id, instantiate that page's pageobject;
+        # page objects don't navigate when they are constructed
         page = self.resolve_po(po_id=page_id)
 
-        # step 2: from that page object instance, get the url for that page
-        target_url = page.url
+        # step 2: load the page's url in the browser using the pwpage driver
+        # (this is skipped if the browser is already at that url)
+        page.open()
 
-        # step 3: load the page in the browser using pwpage driver
-        self.pwpage.goto(target_url)
-
-        # step 4: update the POM based on what we think the browser just did;
+        # step 3: update the POM based on what we think the browser just did;
         # we can be pretty sure of what we told the browser to do, and we hope
         # we understand how the context has changed, but we don't KNOW that the
         # was loaded correctly into the browser. So, we re-load the pageobject
         # with the checks.
         new_pageobject_instance = self.load_po(po_id=page_id)
 
-        # step 5: return the page object to the calling test code
+        # step 4: return the page object to the calling test code
         return new_pageobject_instance
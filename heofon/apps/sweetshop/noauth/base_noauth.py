@@ -14,6 +14,9 @@ class NoAuthBasePageObject(BaseWrapperPageObject):
     """
     # str enum, either 'noauth' or 'auth', as appropriate
     page_auth_mode = 'noauth'
+    # the tests only need the DOM and navigation: with
+    # --acceleration=declared, skip images, fonts, analytics and animations
+    acceleration_profile = 'dom-only'
 
     def generate_nav_path(self, target):
         """
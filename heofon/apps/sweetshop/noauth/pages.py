@@ -12,6 +12,9 @@ PWINIT_MSG = 'Instantiated PW PageObject for %s.'
 
 class BasePage(NoAuthBasePageObject):
     appname = 'sweetshop'
+    # the page urls are built from these; the stand-in server overrides
+    # them (see heofon.apps.sweetshop.standin.server.serve_app())
+    scheme = 'https'
     domain = 'sweetshop.vivrichards.co.uk'
 
 
@@ -21,9 +24,8 @@ class HomePage(BasePage):
     url_path = '/'
 
     def __init__(self, pwpage):
-        self.url = f"https://{self.domain}{self.url_path}"
+        self.url = f"{self.scheme}://{self.domain}{self.url_path}"
         self.pwpage = pwpage
-        self.pwpage.goto(self.url)
         logger.info('\n' + PWINIT_MSG % self.name)
 
 
@@ -33,7 +35,7 @@ class SweetsPage(BasePage):
     url_path = '/sweets'
 
     def __init__(self, pwpage):
-        self.url = f"https://{self.domain}{self.url_path}"
+        self.url = f"{self.scheme}://{self.domain}{self.url_path}"
         self.pwpage = pwpage
         logger.info('\n' + PWINIT_MSG % self.name)
 
@@ -44,7 +46,7 @@ class AboutPage(BasePage):
     url_path = '/about'
 
     def __init__(self, pwpage):
-        self.url = f"https://{self.domain}{self.url_path}"
+        self.url = f"{self.scheme}://{self.domain}{self.url_path}"
         self.pwpage = pwpage
         logger.info('\n' + PWINIT_MSG % self.name)
 
@@ -55,7 +57,7 @@ class LoginPage(BasePage):
     url_path = '/login'
 
     def __init__(self, pwpage):
-        self.url = f"https://{self.domain}{self.url_path}"
+        self.url = f"{self.scheme}://{self.domain}{self.url_path}"
         self.pwpage = pwpage
         logger.info('\n' + INIT_MSG % self.name)
 
@@ -66,6 +68,6 @@ class BasketPage(BasePage):
     url_path = '/basket'
 
     def __init__(self, pwpage):
-        self.url = f"https://{self.domain}{self.url_path}"
+        self.url = f"{self.scheme}://{self.domain}{self.url_path}"
         self.pwpage = pwpage
         logger.info('\n' + INIT_MSG % self.name)
@@ -0,0 +1,237 @@
+"""
+    In-process HTTP server with static copies of the sweetshop pages.
+
+    The example suite drives sweetshop.vivrichards.co.uk, so it needs the
+    internet, and its timings are mostly internet latency. The stand-in
+    serves the Home, Sweets, About, Login and Basket pages (with the same
+    top nav that NoAuthBasePageObject.top_menu_goto() clicks, including the
+    broken About link on the Basket page) from the `site` folder, on
+    127.0.0.1, from a thread of the test process.
+
+    The network conditions are configurable, so a run has a known, steady
+    baseline:
+    + `latency_ms`: delay before each response
+    + `kb_per_second`: bandwidth for the response bodies, 0 for unlimited
+    + `error_rate`: fraction of the requests answered with `error_status`,
+      picked with a seeded random generator, so a run is repeatable
+
+    serve_app() points a wrapper's base page object at the stand-in, by
+    overriding its `scheme` and `domain` class attributes, e.g.:
+    >>> with StandinServer(latency_ms=20) as server:
+    ...     with serve_app(BasePage, server):
+    ...         home_page = boot_page.start_with('sweetshop home page')
+"""
+import contextlib
+import logging
+import mimetypes
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+SITE_FOLDER = Path(__file__).parent / 'site'
+# url path -> file in the site folder
+PAGES = {'/': 'index.html',
+         '/sweets': 'sweets.html',
+         '/about': 'about.html',
+         '/login': 'login.html',
+         '/basket': 'basket.html'}
+NOT_FOUND_PAGE = '404.html'
+# the bodies are written in slices, so the bandwidth limit is smooth
+SLICE_BYTES = 4096
+
+
+def load_site(folder=SITE_FOLDER):
+    """
+        Read the site into memory.
+
+        :param folder: Path, the site folder
+        :return: dict, url path -> (bytes body, str content type)
+    """
+    files = {}
+    for path in sorted(folder.rglob('*')):
+        if not path.is_file():
+            continue
+        content_type = mimetypes.guess_type(path.name)[0] or \
+            'application/octet-stream'
+        if content_type.startswith('text/'):
+            content_type += '; charset=utf-8'
+        files['/' + path.relative_to(folder).as_posix()] = \
+            (path.read_bytes(), content_type)
+    for url_path, filename in PAGES.items():
+        files[url_path] = files[f"/{filename}"]
+    return files
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    """
+        Serve one request from the server's in-memory site.
+    """
+    protocol_version = 'HTTP/1.1'
+    server_version = 'heofon-standin'
+
+    def do_GET(self):
+        self._respond(send_body=True)
+
+    def do_HEAD(self):
+        self._respond(send_body=False)
+
+    def _respond(self, send_body):
+        server = self.server
+        path = self.path.split('?', 1)[0].split('#', 1)[0]
+        if server.latency_ms:
+            time.sleep(server.latency_ms / 1000)
+
+        if server.inject_error():
+            status = server.error_status
+            body, content_type = b'Injected error', 'text/plain; charset=utf-8'
+        elif path in server.files:
+            status = 200
+            body, content_type = server.files[path]
+        else:
+            status = 404
+            body, content_type = server.files[f"/{NOT_FOUND_PAGE}"]
+
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        # the pages are always fetched; the assets can be cached
+        self.send_header('Cache-Control', 'max-age=3600'
+                         if status == 200 and path not in PAGES else 'no-cache')
+        self.end_headers()
+        server.count(status, len(body) if send_body else 0)
+        if send_body:
+            self._write(body)
+
+    def _write(self, body):
+        rate = self.server.kb_per_second * 1024
+        if not rate:
+            self.wfile.write(body)
+            return
+        # each slice waits for its share of the bandwidth before it is sent
+        for start in range(0, len(body), SLICE_BYTES):
+            data = body[start:start + SLICE_BYTES]
+            time.sleep(len(data) / rate)
+            self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logger.debug(f"\nstand-in: {self.address_string()} {format % args}")
+
+
+class StandinServer(ThreadingHTTPServer):
+    """
+        The sweetshop stand-in, on a free port of 127.0.0.1.
+
+        :param latency_ms: int, delay before each response
+        :param kb_per_second: int, bandwidth for the response bodies; 0 for
+                              unlimited
+        :param error_rate: float, 0-1, fraction of the requests that fail
+        :param error_status: int, HTTP status of the failed requests
+        :param seed: int, seed for picking the failed requests
+        :param port: int, port to listen on; 0 for any free port
+    """
+    daemon_threads = True
+
+    def __init__(self, latency_ms=0, kb_per_second=0, error_rate=0.0,
+                 error_status=500, seed=0, port=0):
+        if not 0 <= error_rate <= 1:
+            msg = f"error_rate must be between 0 and 1, not {error_rate}."
+            logger.error(msg)
+            raise ValueError(msg)
+        super().__init__(('127.0.0.1', port), StandinHandler)
+        self.latency_ms = latency_ms
+        self.kb_per_second = kb_per_second
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.files = load_site()
+        self.stats = {'requests': 0, 'errors': 0, 'not found': 0, 'bytes': 0}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def domain(self):
+        """
+            :return: str, host and port, e.g. '127.0.0.1:50123'
+        """
+        return f"{self.server_address[0]}:{self.server_address[1]}"
+
+    @property
+    def url(self):
+        return f"http://{self.domain}"
+
+    def start(self):
+        """
+            Serve requests from a background thread.
+
+            :return: self, for chaining
+        """
+        self._thread = threading.Thread(target=self.serve_forever,
+                                        name='heofon-standin', daemon=True)
+        self._thread.start()
+        logger.info(f"\nSweetshop stand-in serving at {self.url} "
+                    f"(latency {self.latency_ms}ms, "
+                    f"{self.kb_per_second or 'unlimited'} KB/s, "
+                    f"error rate {self.error_rate}).")
+        return self
+
+    def stop(self):
+        """
+            Stop serving, and close the socket.
+
+            :return: dict, the server's stats
+        """
+        if self._thread is not None:
+            self.shutdown()
+            self._thread.join()
+            self._thread = None
+        self.server_close()
+        logger.info(f"\nSweetshop stand-in stopped: {self.stats}")
+        return self.stats
+
+    def inject_error(self):
+        """
+            :return: bool, True if this request should fail
+        """
+        if not self.error_rate:
+            return False
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def count(self, status, nbytes):
+        with self._lock:
+            self.stats['requests'] += 1
+            self.stats['bytes'] += nbytes
+            if status == 404:
+                self.stats['not found'] += 1
+            elif status != 200:
+                self.stats['errors'] += 1
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+@contextlib.contextmanager
+def serve_app(page_class, server):
+    """
+        Point a wrapper's base page object at the stand-in: its page objects
+        build their urls from the `scheme` and `domain` class attributes.
+
+        :param page_class: the wrapper's base page object class, e.g.
+                           heofon.apps.sweetshop.noauth.pages.BasePage
+        :param server: StandinServer instance
+        :yield: StandinServer instance
+    """
+    saved = page_class.scheme, page_class.domain
+    page_class.scheme, page_class.domain = 'http', server.domain
+    logger.info(f"\n{page_class.__name__} now points at {server.url}.")
+    try:
+        yield server
+    finally:
+        page_class.scheme, page_class.domain = saved
@@ -0,0 +1,126 @@
+"""
+    Startup-time benchmark for `pytest --collect-only`.
+
+    Writes a synthetic suite of parametrized tests under heofon/tests (so
+    that the heofon conftest applies), then times `pytest --collect-only`
+    on it in a fresh interpreter, and counts the output folders the run
+    leaves behind. With the dry-run fast path in pytest_configure, a
+    collect-only run creates no testrun folder, configures no file logging
+    and writes no html report.
+
+    Optionally, the same suite is collected with another revision of the
+    repo (checked out in a temporary git worktree), e.g. the revision before
+    the fast path, for a before/after comparison.
+
+    Run from the root of the repo checkout (the heofon output folder is
+    located from the current directory):
+    $ python -m heofon.benchmarks.bench_collect_only --tests 10000 --rounds 5
+    $ python -m heofon.benchmarks.bench_collect_only --compare HEAD~1
+"""
+import argparse
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SUITE_FOLDER = '_bench_collect_only'
+TESTS_PER_FUNCTION = 1000
+
+
+def write_suite(root, n_tests):
+    """
+        Write a synthetic module of `n_tests` parametrized tests.
+
+        :param root: Path, root of the repo checkout
+        :param n_tests: int, number of test items to generate
+        :return: Path, the suite folder, relative to root
+    """
+    folder = root / 'heofon' / 'tests' / SUITE_FOLDER
+    folder.mkdir(exist_ok=True)
+    lines = ['import pytest', '', '']
+    functions, remainder = divmod(n_tests, TESTS_PER_FUNCTION)
+    sizes = [TESTS_PER_FUNCTION] * functions + ([remainder] if remainder else [])
+    for i, size in enumerate(sizes):
+        lines += [f"@pytest.mark.parametrize('n', range({size}))",
+                  f"def test_synthetic_{i}(n):",
+                  "    assert n >= 0", '', '']
+    (folder / 'test_synthetic.py').write_text('\n'.join(lines))
+    return folder.relative_to(root)
+
+
+def time_collect_only(root, suite, rounds):
+    """
+        Time `pytest --collect-only` runs on the synthetic suite.
+
+        :param root: Path, root of the repo checkout
+        :param suite: Path, the suite folder, relative to root
+        :param rounds: int, number of runs
+        :return: dict of timings (s), and the number of output folders created
+    """
+    output = root / 'heofon' / 'output'
+    before = set(output.iterdir()) if output.exists() else set()
+    command = [sys.executable, '-m', 'pytest', '--collect-only', '-q',
+               '-p', 'no:cacheprovider', str(suite)]
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = subprocess.run(command, cwd=root, capture_output=True,
+                                text=True)
+        timings.append(time.perf_counter() - start)
+        if result.returncode != 0:
+            print(result.stdout[-2000:], result.stderr[-2000:])
+            raise SystemExit(f"pytest --collect-only failed in {root}")
+
+    created = set(output.iterdir()) - before if output.exists() else set()
+    for path in created:
+        # only remove what this benchmark created
+        shutil.rmtree(path, ignore_errors=True)
+    return {'min': min(timings), 'median': statistics.median(timings),
+            'folders': len(created)}
+
+
+def run(root, n_tests, rounds):
+    suite = write_suite(root, n_tests)
+    try:
+        return time_collect_only(root, suite, rounds)
+    finally:
+        shutil.rmtree(root / suite, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--tests', type=int, default=10000)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--compare', metavar='REV',
+                        help='also collect with this git revision')
+    args = parser.parse_args()
+
+    root = Path.cwd()
+    results = {'current': run(root, args.tests, args.rounds)}
+
+    if args.compare:
+        # the worktree folder must be named heofon, like a checkout
+        tmp = Path(tempfile.mkdtemp())
+        worktree = tmp / 'heofon'
+        subprocess.run(['git', 'worktree', 'add', '--detach', str(worktree),
+                        args.compare], cwd=root, check=True,
+                       capture_output=True)
+        try:
+            results[args.compare] = run(worktree, args.tests, args.rounds)
+        finally:
+            subprocess.run(['git', 'worktree', 'remove', '--force',
+                            str(worktree)], cwd=root, capture_output=True)
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    print(f"pytest --collect-only, {args.tests} tests, {args.rounds} rounds")
+    for name, result in results.items():
+        print(f"{name:>12}: min {result['min']:.2f}s  "
+              f"median {result['median']:.2f}s  "
+              f"output folders created: {result['folders']}")
+
+
+if __name__ == '__main__':
+    main()
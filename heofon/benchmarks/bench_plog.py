@@ -0,0 +1,105 @@
+"""
+    Logging overhead per page transition, before and after lazy_plog().
+
+    'before' replays the logging a load_po() transition (plus its
+    save_screenshot()) did before lazy_plog(): eager plog() calls inside
+    f-strings, with the type-dispatch imports done on every non-json call.
+
+    'after' is the logging the same transition does now: utils.lazy_plog()
+    as %-style args. The screenshot's own log line is the same in both.
+
+    Both are measured with the logger at INFO (every record is emitted to
+    a handler that formats into a null stream) and at WARNING (every record
+    is dropped).
+
+    Usage:
+    $ python -m heofon.benchmarks.bench_plog --transitions 200
+"""
+import argparse
+import io
+import json
+import logging
+import pathlib
+import pprint
+import time
+
+from heofon.framework import utils
+
+logger = logging.getLogger('heofon.benchmarks.plog')
+
+
+def eager_plog(content):
+    """ plog() as it was before lazy_plog(): imports on every non-json call. """
+    try:
+        return json.dumps(content, indent=4, sort_keys=True)
+    except (ValueError, TypeError):
+        try:
+            from requests.structures import CaseInsensitiveDict  # noqa: F401
+            import deepdiff  # noqa: F401
+        except ImportError:
+            pass
+        return pprint.pformat(content, indent=1, width=100)
+
+
+def make_payloads():
+    """ Payloads shaped like the ones logged during a page transition. """
+    folder = pathlib.Path('/tmp/heofon/output/241017-120000/12_dynamic_navigation')
+    screenshot = folder / 'screenshots' / '3_sweetshop_sweets_page.png'
+    event = {'_timestamp': time.time(), 'event': "clicked element 'Sweets'",
+             'on page': 'sweetshop home page'}
+    console = ['_page: https://sweetshop.vivrichards.co.uk/sweets'] + \
+              [{'type': 'log', 'text': f"message {i}"} for i in range(50)]
+    return event, console, screenshot
+
+
+def transition_before(event, console, screenshot):
+    logger.info(f"\nbrowser interaction event:\n{eager_plog(event)}")
+    logger.info(f"\nconsole logs: {eager_plog(console)}.")
+    logger.info(f"\nbrowser interaction event:\n{eager_plog(event)}")
+    logger.info(f"\nQueued screenshot: {screenshot}.")  # save_screenshot()
+
+
+def transition_after(event, console, screenshot):
+    logger.info('\nbrowser interaction event:\n%s', utils.lazy_plog(event))
+    logger.info('\nconsole logs: %s.', utils.lazy_plog(console))
+    logger.info('\nbrowser interaction event:\n%s', utils.lazy_plog(event))
+    logger.info(f"\nQueued screenshot: {screenshot}.")  # save_screenshot()
+
+
+def measure(func, payloads, transitions, repeats=5):
+    """ Best-of-`repeats` mean time per transition, in seconds. """
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(transitions):
+            func(*payloads)
+        elapsed = (time.perf_counter() - start) / transitions
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run(transitions):
+    handler = logging.StreamHandler(io.StringIO())
+    handler.setFormatter(logging.Formatter(
+        '%(asctime)s %(name)s::%(funcName)s() [%(levelname)s] %(message)s'))
+    logger.addHandler(handler)
+    logger.propagate = False
+    payloads = make_payloads()
+
+    for level in [logging.INFO, logging.WARNING]:
+        logger.setLevel(level)
+        before = measure(transition_before, payloads, transitions)
+        after = measure(transition_after, payloads, transitions)
+        handler.stream.seek(0)
+        handler.stream.truncate()
+        print(f"{logging.getLevelName(level):>8}: "
+              f"before {before * 1e6:9.1f} us/transition, "
+              f"after {after * 1e6:9.1f} us/transition "
+              f"({before / after:5.1f}x)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--transitions', type=int, default=200)
+    args = parser.parse_args()
+    run(args.transitions)
@@ -0,0 +1,113 @@
+"""
+    Timing comparison for PomBootPage.start_with().
+
+    Before this change, start_with() loaded the home page three times: once
+    when HomePage.__init__() ran during resolve_po(), once explicitly, and
+    once more when load_po() re-constructed the page object. Now page objects
+    don't navigate on construction and RootPageObject.goto() skips a
+    navigation when the browser is already at the target url.
+
+    This drives a real browser against the sweetshop app and compares:
+    + 'legacy': the old sequence of three goto() calls for the home page
+    + 'current': PomBootPage.start_with('sweetshop home page')
+
+    With `--standin`, the pages come from the local sweetshop stand-in
+    (heofon.apps.sweetshop.standin.server), with `--latency-ms` of added
+    latency, so the timings are the framework's and the browser's, not the
+    internet's.
+
+    Usage:
+    $ python -m heofon.benchmarks.bench_start_with --rounds 10 --browser chromium
+    $ python -m heofon.benchmarks.bench_start_with --standin --latency-ms 20
+"""
+import argparse
+import contextlib
+import logging
+import statistics
+import time
+
+from heofon.apps.sweetshop.base_page import PomBootPage
+from heofon.apps.sweetshop.noauth.pages import BasePage
+from heofon.apps.sweetshop.standin.server import StandinServer, serve_app
+from heofon.framework import routing
+from heofon.framework.browser_pool import launch_browser
+
+logger = logging.getLogger(__name__)
+
+HOME_PAGE = 'sweetshop home page'
+
+
+def legacy_start_with(pwpage, url):
+    """
+        The navigations the old start_with() made, without the surrounding
+        artifact capture (which is the same in both versions).
+    """
+    pwpage.goto(url)  # in HomePage.__init__() via resolve_po()
+    pwpage.goto(url)  # explicit goto in start_with()
+    pwpage.goto(url)  # in HomePage.__init__() via load_po()
+
+
+def current_start_with(pwpage):
+    boot_page = PomBootPage(pwpage)
+    page = boot_page.resolve_po(po_id=HOME_PAGE)
+    page.open()
+    boot_page.resolve_po(po_id=HOME_PAGE)  # load_po's re-resolve, no capture
+
+
+def run(rounds, browser_name, standin=False, latency_ms=0):
+    with contextlib.ExitStack() as stack:
+        if standin:
+            server = stack.enter_context(StandinServer(latency_ms=latency_ms))
+            stack.enter_context(serve_app(BasePage, server))
+        compare(rounds, browser_name)
+
+
+def compare(rounds, browser_name):
+    from playwright.sync_api import sync_playwright
+
+    routing.compile_routes()
+    url = routing.resolve_route(PomBootPage.routings_path, 'noauth',
+                                HOME_PAGE)(None).url
+    results = {'legacy': [], 'current': []}
+    navigations = {'legacy': 0, 'current': 0}
+
+    with sync_playwright() as playwright:
+        browser = launch_browser(playwright, browser_name)
+        for _ in range(rounds):
+            for mode in results:
+                context = browser.new_context()
+                pwpage = context.new_page()
+                counter = {'count': 0}
+
+                def count(frame, counter=counter, pwpage=pwpage):
+                    if frame == pwpage.main_frame:
+                        counter['count'] += 1
+                pwpage.on('framenavigated', count)
+
+                start = time.perf_counter()
+                if mode == 'legacy':
+                    legacy_start_with(pwpage, url)
+                else:
+                    current_start_with(pwpage)
+                results[mode].append(time.perf_counter() - start)
+                navigations[mode] += counter['count']
+                context.close()
+        browser.close()
+
+    for mode, timings in results.items():
+        print(f"{mode:>8}: median {statistics.median(timings) * 1000:8.1f} ms, "
+              f"max {max(timings) * 1000:8.1f} ms, "
+              f"{navigations[mode] / rounds:.1f} navigations per start_with")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--browser', default='chromium')
+    parser.add_argument('--standin', action='store_true',
+                        help='use the local sweetshop stand-in')
+    parser.add_argument('--latency-ms', type=int, default=0,
+                        help="the stand-in's latency")
+    args = parser.parse_args()
+    run(args.rounds, args.browser, standin=args.standin,
+        latency_ms=args.latency_ms)
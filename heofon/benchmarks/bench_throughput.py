@@ -0,0 +1,320 @@
+"""
+    End-to-end throughput benchmark: how much time heofon adds on top of
+    Playwright.
+
+    Runs the SweetshopTests flows against the local sweetshop stand-in
+    (`--sweetshop-standin`, so the app's own latency is fixed) in every
+    combination of:
+    + pool: a browser per test (`--browser-pool=off`) or pooled (`session`)
+    + capture: artifact capture and page metrics on
+      (`--capture-policy=always`) or `off`
+    + tracing: `--tracing=off` or `on`
+    + workers: `serial`, or `parallel` pytest-xdist workers (`-n`)
+
+    Each configuration is a pytest run in a fresh interpreter, with the
+    hook_timing plugin, which times the framework's hooks, fixtures and page
+    object transitions in every process. For each configuration the report
+    has:
+    + tests per minute, from the wall time of the pytest run
+    + the per-transition overhead: RootPageObject.load_po(), the capture
+      work done once the browser is on the new page, and the whole
+      _click_and_load_new_page()
+    + the n, p50, p95, max and total of each hook and fixture
+
+    The results are saved as json, with the commit they were measured on;
+    `--compare` checks them against an earlier results file, and exits with
+    1 if tests per minute, or the p95 of the transitions or of any hook,
+    got worse by more than `--threshold` percent.
+
+    The scenarios with broken links fail, as they do against the live site;
+    that is expected, and counted in the outcomes.
+
+    Run from the root of the repo checkout (the heofon output folder is
+    located from the current directory):
+    $ python -m heofon.benchmarks.bench_throughput
+    $ python -m heofon.benchmarks.bench_throughput --vary pool,capture --rounds 3
+    $ python -m heofon.benchmarks.bench_throughput --compare heofon/output/benchmarks/throughput-1a2b3c4.json
+"""
+import argparse
+import itertools
+import json
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from heofon.framework.page_metrics import percentile
+
+SUITE = 'heofon/tests/sweetshop'
+SELECTION = 'SweetshopTests'
+PLUGIN = 'heofon.benchmarks.hook_timing'
+RESULTS_FOLDER = 'benchmarks'
+TRANSITIONS = ['transition load_po', 'transition _click_and_load_new_page']
+# regressions smaller than this are noise, whatever the percentage
+NOISE_MS = 1.0
+
+# dimension -> value -> pytest args; the first value is the baseline
+DIMENSIONS = {
+    'pool': {'off': ['--browser-pool=off'],
+             'session': ['--browser-pool=session']},
+    'capture': {'on': ['--capture-policy=always'],
+                'off': ['--capture-policy=off']},
+    'tracing': {'off': ['--tracing=off'],
+                'on': ['--tracing=on']},
+    'workers': {'serial': [],
+                'parallel': ['-n', '{workers}']},
+}
+
+
+def configurations(vary, workers):
+    """
+        :param vary: list of str, the dimensions to vary; the others stay at
+                     their baseline value
+        :param workers: int, number of pytest-xdist workers for 'parallel'
+        :return: dict, configuration name -> pytest args
+    """
+    choices = [list(values) if dimension in vary else list(values)[:1]
+               for dimension, values in DIMENSIONS.items()]
+    configs = {}
+    for combination in itertools.product(*choices):
+        name = ','.join(f"{dimension}={value}" for dimension, value
+                        in zip(DIMENSIONS, combination))
+        args = []
+        for dimension, value in zip(DIMENSIONS, combination):
+            args += [arg.format(workers=workers)
+                     for arg in DIMENSIONS[dimension][value]]
+        configs[name] = args
+    return configs
+
+
+def run_pytest(root, args, latency_ms, timing_folder):
+    """
+        Run the sweetshop suite once, in a fresh interpreter.
+
+        :param root: Path, root of the repo checkout
+        :param args: list of str, the configuration's pytest args
+        :param latency_ms: int, the stand-in's latency
+        :param timing_folder: Path, for the hook_timing plugin's files
+        :return: float, wall time of the run, in s
+    """
+    command = [sys.executable, '-m', 'pytest', SUITE, '-k', SELECTION,
+               '-p', PLUGIN, '--hook-timing', str(timing_folder),
+               '--sweetshop-standin', f"--standin-latency-ms={latency_ms}",
+               '-p', 'no:cacheprovider', '-q'] + args
+    start = time.perf_counter()
+    result = subprocess.run(command, cwd=root, capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    # 1 is "some tests failed", which the broken-link scenarios do
+    if result.returncode not in (0, 1):
+        print(result.stdout[-2000:], result.stderr[-2000:])
+        raise SystemExit(f"pytest failed with exit code {result.returncode}: "
+                         f"{' '.join(command)}")
+    return wall
+
+
+def read_timings(timing_folder):
+    """
+        Merge the timing files of every process of a run.
+
+        :param timing_folder: Path, the hook_timing plugin's folder
+        :return: dict, with the 'tests' count, the 'outcomes', and the
+                 'samples' (name -> list of ms)
+    """
+    merged = {'tests': 0, 'outcomes': {}, 'samples': {}}
+    for path in sorted(timing_folder.glob('*.json')):
+        with open(path) as f:
+            timings = json.load(f)
+        merged['tests'] += timings['tests']
+        for outcome, count in timings['outcomes'].items():
+            merged['outcomes'][outcome] = \
+                merged['outcomes'].get(outcome, 0) + count
+        for name, samples in timings['samples'].items():
+            merged['samples'].setdefault(name, []).extend(samples)
+    return merged
+
+
+def summarize(samples):
+    """
+        :param samples: list of ms
+        :return: dict, with the n, p50, p95, max and total
+    """
+    ordered = sorted(samples)
+    return {'n': len(ordered),
+            'p50': percentile(ordered, 0.5),
+            'p95': percentile(ordered, 0.95),
+            'max': ordered[-1],
+            'total': round(sum(ordered), 3)}
+
+
+def run_configuration(root, args, rounds, latency_ms, keep_output):
+    """
+        Run one configuration `rounds` times.
+
+        :return: dict, the configuration's results
+    """
+    output = root / 'heofon' / 'output'
+    before = set(output.iterdir()) if output.exists() else set()
+    walls, tests, outcomes, samples = [], 0, {}, {}
+    for _ in range(rounds):
+        timing_folder = Path(tempfile.mkdtemp())
+        try:
+            walls.append(run_pytest(root, args, latency_ms, timing_folder))
+            timings = read_timings(timing_folder)
+        finally:
+            shutil.rmtree(timing_folder, ignore_errors=True)
+        tests += timings['tests']
+        for outcome, count in timings['outcomes'].items():
+            outcomes[outcome] = outcomes.get(outcome, 0) + count
+        for name, values in timings['samples'].items():
+            samples.setdefault(name, []).extend(values)
+
+    if not keep_output and output.exists():
+        for path in set(output.iterdir()) - before:
+            # only remove the testrun folders this benchmark created
+            if path.name != RESULTS_FOLDER:
+                shutil.rmtree(path, ignore_errors=True)
+
+    wall = sum(walls)
+    return {'args': args,
+            'rounds': rounds,
+            'wall_s': round(wall, 3),
+            'median_wall_s': round(statistics.median(walls), 3),
+            'tests': tests,
+            'outcomes': outcomes,
+            'tests_per_minute': round(tests / wall * 60, 2) if wall else 0,
+            'transitions': {name: summarize(samples.pop(name))
+                            for name in TRANSITIONS if name in samples},
+            'hooks': {name: summarize(values)
+                      for name, values in sorted(samples.items())}}
+
+
+def git_revision(root):
+    """
+        :param root: Path, root of the repo checkout
+        :return: dict, the commit and whether the checkout has changes
+    """
+    def git(*args):
+        result = subprocess.run(['git', *args], cwd=root, capture_output=True,
+                                text=True)
+        return result.stdout.strip()
+    return {'commit': git('rev-parse', '--short', 'HEAD') or 'unknown',
+            'dirty': bool(git('status', '--porcelain', '--untracked-files=no'))}
+
+
+def compare(results, baseline, threshold):
+    """
+        Compare results with an earlier results file.
+
+        :param results: dict, this run's results
+        :param baseline: dict, an earlier run's results
+        :param threshold: float, percent slowdown that counts as a regression
+        :return: list of str, the regressions
+    """
+    regressions = []
+    limit = 1 + threshold / 100
+    for name, config in results['configurations'].items():
+        before = baseline['configurations'].get(name)
+        if before is None:
+            continue
+        if config['tests_per_minute'] * limit < before['tests_per_minute']:
+            regressions.append(
+                f"{name}: {config['tests_per_minute']} tests/min, was "
+                f"{before['tests_per_minute']}")
+        for section in ['transitions', 'hooks']:
+            for timing, summary in config[section].items():
+                was = before[section].get(timing)
+                if was is None:
+                    continue
+                if summary['p95'] > was['p95'] * limit and \
+                        summary['p95'] - was['p95'] > NOISE_MS:
+                    regressions.append(
+                        f"{name}: {timing} p95 {summary['p95']:.1f}ms, was "
+                        f"{was['p95']:.1f}ms")
+    return regressions
+
+
+def print_report(results, slowest=5):
+    print(f"heofon throughput at {results['revision']['commit']}"
+          f"{' (with changes)' if results['revision']['dirty'] else ''}, "
+          f"stand-in latency {results['latency_ms']}ms")
+    for name, config in results['configurations'].items():
+        outcomes = ', '.join(f"{count} {outcome}" for outcome, count
+                             in sorted(config['outcomes'].items()))
+        print(f"\n{name}\n"
+              f"    {config['tests_per_minute']:8.1f} tests/min  "
+              f"({config['tests']} tests in {config['wall_s']:.1f}s: "
+              f"{outcomes})")
+        for timing, summary in config['transitions'].items():
+            print(f"    {timing:<44} p50 {summary['p50']:8.1f}ms  "
+                  f"p95 {summary['p95']:8.1f}ms  n {summary['n']}")
+        hooks = sorted(config['hooks'].items(),
+                       key=lambda item: item[1]['p95'], reverse=True)
+        for timing, summary in hooks[:slowest]:
+            print(f"    {timing:<44} p50 {summary['p50']:8.1f}ms  "
+                  f"p95 {summary['p95']:8.1f}ms  n {summary['n']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--vary', default=','.join(DIMENSIONS),
+                        help='comma-separated dimensions to vary, from '
+                             f"{', '.join(DIMENSIONS)}")
+    parser.add_argument('--workers', type=int, default=2,
+                        help="pytest-xdist workers for 'workers=parallel'")
+    parser.add_argument('--rounds', type=int, default=1)
+    parser.add_argument('--latency-ms', type=int, default=0,
+                        help="the stand-in's latency")
+    parser.add_argument('--output', help='results file; defaults to '
+                        'heofon/output/benchmarks/throughput-<commit>.json')
+    parser.add_argument('--compare', metavar='RESULTS',
+                        help='an earlier results file to check against')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='percent slowdown that counts as a regression')
+    parser.add_argument('--keep-output', action='store_true',
+                        help='keep the testrun folders of the runs')
+    args = parser.parse_args()
+
+    vary = [dimension.strip() for dimension in args.vary.split(',')
+            if dimension.strip()]
+    unknown = set(vary) - set(DIMENSIONS)
+    if unknown:
+        parser.error(f"unknown dimensions: {', '.join(sorted(unknown))}")
+
+    root = Path.cwd()
+    results = {'revision': git_revision(root),
+               'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'python': sys.version.split()[0],
+               'latency_ms': args.latency_ms,
+               'configurations': {}}
+    for name, pytest_args in configurations(vary, args.workers).items():
+        print(f"running {name} ...", flush=True)
+        results['configurations'][name] = run_configuration(
+            root, pytest_args, args.rounds, args.latency_ms, args.keep_output)
+
+    output = Path(args.output) if args.output else \
+        root / 'heofon' / 'output' / RESULTS_FOLDER / \
+        f"throughput-{results['revision']['commit']}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=4)
+    print_report(results)
+    print(f"\nresults saved to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        print(f"\ncompared with {baseline['revision']['commit']}: "
+              f"{len(regressions) or 'no'} regressions over "
+              f"{args.threshold:g}%")
+        for regression in regressions:
+            print(f"    {regression}")
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+"""
+    Benchmark for the visual regression engine (see heofon.framework.visual).
+
+    Writes synthetic full-page screenshot pairs (a baseline, and a copy with
+    a few changed regions and some antialiasing-like noise) to a temporary
+    folder, queues `--pairs` comparison jobs over them, and times
+    run_comparisons():
+    + serially, in this process (`--visual-workers=1`)
+    + in the process pool, as at the end of a session
+
+    To show what the vectorized diff buys, compare_arrays() is also timed
+    against a per-pixel Python loop on a small crop of one pair, and the
+    loop's time is scaled up to a full page.
+
+    Only `--unique` distinct pairs are written to disk (encoding thousands of
+    full-page pngs would take longer than the comparisons); the jobs cycle
+    through them, and every job decodes its images, like a real run.
+
+    Needs numpy and Pillow:
+    $ python -m heofon.benchmarks.bench_visual --pairs 1000
+    $ python -m heofon.benchmarks.bench_visual --pairs 200 --workers 4
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from heofon.framework import visual
+
+CROP = 64
+
+
+def page_image(rng, width, height):
+    """
+        Make an image that looks a little like a web page: flat panels, with
+        rows of "text" in some of them.
+
+        :param rng: numpy random Generator
+        :param width: int, in pixels
+        :param height: int, in pixels
+        :return: numpy array, height x width x 3, uint8
+    """
+    np = visual.np
+    image = np.full((height, width, 3), 255, dtype=np.uint8)
+    y = 0
+    while y < height:
+        panel = int(rng.integers(80, 400))
+        image[y:y + panel] = rng.integers(180, 256, 3, dtype=np.uint8)
+        if rng.random() < 0.7:
+            for line in range(y + 10, min(y + panel, height) - 10, 18):
+                length = int(rng.integers(width // 4, width - 40))
+                text = rng.random((10, length)) < 0.35
+                image[line:line + 10, 20:20 + length][text] = 40
+        y += panel
+    return image
+
+
+def changed_copy(rng, image):
+    """
+        :param rng: numpy random Generator
+        :param image: numpy array, height x width x 3
+        :return: numpy array, `image` with changed regions and some noise
+    """
+    np = visual.np
+    changed = image.copy()
+    height, width = image.shape[:2]
+    for _ in range(int(rng.integers(0, 4))):
+        x, y = int(rng.integers(0, width - 100)), int(rng.integers(0, height - 60))
+        changed[y:y + 60, x:x + 100] = rng.integers(0, 256, 3, dtype=np.uint8)
+    # antialiasing-like noise, within the pixel tolerance
+    noise = rng.random(image.shape[:2]) < 0.01
+    changed[noise] = np.clip(changed[noise].astype(np.int16) + 3, 0, 255)
+    return changed
+
+
+def write_pairs(folder, unique, width, height, seed=0):
+    """
+        :return: list of (baseline path, actual path) tuples
+    """
+    rng = visual.np.random.default_rng(seed)
+    pairs = []
+    for i in range(unique):
+        image = page_image(rng, width, height)
+        baseline = folder / f"{i:03d}_baseline.png"
+        actual = folder / f"{i:03d}_actual.png"
+        visual.Image.fromarray(image).save(baseline)
+        visual.Image.fromarray(changed_copy(rng, image)).save(actual)
+        pairs.append((baseline, actual))
+    return pairs
+
+
+def make_jobs(folder, pairs, n_jobs):
+    return [visual.ComparisonJob(f"bench::test_{i}", f"page {i}",
+                                 baseline=pairs[i % len(pairs)][0],
+                                 actual=pairs[i % len(pairs)][1],
+                                 diff=folder / f"{i:04d}_diff.png")
+            for i in range(n_jobs)]
+
+
+def time_comparisons(jobs, workers):
+    start = time.perf_counter()
+    results = visual.run_comparisons(jobs, workers=workers)
+    elapsed = time.perf_counter() - start
+    return elapsed, visual.summarize(results)
+
+
+def naive_compare(baseline, actual, pixel_tolerance):
+    """
+        Per-pixel Python loop, for reference only.
+
+        :return: int, number of differing pixels
+    """
+    height, width = len(baseline), len(baseline[0])
+    diff = 0
+    for y in range(height):
+        for x in range(width):
+            b, a = baseline[y][x], actual[y][x]
+            if max(abs(int(b[c]) - int(a[c])) for c in range(3)) > pixel_tolerance:
+                diff += 1
+    return diff
+
+
+def time_vectorized(pair, rounds=5):
+    """
+        Time compare_arrays() against the per-pixel loop for one pair.
+
+        :return: tuple, (vectorized s per page, estimated loop s per page)
+    """
+    baseline = visual.load_image(str(pair[0]))
+    actual = visual.load_image(str(pair[1]))
+    start = time.perf_counter()
+    for _ in range(rounds):
+        visual.compare_arrays(baseline, actual)
+    vectorized = (time.perf_counter() - start) / rounds
+
+    crop_b = baseline[:CROP, :CROP].tolist()
+    crop_a = actual[:CROP, :CROP].tolist()
+    start = time.perf_counter()
+    naive_compare(crop_b, crop_a, visual.DEFAULT_PIXEL_TOLERANCE)
+    per_pixel = (time.perf_counter() - start) / (CROP * CROP)
+    return vectorized, per_pixel * baseline.shape[0] * baseline.shape[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--pairs', type=int, default=1000)
+    parser.add_argument('--unique', type=int, default=20)
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=3000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    visual.require_engine()
+
+    folder = Path(tempfile.mkdtemp(prefix='heofon-bench-visual-'))
+    try:
+        pairs = write_pairs(folder, min(args.unique, args.pairs),
+                            args.width, args.height)
+        vectorized, naive = time_vectorized(pairs[0])
+        print(f"{args.pairs} pairs of {args.width}x{args.height} pages "
+              f"({len(pairs)} unique)")
+        print(f"compare_arrays: {vectorized * 1000:.1f}ms per page; "
+              f"per-pixel loop (estimated): {naive:.1f}s per page")
+
+        for workers in [1, args.workers]:
+            jobs = make_jobs(folder, pairs, args.pairs)
+            elapsed, summary = time_comparisons(jobs, workers)
+            print(f"{workers:>3} workers: {elapsed:.2f}s  "
+                  f"({args.pairs / elapsed:.1f} pairs/s)  {summary}")
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
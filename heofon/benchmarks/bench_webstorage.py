@@ -0,0 +1,147 @@
+"""
+    Micro-benchmark for utils_webstorage.convert_web_storage_data_to_dict().
+
+    Generates a ~5 MB localStorage payload shaped like a SPA's: a large
+    Redux-style state blob, an Apollo-style normalized cache, a few hundred
+    small json values, and plain (non-json) strings such as tokens, dates
+    and flags. Then compares:
+    + 'legacy': the converter as it was (deepcopy, then json.loads at two
+      levels, catching the exceptions for non-json strings)
+    + 'current (json)': the current converter with the stdlib json backend
+    + 'current (<backend>)': the current converter with the installed
+      backend, if that's not the stdlib
+
+    Usage:
+    $ python -m heofon.benchmarks.bench_webstorage --size-mb 5 --rounds 7
+"""
+import argparse
+import json
+import random
+import string
+import time
+from copy import deepcopy
+
+from heofon.framework import utils_webstorage
+
+
+def legacy_convert(content):
+    """ convert_web_storage_data_to_dict() before the rewrite. """
+    new_content = {}
+    old_content = deepcopy(content)
+
+    def _to_json(data):
+        try:
+            return json.loads(data)
+        except TypeError:
+            return data
+        except json.decoder.JSONDecodeError:
+            return data
+
+    for k1, v1 in old_content.items():
+        first_data = _to_json(v1)
+        new_content[k1] = first_data
+        if isinstance(first_data, dict):
+            for k2, v2 in first_data.items():
+                new_content[k1][k2] = _to_json(v2)
+    return new_content
+
+
+def generate_storage(size_mb, seed=1234):
+    """
+        :param size_mb: float, approximate payload size in megabytes
+        :return: dict of str keys to str values, like window.localStorage
+    """
+    rng = random.Random(seed)
+
+    def word(n=8):
+        return ''.join(rng.choices(string.ascii_lowercase, k=n))
+
+    def entity(i):
+        return {'__typename': 'Product', 'id': i, 'name': word(12),
+                'price': round(rng.random() * 100, 2),
+                'tags': [word(5) for _ in range(4)],
+                'stock': {'count': rng.randint(0, 500), 'warehouse': word(6)}}
+
+    target = int(size_mb * 1024 * 1024)
+    storage = {}
+    # a handful of small values: flags, tokens, dates, numbers, small json
+    for i in range(300):
+        kind = i % 5
+        if kind == 0:
+            storage[f"flag:{i}"] = rng.choice(['true', 'false'])
+        elif kind == 1:
+            storage[f"token:{i}"] = word(40)
+        elif kind == 2:
+            storage[f"seen:{i}"] = f"2024-{rng.randint(1, 12):02d}-01T00:00:00Z"
+        elif kind == 3:
+            storage[f"count:{i}"] = str(rng.randint(0, 10000))
+        else:
+            storage[f"pref:{i}"] = json.dumps({'theme': word(5), 'size': i})
+
+    # the big blobs: each slice of redux state is itself a json string,
+    # which is the double-encoding the converter unwraps at level 2
+    size = sum(len(k) + len(v) for k, v in storage.items())
+    chunk = 0
+    while size < target:
+        entities = {f"Product:{chunk}:{i}": entity(i) for i in range(200)}
+        if chunk % 2:
+            value = json.dumps({'ROOT_QUERY': {'products': list(entities)},
+                                **entities})
+            key = f"apollo-cache-persist:{chunk}"
+        else:
+            value = json.dumps({'products': json.dumps(entities),
+                                'ui': json.dumps({'open': True, 'page': chunk}),
+                                'version': 3})
+            key = f"persist:root:{chunk}"
+        storage[key] = value
+        size += len(key) + len(value)
+        chunk += 1
+    return storage
+
+
+def measure(func, storage, rounds):
+    """ Best-of-`rounds` time for one conversion, in seconds. """
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func(storage)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run(size_mb, rounds):
+    storage = generate_storage(size_mb)
+    megabytes = sum(len(k) + len(v) for k, v in storage.items()) / 1024 / 1024
+    print(f"storage: {len(storage)} keys, {megabytes:.1f} MB")
+
+    legacy = legacy_convert(storage)
+
+    backend = utils_webstorage._json_loads
+    utils_webstorage._json_loads = json.loads
+    try:
+        assert utils_webstorage.convert_web_storage_data_to_dict(
+            storage, 'local') == legacy
+        timings = {'legacy': measure(legacy_convert, storage, rounds),
+                   'current (json)': measure(
+                       lambda s: utils_webstorage.convert_web_storage_data_to_dict(
+                           s, 'local'), storage, rounds)}
+    finally:
+        utils_webstorage._json_loads = backend
+
+    if utils_webstorage.JSON_BACKEND != 'json':
+        name = f"current ({utils_webstorage.JSON_BACKEND})"
+        timings[name] = measure(
+            lambda s: utils_webstorage.convert_web_storage_data_to_dict(
+                s, 'local'), storage, rounds)
+
+    for name, timing in timings.items():
+        print(f"{name:>16}: {timing * 1000:8.1f} ms "
+              f"({timings['legacy'] / timing:4.1f}x)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--size-mb', type=float, default=5)
+    parser.add_argument('--rounds', type=int, default=7)
+    args = parser.parse_args()
+    run(args.size_mb, args.rounds)
@@ -0,0 +1,268 @@
+"""
+    pytest plugin that times the framework's own work, for bench_throughput.
+
+    Loaded with `-p heofon.benchmarks.hook_timing --hook-timing <folder>`, it
+    records, in every process of the run (the controller and each
+    pytest-xdist worker):
+    + every call of every hook implemented by a heofon module (the
+      conftest), by hook name; for a hook wrapper, only the time spent in
+      the wrapper itself, not in the hooks it wraps
+    + the setup and teardown of every heofon fixture, e.g. 'pwpage setup'
+    + each page object transition: RootPageObject.load_po() (the capture
+      work once the browser is on the new page) and
+      _click_and_load_new_page() (the click, the navigation and load_po())
+    + each test's run (setup, call and teardown), and the test outcomes
+
+    At the end of the run, each process writes its raw timings, in ms, to
+    `<folder>/<process>.json`; bench_throughput merges them.
+
+    The hook implementations are wrapped as the heofon plugins register, by
+    replacing the function of their pluggy HookImpl; nothing changes for a
+    run without this plugin.
+"""
+import functools
+import json
+import os
+import time
+from pathlib import Path
+
+import pytest
+
+HEOFON_FOLDER = str(Path(__file__).resolve().parents[1])
+BENCHMARKS_FOLDER = str(Path(__file__).resolve().parent)
+# the page object methods timed as transitions
+TRANSITION_METHODS = ['load_po', '_click_and_load_new_page']
+
+
+class HookTimer(object):
+    """
+        Timing samples for one process of the run.
+
+        :param folder: Path, where the samples are written at the end
+        :param process: str, 'controller' or the pytest-xdist worker id
+    """
+
+    def __init__(self, folder, process):
+        self.folder = folder
+        self.process = process
+        # timing name -> list of ms
+        self.samples = {}
+        self.outcomes = {}
+        self.tests = 0
+        self.session_start = None
+        self.session_s = None
+        self._patched = []
+
+    def add(self, name, seconds):
+        self.samples.setdefault(name, []).append(round(seconds * 1000, 3))
+
+    def wrap_plugin(self, plugin, manager):
+        """
+            Time the hook implementations of a heofon plugin.
+
+            :param plugin: a registered plugin, e.g. the conftest module
+            :param manager: pytest plugin manager
+            :return: None
+        """
+        for hookcaller in manager.get_hookcallers(plugin) or []:
+            for impl in hookcaller.get_hookimpls():
+                if impl.plugin is plugin:
+                    impl.function = self.timed(hookcaller.name, impl)
+
+    def timed(self, name, impl):
+        """
+            :param name: str, hook name
+            :param impl: pluggy HookImpl
+            :return: function that calls the implementation and records its
+                     time
+        """
+        function = impl.function
+        if impl.wrapper or impl.hookwrapper:
+            @functools.wraps(function)
+            def timed_wrapper(*args):
+                # time the wrapper's code on either side of its yield
+                generator = function(*args)
+                elapsed = 0.0
+                send, value = generator.send, None
+                try:
+                    while True:
+                        start = time.perf_counter()
+                        try:
+                            yielded = send(value)
+                        finally:
+                            elapsed += time.perf_counter() - start
+                        try:
+                            value = yield yielded
+                            send = generator.send
+                        except BaseException as e:
+                            value = e
+                            send = generator.throw
+                except StopIteration as stop:
+                    return stop.value
+                finally:
+                    self.add(name, elapsed)
+            return timed_wrapper
+
+        @functools.wraps(function)
+        def timed_function(*args):
+            start = time.perf_counter()
+            try:
+                return function(*args)
+            finally:
+                self.add(name, time.perf_counter() - start)
+        return timed_function
+
+    def patch_transitions(self):
+        """
+            Time the page object transition methods.
+
+            :return: None
+        """
+        from heofon.apps.root_po import RootPageObject
+
+        for method_name in TRANSITION_METHODS:
+            method = getattr(RootPageObject, method_name)
+            setattr(RootPageObject, method_name,
+                    self.timed_method(method, f"transition {method_name}"))
+            self._patched.append((RootPageObject, method_name, method))
+
+    def timed_method(self, method, name):
+        @functools.wraps(method)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.add(name, time.perf_counter() - start)
+        return timed
+
+    def unpatch_transitions(self):
+        while self._patched:
+            cls, method_name, method = self._patched.pop()
+            setattr(cls, method_name, method)
+
+    def write(self):
+        """
+            Write this process's samples.
+
+            :return: Path, the file written
+        """
+        self.folder.mkdir(parents=True, exist_ok=True)
+        path = self.folder / f"{self.process}.json"
+        with open(path, 'w') as f:
+            json.dump({'process': self.process,
+                       'pid': os.getpid(),
+                       'session_s': self.session_s,
+                       'tests': self.tests,
+                       'outcomes': self.outcomes,
+                       'samples': self.samples}, f)
+        return path
+
+
+_timer = None
+
+
+def is_heofon_file(filename):
+    """
+        :param filename: str, path to a source file
+        :return: bool, True for heofon's own code, except the benchmarks
+    """
+    return filename.startswith(HEOFON_FOLDER) and \
+        not filename.startswith(BENCHMARKS_FOLDER)
+
+
+def pytest_addoption(parser):
+    parser.addoption('--hook-timing',
+                     action='store',
+                     dest='hook_timing',
+                     default=None,
+                     help='Folder to write the framework hook timings to.')
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_configure(config):
+    global _timer
+    folder = config.getoption('hook_timing')
+    if not folder:
+        return
+    process = getattr(config, 'workerinput', {}).get('workerid', 'controller')
+    _timer = HookTimer(Path(folder), process)
+    _timer.patch_transitions()
+    # the plugins registered before this one
+    for plugin in config.pluginmanager.get_plugins():
+        pytest_plugin_registered(plugin, config.pluginmanager)
+
+
+def pytest_plugin_registered(plugin, manager):
+    if _timer is None:
+        return
+    filename = getattr(plugin, '__file__', None)
+    if filename and is_heofon_file(str(Path(filename).resolve())) and \
+            not getattr(plugin, '_heofon_timed', False):
+        plugin._heofon_timed = True
+        _timer.wrap_plugin(plugin, manager)
+
+
+def pytest_sessionstart(session):
+    if _timer is not None:
+        _timer.session_start = time.perf_counter()
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_fixture_setup(fixturedef, request):
+    code = getattr(fixturedef.func, '__code__', None)
+    if _timer is None or code is None or not is_heofon_file(code.co_filename):
+        yield
+        return
+    name = fixturedef.argname
+    teardown = {}
+
+    def teardown_end():
+        if 'start' in teardown:
+            _timer.add(f"fixture {name} teardown",
+                       time.perf_counter() - teardown['start'])
+
+    # finalizers run last in, first out: teardown_end() runs after the
+    # fixture's own teardown, teardown_start() before it
+    fixturedef.addfinalizer(teardown_end)
+    start = time.perf_counter()
+    yield
+    _timer.add(f"fixture {name} setup", time.perf_counter() - start)
+    fixturedef.addfinalizer(
+        lambda: teardown.setdefault('start', time.perf_counter()))
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_protocol(item, nextitem):
+    start = time.perf_counter()
+    yield
+    if _timer is not None:
+        _timer.add('test', time.perf_counter() - start)
+        _timer.tests += 1
+
+
+def pytest_runtest_logreport(report):
+    # with pytest-xdist, the controller sees the workers' reports too; count
+    # them where the tests run
+    if _timer is None or _timer.process == 'controller' and \
+            getattr(report, 'node', None) is not None:
+        return
+    if report.when == 'call' or report.outcome != 'passed':
+        _timer.outcomes[report.outcome] = \
+            _timer.outcomes.get(report.outcome, 0) + 1
+
+
+@pytest.hookimpl(trylast=True)
+def pytest_sessionfinish(session):
+    if _timer is not None and _timer.session_start is not None:
+        _timer.session_s = time.perf_counter() - _timer.session_start
+
+
+@pytest.hookimpl(trylast=True)
+def pytest_unconfigure(config):
+    global _timer
+    if _timer is None:
+        return
+    _timer.unpatch_transitions()
+    _timer.write()
+    _timer = None
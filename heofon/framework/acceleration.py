@@ -0,0 +1,232 @@
+"""
+    Page acceleration profiles: skip what a flow doesn't need.
+
+    Many flows only need the DOM and navigation, but every page load also
+    pulls in images, web fonts, analytics beacons and animations. A page
+    object (or a wrapper base class, e.g. NoAuthBasePageObject) declares an
+    AccelerationProfile, by name or as an instance, in its
+    `acceleration_profile` class attribute:
+    + `block_resource_types`: Playwright resource types to abort, e.g.
+      'image', 'font', 'media'; navigation requests are never blocked
+    + `block_url_patterns`: regexes for urls to abort, e.g. analytics
+    + `reduced_motion`: emulate `prefers-reduced-motion: reduce`
+    + `no_animations`: inject a stylesheet that turns off CSS animations and
+      transitions
+
+    Each test's browser context gets an Accelerator. Before a page object
+    navigates (RootPageObject.open(), _click_and_load_new_page()), the
+    target page object's profile becomes the active one, so the blocking
+    follows the page the test is driving. The no-animation stylesheet is an
+    init script: once a profile has asked for it, it stays for the rest of
+    the context.
+
+    Acceleration is opt-in: with the default `--acceleration=off`, nothing
+    is blocked, whatever the page objects declare. `--acceleration=declared`
+    applies the declared profiles, and a profile name applies that profile
+    to every page. An accelerated page looks different (no images, fonts or
+    animations) and makes fewer requests, so visual baselines and network
+    recordings must be taken with the same setting as the runs that use
+    them.
+
+    Blocking by resource type needs a route for every request (the type
+    isn't part of the url), so the route is only installed once a profile
+    that blocks anything is activated.
+"""
+import json
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# the requests that make up the page itself
+NEVER_BLOCKED = {'document'}
+
+ANALYTICS_URL_PATTERNS = [
+    r'google-analytics\.com', r'googletagmanager\.com', r'doubleclick\.net',
+    r'googlesyndication\.com', r'(?:^|[/.])segment\.(?:io|com)/',
+    r'hotjar\.com', r'connect\.facebook\.net', r'clarity\.ms',
+    r'(?:^|[/.])mixpanel\.com', r'newrelic\.com', r'nr-data\.net',
+]
+
+NO_ANIMATIONS_CSS = """
+*, *::before, *::after {
+    animation-duration: 0s !important;
+    animation-delay: 0s !important;
+    transition-duration: 0s !important;
+    transition-delay: 0s !important;
+    scroll-behavior: auto !important;
+}
+"""
+
+# inject the stylesheet as early as possible in every document
+NO_ANIMATIONS_SCRIPT = """
+(() => {
+    const css = %s;
+    const inject = () => {
+        const style = document.createElement('style');
+        style.setAttribute('data-heofon', 'no-animations');
+        style.textContent = css;
+        (document.head || document.documentElement).appendChild(style);
+    };
+    if (document.documentElement) {
+        inject();
+    } else {
+        document.addEventListener('DOMContentLoaded', inject, {once: true});
+    }
+})();
+""" % json.dumps(NO_ANIMATIONS_CSS)
+
+# --acceleration values, besides the profile names; the first is the default
+ACCELERATION_MODES = ['off', 'declared']
+
+
+class AccelerationProfile(object):
+    """
+        What to skip when loading a page.
+
+        :param name: str, name for the logs and the reports
+        :param block_resource_types: list of str, Playwright resource types
+        :param block_url_patterns: list of str, regexes for urls to block
+        :param reduced_motion: bool, emulate prefers-reduced-motion: reduce
+        :param no_animations: bool, turn off CSS animations and transitions
+    """
+
+    def __init__(self, name, block_resource_types=(), block_url_patterns=(),
+                 reduced_motion=False, no_animations=False):
+        self.name = name
+        self.block_resource_types = frozenset(block_resource_types) - \
+            NEVER_BLOCKED
+        self.block_url_patterns = list(block_url_patterns)
+        self._url_regex = re.compile('|'.join(self.block_url_patterns)) \
+            if self.block_url_patterns else None
+        self.reduced_motion = reduced_motion
+        self.no_animations = no_animations
+
+    @property
+    def blocks_requests(self):
+        return bool(self.block_resource_types or self._url_regex)
+
+    def blocks(self, resource_type, url):
+        """
+            :param resource_type: str, Playwright resource type
+            :param url: str
+            :return: bool, True if the request should be aborted
+        """
+        if resource_type in NEVER_BLOCKED:
+            return False
+        if resource_type in self.block_resource_types:
+            return True
+        return bool(self._url_regex and self._url_regex.search(url))
+
+    def __repr__(self):
+        return f"<AccelerationProfile {self.name}>"
+
+
+PROFILES = {
+    'none': AccelerationProfile('none'),
+    'no-analytics': AccelerationProfile(
+        'no-analytics',
+        block_resource_types=['ping'],
+        block_url_patterns=ANALYTICS_URL_PATTERNS),
+    'dom-only': AccelerationProfile(
+        'dom-only',
+        block_resource_types=['image', 'font', 'media', 'ping'],
+        block_url_patterns=ANALYTICS_URL_PATTERNS,
+        reduced_motion=True,
+        no_animations=True),
+}
+
+
+def resolve_profile(profile):
+    """
+        :param profile: AccelerationProfile, str name of one of PROFILES,
+                        or None
+        :return: AccelerationProfile, or None
+    """
+    if profile is None or isinstance(profile, AccelerationProfile):
+        return profile
+    try:
+        return PROFILES[profile]
+    except KeyError:
+        msg = f"Unknown acceleration profile '{profile}'; " \
+              f"expected one of {sorted(PROFILES)}."
+        logger.error(msg)
+        raise ValueError(msg)
+
+
+class Accelerator(object):
+    """
+        Apply acceleration profiles to one test's browser context.
+
+        :param context: Playwright BrowserContext instance
+        :param pwpage: playwright page instance
+        :param forced: AccelerationProfile to use for every page instead of
+                       the declared ones (from the CLI); None to use the
+                       declared ones
+    """
+
+    def __init__(self, context, pwpage, forced=None):
+        self.context = context
+        self.pwpage = pwpage
+        self.forced = forced
+        self.profile = None
+        self._routed = False
+        self._no_animations = False
+        self._reduced_motion = False
+        # blocked since the last drain(), by resource type
+        self._blocked = {}
+        self.stats = {'blocked': 0, 'activations': 0}
+        if forced is not None:
+            self.activate(forced)
+
+    def activate(self, profile):
+        """
+            Make `profile` the active profile (unless one is forced).
+
+            :param profile: AccelerationProfile, profile name, or None
+            :return: AccelerationProfile, the active profile
+        """
+        profile = self.forced or resolve_profile(profile)
+        if profile is self.profile:
+            return profile
+        self.profile = profile
+        self.stats['activations'] += 1
+        logger.info(f"\nAcceleration profile: {profile}.")
+        if profile is None:
+            profile = PROFILES['none']
+
+        if profile.blocks_requests and not self._routed:
+            self.context.route('**/*', self._on_route)
+            self._routed = True
+        if profile.no_animations and not self._no_animations:
+            self.context.add_init_script(NO_ANIMATIONS_SCRIPT)
+            self._no_animations = True
+        if profile.reduced_motion != self._reduced_motion:
+            self.pwpage.emulate_media(
+                reduced_motion='reduce' if profile.reduced_motion
+                else 'no-preference')
+            self._reduced_motion = profile.reduced_motion
+        return self.profile
+
+    def drain(self):
+        """
+            Take the count of requests blocked since the last drain.
+
+            :return: dict, with the active 'profile' name, the number of
+                     requests 'blocked', and the count 'by_type'
+        """
+        blocked, self._blocked = self._blocked, {}
+        return {'profile': self.profile.name if self.profile else None,
+                'blocked': sum(blocked.values()),
+                'by_type': blocked}
+
+    def _on_route(self, route, request):
+        profile = self.profile
+        if profile is not None and \
+                profile.blocks(request.resource_type, request.url):
+            self._blocked[request.resource_type] = \
+                self._blocked.get(request.resource_type, 0) + 1
+            self.stats['blocked'] += 1
+            route.abort('blockedbyclient')
+            return
+        route.fallback()
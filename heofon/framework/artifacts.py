@@ -0,0 +1,322 @@
+"""
+    Background artifact writer.
+
+    Cookies, webstorage, console logs and screenshots are captured on the
+    test thread, but serializing and writing them doesn't need to block the
+    test. The file writers in utils_file hand each artifact to a writer that
+    does the serialization and the file I/O on a worker thread.
+
+    + the queue is bounded: if the worker falls behind, submit() blocks the
+      test thread until there is room (backpressure), so memory stays flat
+    + flush() waits for everything queued so far; the conftest calls it at
+      test teardown and at the end of the session
+    + write errors are kept per test case, so the conftest can surface them
+      in that test's report instead of losing them on a background thread
+    + the folder for an artifact is created when the first artifact is
+      written to it, so tests don't leave behind empty output folders
+
+    With the 'on-failure' capture policy, a test's artifacts go to a
+    FlightRecorder instead: an in-memory ring of the test's last snapshots,
+    handed to the writer only if the test fails.
+"""
+import atexit
+import collections
+import logging
+import os
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_PENDING = 64
+
+# max number of folders remembered as created, before the memo is reset
+_MAX_KNOWN_FOLDERS = 4096
+
+# how to capture page object artifacts (see FlightRecorder)
+CAPTURE_POLICIES = ['always', 'on-failure', 'off']
+DEFAULT_RING_SIZE = 20
+DEFAULT_RING_MB = 50
+
+# marker that tells the worker thread to exit
+_STOP = object()
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+class ArtifactWriter(object):
+    """
+        Serialize and write artifacts on a worker thread.
+
+        Example usage:
+        >>> writer = ArtifactWriter(max_pending=64)
+        >>> writer.submit(path, cookies, serializer=utils.plog, owner='1_foo')
+        >>> writer.flush()
+        >>> writer.pop_errors('1_foo')
+        []
+        >>> writer.close()
+
+        :param max_pending: int, max number of queued artifacts before
+                            submit() blocks
+    """
+
+    def __init__(self, max_pending=DEFAULT_MAX_PENDING):
+        self.max_pending = max_pending
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._errors = {}
+        self._errors_lock = threading.Lock()
+        # folders already created; only used by the worker thread
+        self._known_folders = set()
+        self._thread = threading.Thread(target=self._run,
+                                        name='heofon-artifact-writer',
+                                        daemon=True)
+        self._thread.start()
+        self.stats = {'written': 0, 'failed': 0, 'blocked': 0, 'folders': 0}
+
+    def submit(self, path, content, serializer=None, mode='w', owner=None):
+        """
+            Queue an artifact to be serialized and written to `path`.
+
+            `content` must not be changed by the caller after it is
+            submitted, because it is serialized later, on the worker thread.
+
+            :param path: Path or str, full path for the output file
+            :param content: the artifact; str or bytes if there is no serializer
+            :param serializer: callable that turns `content` into str or bytes
+            :param mode: str enum, 'w' to create/overwrite, 'a' to append
+            :param owner: str, name of the test case the artifact belongs to
+            :return: None
+        """
+        job = (path, content, serializer, mode, owner)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            # backpressure: wait for the worker to catch up
+            self.stats['blocked'] += 1
+            self._queue.put(job)
+
+    def flush(self):
+        """
+            Block until every artifact submitted so far has been written.
+
+            :return: None
+        """
+        self._queue.join()
+
+    def pop_errors(self, owner):
+        """
+            Get (and forget) the write errors for the test case `owner`.
+
+            :param owner: str, name of the test case
+            :return: list of str, one per failed write
+        """
+        with self._errors_lock:
+            return self._errors.pop(owner, [])
+
+    def close(self):
+        """
+            Flush the queue and stop the worker thread.
+
+            :return: None
+        """
+        if not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        logger.info(f"\nArtifact writer stopped: {self.stats}")
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is _STOP:
+                    return
+                self._write(*job)
+            finally:
+                self._queue.task_done()
+
+    def _write(self, path, content, serializer, mode, owner):
+        try:
+            data = serializer(content) if serializer else content
+            self._make_folder(os.path.dirname(path))
+            if isinstance(data, bytes):
+                with open(path, mode + 'b') as f:
+                    f.write(data)
+            else:
+                with open(path, mode) as f:
+                    f.write(data)
+            self.stats['written'] += 1
+        except Exception as e:
+            self.stats['failed'] += 1
+            msg = f"Failed to write artifact '{path}': {type(e).__name__}: {e}"
+            logger.error(msg)
+            with self._errors_lock:
+                self._errors.setdefault(owner, []).append(msg)
+
+    def _make_folder(self, folder):
+        """
+            Create the folder for an artifact, unless it was already created.
+
+            :param folder: str, path to the folder
+            :return: None
+        """
+        if folder in self._known_folders:
+            return
+        if len(self._known_folders) >= _MAX_KNOWN_FOLDERS:
+            self._known_folders.clear()
+        if not os.path.isdir(folder):
+            os.makedirs(folder, exist_ok=True)
+            self.stats['folders'] += 1
+        self._known_folders.add(folder)
+
+
+class FlightRecorder(object):
+    """
+        Keep a test's last artifacts in memory, and only write them if the
+        test fails.
+
+        Artifacts are grouped in snapshots (e.g. the local and session storage
+        files for one event are one snapshot). The ring keeps the last
+        `max_snapshots` snapshots, and drops the oldest ones when the
+        artifacts in memory go over `max_bytes`; the newest snapshot is
+        always kept.
+
+        Example usage:
+        >>> recorder = FlightRecorder(max_snapshots=20)
+        >>> recorder.submit(path, cookies, serializer=utils.plog, owner='1_foo')
+        >>> recorder.release(get_writer())  # the test failed
+        1
+
+        :param max_snapshots: int, max number of snapshots kept
+        :param max_bytes: int, memory cap for the kept artifacts (approximate)
+    """
+
+    def __init__(self, max_snapshots=DEFAULT_RING_SIZE,
+                 max_bytes=DEFAULT_RING_MB * 1024 * 1024):
+        self.max_snapshots = max(1, max_snapshots)
+        self.max_bytes = max_bytes
+        # each snapshot is [key, list of jobs, size in bytes]
+        self._ring = collections.deque()
+        self.size = 0
+        self.stats = {'artifacts': 0, 'evicted': 0}
+
+    def submit(self, path, content, serializer=None, mode='w', owner=None,
+               snapshot=None):
+        """
+            Keep an artifact in the ring; see ArtifactWriter.submit() for
+            the other params.
+
+            :param snapshot: hashable key; consecutive artifacts with the same
+                             key belong to one snapshot, None starts a new one
+            :return: None
+        """
+        job = (path, content, serializer, mode, owner)
+        size = approximate_size(content)
+        if snapshot is not None and self._ring and self._ring[-1][0] == snapshot:
+            self._ring[-1][1].append(job)
+            self._ring[-1][2] += size
+        else:
+            self._ring.append([snapshot, [job], size])
+        self.size += size
+        self.stats['artifacts'] += 1
+
+        while len(self._ring) > 1 and (len(self._ring) > self.max_snapshots
+                                       or self.size > self.max_bytes):
+            _, jobs, dropped_size = self._ring.popleft()
+            self.size -= dropped_size
+            self.stats['evicted'] += len(jobs)
+
+    def release(self, writer):
+        """
+            Hand the kept artifacts, oldest first, to a writer.
+
+            :param writer: ArtifactWriter
+            :return: int, number of artifacts handed over
+        """
+        if self.stats['evicted']:
+            logger.warning(f"\nThe flight recorder dropped "
+                           f"{self.stats['evicted']} older artifacts.")
+        count = 0
+        while self._ring:
+            _, jobs, _ = self._ring.popleft()
+            for job in jobs:
+                writer.submit(*job)
+                count += 1
+        self.size = 0
+        return count
+
+    def discard(self):
+        """
+            Forget the kept artifacts.
+
+            :return: int, number of artifacts discarded
+        """
+        count = sum(len(jobs) for _, jobs, _ in self._ring)
+        self._ring.clear()
+        self.size = 0
+        return count
+
+
+def approximate_size(content):
+    """
+        Estimate the memory held by an artifact, without serializing it.
+
+        :param content: the artifact
+        :return: int, approximate size in bytes
+    """
+    if isinstance(content, (bytes, bytearray, str)):
+        return len(content)
+    if hasattr(content, 'nbytes'):
+        # e.g. a screenshots.EncodeJob
+        return content.nbytes
+    if isinstance(content, dict):
+        return sum(approximate_size(k) + approximate_size(v)
+                   for k, v in content.items())
+    if isinstance(content, (list, tuple)):
+        return sum(approximate_size(v) for v in content)
+    return 8
+
+
+def start_writer(max_pending=DEFAULT_MAX_PENDING):
+    """
+        Start the process-wide artifact writer (replacing any earlier one).
+
+        :param max_pending: int, max number of queued artifacts
+        :return writer: ArtifactWriter instance
+    """
+    global _writer
+    with _writer_lock:
+        if _writer is not None:
+            _writer.close()
+        _writer = ArtifactWriter(max_pending=max_pending)
+    return _writer
+
+
+def get_writer():
+    """
+        Get the process-wide artifact writer, starting one with the default
+        settings if the framework hasn't (e.g. outside of pytest).
+
+        :return writer: ArtifactWriter instance
+    """
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = ArtifactWriter()
+                atexit.register(stop_writer)
+    return _writer
+
+
+def stop_writer():
+    """
+        Flush and stop the process-wide artifact writer, if there is one.
+
+        :return: None
+    """
+    global _writer
+    with _writer_lock:
+        if _writer is not None:
+            _writer.close()
+            _writer = None
@@ -0,0 +1,356 @@
+"""
+    Session-wide cache for static assets, shared by every browser context.
+
+    Each test gets a fresh browser context, with an empty HTTP cache, so
+    every test downloads the same JS bundles, CSS, fonts and images from the
+    tier under test again. With `--asset-cache`, an AssetCache is installed
+    in every context through context.route(), and serves those assets from
+    disk instead:
+    + only GET requests for static resource types are handled; everything
+      else falls through to the network (route.fallback())
+    + the route pattern is a regex of static file extensions, which the
+      browser matches itself, so other requests never reach Python
+    + a response is stored if it is a plain 200 that HTTP caching would
+      allow to be shared: no `no-store` or `private`, no Set-Cookie, no Vary
+      (other than Accept-Encoding)
+    + a fresh entry (per Cache-Control max-age or Expires, or the usual
+      heuristic of 10% of the time since Last-Modified) is served without a
+      request; a stale entry with an ETag or Last-Modified is revalidated
+      with a conditional request, and served from the cache on a 304
+
+    The bodies are stored content-addressed (by sha256), so the same file
+    served under several urls is stored once, and pytest-xdist workers can
+    share the folder. The index (url -> entry) is per process, in LRU order;
+    entries are evicted when the bodies go over the size budget.
+"""
+import collections
+import email.utils
+import hashlib
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_MB = 256
+STATIC_RESOURCE_TYPES = {'script', 'stylesheet', 'font', 'image', 'media'}
+# matched by the browser, so that only static assets are routed to Python
+STATIC_URL_PATTERN = re.compile(
+    r'\.(?:js|mjs|css|woff2?|ttf|otf|eot|png|jpe?g|gif|svg|webp|avif|ico|'
+    r'mp4|webm)(?:[?#].*)?$', re.IGNORECASE)
+# heuristic freshness, for responses with Last-Modified but no explicit
+# lifetime (RFC 9111, 4.2.2)
+HEURISTIC_FRACTION = 0.1
+HEURISTIC_MAX_SECONDS = 24 * 3600
+# headers that don't describe the stored (decoded) body
+DROPPED_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding',
+                   'connection', 'keep-alive', 'date', 'age'}
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+class CacheEntry(object):
+    """
+        A cached response.
+
+        :param digest: str, sha256 of the body
+        :param size: int, size of the body in bytes
+        :param headers: dict, response headers to serve the body with
+        :param expires: float, epoch time until which the entry is fresh
+        :param etag: str, ETag validator, or None
+        :param last_modified: str, Last-Modified validator, or None
+    """
+    __slots__ = ('digest', 'size', 'headers', 'expires', 'etag',
+                 'last_modified')
+
+    def __init__(self, digest, size, headers, expires, etag, last_modified):
+        self.digest = digest
+        self.size = size
+        self.headers = headers
+        self.expires = expires
+        self.etag = etag
+        self.last_modified = last_modified
+
+    @property
+    def validators(self):
+        """
+            :return: dict, conditional request headers for revalidation
+        """
+        validators = {}
+        if self.etag:
+            validators['if-none-match'] = self.etag
+        if self.last_modified:
+            validators['if-modified-since'] = self.last_modified
+        return validators
+
+
+class AssetCache(object):
+    """
+        Content-addressed disk cache for static assets, with an LRU index.
+
+        :param folder: Path, folder for the cached bodies
+        :param max_bytes: int, size budget for the cached bodies
+    """
+
+    def __init__(self, folder, max_bytes=DEFAULT_MAX_MB * 1024 * 1024):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        os.makedirs(self.folder, exist_ok=True)
+        # url -> CacheEntry, least recently used first
+        self._index = collections.OrderedDict()
+        # digest -> number of urls that use it
+        self._refs = collections.Counter()
+        self._bytes = 0
+        self.stats = {'hits': 0, 'revalidated': 0, 'misses': 0, 'stored': 0,
+                      'uncacheable': 0, 'passed': 0, 'evicted': 0,
+                      'errors': 0, 'bytes served': 0}
+
+    def install(self, context):
+        """
+            Serve the static assets of a browser context from the cache.
+
+            :param context: Playwright BrowserContext instance
+            :return: None
+        """
+        context.route(STATIC_URL_PATTERN, self.handle)
+
+    def handle(self, route, request):
+        """
+            Route handler: serve, revalidate or fetch and store one request.
+
+            :param route: Playwright Route
+            :param request: Playwright Request
+            :return: None
+        """
+        if request.method != 'GET' or \
+                request.resource_type not in STATIC_RESOURCE_TYPES:
+            self.stats['passed'] += 1
+            route.fallback()
+            return
+
+        url = request.url
+        entry = self._index.get(url)
+        body = self._read(entry) if entry is not None else None
+        if body is not None and entry.expires > time.time():
+            self._index.move_to_end(url)
+            self._serve(route, entry, body, 'hits')
+            return
+
+        headers = dict(request.headers)
+        if body is not None:
+            headers.update(entry.validators)
+        try:
+            response = route.fetch(headers=headers)
+        except Exception as e:
+            # leave the request to the browser
+            logger.info(f"\nAsset cache could not fetch '{url}': {e}")
+            self.stats['errors'] += 1
+            route.fallback()
+            return
+
+        if body is not None and response.status == 304:
+            # still valid; refresh the lifetime from the 304's headers
+            entry.expires = expires_at(response.headers, time.time())
+            self._index.move_to_end(url)
+            self._serve(route, entry, body, 'revalidated')
+            return
+
+        self.stats['misses'] += 1
+        if is_cacheable(response.status, response.headers):
+            self.store(url, response.body(), response.headers)
+        else:
+            self.stats['uncacheable'] += 1
+        route.fulfill(response=response)
+
+    def store(self, url, body, headers):
+        """
+            Add a response to the cache, and evict the least recently used
+            entries that go over the budget.
+
+            :param url: str, the request url
+            :param body: bytes, the (decoded) response body
+            :param headers: dict, the response headers, lower-case names
+            :return: CacheEntry, or None if the body is bigger than the budget
+        """
+        if len(body) > self.max_bytes:
+            return None
+        digest = hashlib.sha256(body).hexdigest()
+        path = self._path(digest)
+        if not os.path.exists(path):
+            # write and rename, so other processes never read a partial file
+            fd, temp = tempfile.mkstemp(dir=self.folder)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(body)
+            os.replace(temp, path)
+
+        entry = CacheEntry(
+            digest, len(body),
+            {name: value for name, value in headers.items()
+             if name not in DROPPED_HEADERS},
+            expires_at(headers, time.time()),
+            headers.get('etag'), headers.get('last-modified'))
+        # count the new reference before dropping the url's old entry, which
+        # may use the same body: otherwise the body file would be deleted
+        if self._refs[digest] == 0:
+            self._bytes += entry.size
+        self._refs[digest] += 1
+        self._remove(url)
+        self._index[url] = entry
+        self.stats['stored'] += 1
+
+        while self._bytes > self.max_bytes and self._index:
+            oldest = next(iter(self._index))
+            self._remove(oldest)
+            self.stats['evicted'] += 1
+        return entry
+
+    def _serve(self, route, entry, body, stat):
+        self.stats[stat] += 1
+        self.stats['bytes served'] += entry.size
+        route.fulfill(status=200, headers=entry.headers, body=body)
+
+    def _read(self, entry):
+        """
+            :return: bytes, the entry's body, or None if it is gone (e.g.
+                     evicted by another process)
+        """
+        try:
+            with open(self._path(entry.digest), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _remove(self, url):
+        entry = self._index.pop(url, None)
+        if entry is None:
+            return
+        self._refs[entry.digest] -= 1
+        if self._refs[entry.digest] == 0:
+            del self._refs[entry.digest]
+            self._bytes -= entry.size
+            try:
+                os.remove(self._path(entry.digest))
+            except FileNotFoundError:
+                pass
+
+    def _path(self, digest):
+        return os.path.join(self.folder, digest)
+
+
+def is_cacheable(status, headers):
+    """
+        Whether a response can be stored in a cache shared by every test
+        (and every test user).
+
+        :param status: int, HTTP status
+        :param headers: dict, response headers, lower-case names
+        :return: bool
+    """
+    if status != 200 or 'set-cookie' in headers:
+        return False
+    directives = cache_control(headers)
+    if 'no-store' in directives or 'private' in directives:
+        return False
+    vary = {value.strip().lower() for value in headers.get('vary', '').split(',')}
+    if vary - {'', 'accept-encoding'}:
+        return False
+    # without a lifetime or a validator, there's no way to reuse it
+    return expires_at(headers, time.time()) > time.time() or \
+        'etag' in headers or 'last-modified' in headers
+
+
+def cache_control(headers):
+    """
+        :param headers: dict, response headers, lower-case names
+        :return: dict, directive -> value (None for directives without one)
+    """
+    directives = {}
+    for part in headers.get('cache-control', '').split(','):
+        name, _, value = part.strip().partition('=')
+        if name:
+            directives[name.lower()] = value.strip('"') or None
+    return directives
+
+
+def expires_at(headers, now):
+    """
+        Work out until when a response is fresh.
+
+        :param headers: dict, response headers, lower-case names
+        :param now: float, epoch time the response was received
+        :return: float, epoch time; `now` or earlier if it is stale already
+    """
+    directives = cache_control(headers)
+    if 'no-cache' in directives:
+        return now
+    max_age = directives.get('max-age')
+    if max_age is not None and max_age.isdigit():
+        return now + int(max_age) - _age(headers)
+    expires = _parse_date(headers.get('expires'))
+    if expires is not None:
+        date = _parse_date(headers.get('date')) or now
+        return now + (expires - date)
+    last_modified = _parse_date(headers.get('last-modified'))
+    if last_modified is not None:
+        date = _parse_date(headers.get('date')) or now
+        lifetime = min(HEURISTIC_MAX_SECONDS,
+                       HEURISTIC_FRACTION * max(0, date - last_modified))
+        return now + lifetime
+    return now
+
+
+def _age(headers):
+    age = headers.get('age', '')
+    return int(age) if age.isdigit() else 0
+
+
+def _parse_date(value):
+    if not value:
+        return None
+    try:
+        return email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def start_cache(folder, max_mb=DEFAULT_MAX_MB):
+    """
+        Start the process-wide asset cache (replacing any earlier one).
+
+        :param folder: Path, folder for the cached bodies
+        :param max_mb: int, size budget in megabytes
+        :return: AssetCache instance
+    """
+    global _cache
+    with _cache_lock:
+        _cache = AssetCache(folder, max_bytes=max_mb * 1024 * 1024)
+    return _cache
+
+
+def get_cache():
+    """
+        :return: AssetCache instance, or None if the cache is not on
+    """
+    return _cache
+
+
+def stop_cache(remove=False):
+    """
+        Stop the process-wide asset cache, if there is one.
+
+        :param remove: bool, also delete the cache folder
+        :return: dict, the cache's stats, or None
+    """
+    global _cache
+    with _cache_lock:
+        cache, _cache = _cache, None
+    if cache is None:
+        return None
+    if remove:
+        shutil.rmtree(cache.folder, ignore_errors=True)
+    return cache.stats
@@ -0,0 +1,204 @@
+"""
+    A pool of long-lived Playwright browser processes.
+
+    Launching Chromium or Firefox costs more than most of our tests, so when
+    the pool is enabled the browser processes live for the whole pytest
+    session (or for the whole xdist worker, because session fixtures are
+    per-process). Every test still gets a fresh BrowserContext, which is
+    Playwright's unit of isolation for cookies, storage, tracing and video.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_BROWSERS = ['chromium', 'firefox']
+
+
+def launch_browser(playwright, browser_name, headed=False):
+    """
+        Launch a browser process for `browser_name`.
+
+        :param playwright: Playwright instance from sync_playwright()
+        :param browser_name: str enum, 'chromium' or 'firefox'
+        :param headed: bool, True to launch the browser in headed mode
+        :return browser: Playwright Browser instance
+    """
+    if browser_name not in SUPPORTED_BROWSERS:
+        msg = f"\nError: '{browser_name}' is not a valid selection."
+        logger.error(msg)
+        raise ValueError(msg)
+
+    browser_type = getattr(playwright, browser_name)
+    browser = browser_type.launch(headless=not headed)
+    logger.info(f"\nLaunched '{browser_name}' browser (headed: {headed}).")
+    return browser
+
+
+class BrowserPool(object):
+    """
+        Hand out fresh BrowserContexts from a small set of browser
+        processes that are launched once and re-used across tests.
+
+        A browser is recycled (closed and re-launched) when:
+        + it fails its health check, e.g. it crashed or was disconnected
+        + it has served `max_contexts` contexts, which keeps slow leaks
+          in the browser process from accumulating over a long run
+
+        Example usage:
+        >>> pool = BrowserPool(playwright, 'chromium', max_contexts=25)
+        >>> context = pool.new_context()
+        >>> pwpage = context.new_page()
+        >>> pool.release(context)
+        >>> pool.close()
+    """
+
+    def __init__(self, playwright, browser_name, headed=False,
+                 max_contexts=25, size=1):
+        """
+            :param playwright: Playwright instance from sync_playwright()
+            :param browser_name: str enum, 'chromium' or 'firefox'
+            :param headed: bool, True to launch browsers in headed mode
+            :param max_contexts: int, contexts served before a browser is recycled
+            :param size: int, number of browser processes in the pool
+        """
+        self.playwright = playwright
+        self.browser_name = browser_name
+        self.headed = headed
+        self.max_contexts = max_contexts
+        self.size = max(1, size)
+
+        # each slot is a dict: {'browser': Browser, 'served': int}
+        self._slots = []
+        # map of context -> slot, so release() can find the owning browser
+        self._leases = {}
+        self.stats = {'launched': 0, 'recycled': 0, 'contexts served': 0}
+
+    def new_context(self, **context_kwargs):
+        """
+            Get a fresh BrowserContext from a healthy pooled browser.
+
+            If creating the context fails, the browser is assumed to be
+            broken; it is recycled and the context creation is retried once.
+
+            :param context_kwargs: dict, pass-through args for
+                                   Browser.new_context()
+            :return context: Playwright BrowserContext instance
+        """
+        slot = self._checkout()
+        try:
+            context = slot['browser'].new_context(**context_kwargs)
+        except Exception as e:
+            logger.warning(f"\nPooled browser failed to create a context "
+                           f"({e}); recycling it and retrying.")
+            self._recycle(slot)
+            context = slot['browser'].new_context(**context_kwargs)
+
+        slot['served'] += 1
+        self.stats['contexts served'] += 1
+        self._leases[context] = slot
+        logger.info(f"\nServed context {slot['served']}/{self.max_contexts} "
+                    f"from pooled '{self.browser_name}' browser.")
+        return context
+
+    def release(self, context):
+        """
+            Close a context that was handed out by new_context().
+
+            Closing the context is what flushes tracing and video artifacts,
+            so this must be called at test teardown.
+
+            :param context: Playwright BrowserContext instance
+            :return: None
+        """
+        slot = self._leases.pop(context, None)
+        try:
+            context.close()
+        except Exception as e:
+            # the owning browser is probably gone; the next checkout will
+            # see the failed health check and recycle it
+            logger.warning(f"\nFailed to close pooled context: {e}")
+            return
+
+        if slot is not None and slot['served'] >= self.max_contexts:
+            if not self._has_open_leases(slot):
+                self._recycle(slot)
+
+    def close(self):
+        """
+            Close every pooled browser; call this at the end of the session.
+
+            :return: None
+        """
+        for slot in self._slots:
+            self._close_browser(slot['browser'])
+        self._slots = []
+        self._leases = {}
+        logger.info(f"\nClosed browser pool: {self.stats}")
+
+    def _checkout(self):
+        """
+            Pick the least-used browser slot, launching or recycling as needed.
+
+            :return slot: dict, the chosen pool slot
+        """
+        if len(self._slots) < self.size:
+            slot = {'browser': self._launch(), 'served': 0}
+            self._slots.append(slot)
+            return slot
+
+        slot = min(self._slots, key=lambda s: s['served'])
+        if not self._is_healthy(slot):
+            logger.warning(f"\nPooled '{self.browser_name}' browser failed "
+                           f"its health check; recycling it.")
+            self._recycle(slot)
+        elif slot['served'] >= self.max_contexts \
+                and not self._has_open_leases(slot):
+            self._recycle(slot)
+        return slot
+
+    def _is_healthy(self, slot):
+        """
+            A browser is healthy if it is still connected and is not holding
+            on to contexts that nobody has leased (i.e. leaked contexts).
+
+            :param slot: dict, pool slot
+            :return: bool
+        """
+        browser = slot['browser']
+        try:
+            if not browser.is_connected():
+                return False
+            leased = [c for c, s in self._leases.items() if s is slot]
+            leaked = [c for c in browser.contexts if c not in leased]
+        except Exception:
+            return False
+
+        for context in leaked:
+            logger.warning('\nClosing a leaked context in a pooled browser.')
+            try:
+                context.close()
+            except Exception:
+                return False
+        return True
+
+    def _has_open_leases(self, slot):
+        return any(s is slot for s in self._leases.values())
+
+    def _recycle(self, slot):
+        self._close_browser(slot['browser'])
+        slot['browser'] = self._launch()
+        slot['served'] = 0
+        self.stats['recycled'] += 1
+
+    def _launch(self):
+        browser = launch_browser(self.playwright, self.browser_name,
+                                 headed=self.headed)
+        self.stats['launched'] += 1
+        return browser
+
+    @staticmethod
+    def _close_browser(browser):
+        try:
+            browser.close()
+        except Exception as e:
+            logger.warning(f"\nFailed to close pooled browser: {e}")
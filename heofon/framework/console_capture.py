@@ -0,0 +1,121 @@
+"""
+    Console capture through Playwright page events.
+
+    Browsers don't keep a readable history of the console, so the console
+    log is collected as it happens: a ConsoleRecorder listens to the page's
+    'console', 'pageerror' and 'requestfailed' events and keeps the most
+    recent messages in a fixed-size ring buffer. Each call to drain() returns
+    the messages since the previous drain, plus the number of messages that
+    were pushed out of the buffer in between.
+
+    The event handlers only append a tuple of the fields Playwright already
+    has at hand; the messages are turned into dicts when they are drained.
+    So a page that logs thousands of messages costs a bounded amount of
+    memory and very little time per message.
+"""
+import collections
+import itertools
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# max number of messages kept between two drains
+DEFAULT_CAPACITY = 1000
+
+
+class ConsoleRecorder(object):
+    """
+        Ring buffer of console messages, page errors and failed requests
+        for one page.
+
+        :param capacity: int, max number of messages kept between drains
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = max(1, capacity)
+        self._buffer = collections.deque(maxlen=self.capacity)
+        self._seq = itertools.count(1)
+        self._dropped = 0
+        self._page = None
+        self.stats = {'console': 0, 'pageerror': 0, 'requestfailed': 0,
+                      'dropped': 0, 'drains': 0}
+
+    def attach(self, pwpage):
+        """
+            Start recording the events of a page.
+
+            :param pwpage: playwright page instance
+            :return: None
+        """
+        pwpage.on('console', self._on_console)
+        pwpage.on('pageerror', self._on_pageerror)
+        pwpage.on('requestfailed', self._on_requestfailed)
+        self._page = pwpage
+
+    def detach(self):
+        """
+            Stop recording; the messages already in the buffer are kept.
+
+            :return: None
+        """
+        if self._page is None:
+            return
+        self._page.remove_listener('console', self._on_console)
+        self._page.remove_listener('pageerror', self._on_pageerror)
+        self._page.remove_listener('requestfailed', self._on_requestfailed)
+        self._page = None
+
+    def drain(self):
+        """
+            Take the messages recorded since the last drain.
+
+            :return: tuple, (list of message dicts in order, int number of
+                     messages dropped from the buffer since the last drain)
+        """
+        buffer = self._buffer
+        raw = [buffer.popleft() for _ in range(len(buffer))]
+        dropped, self._dropped = self._dropped, 0
+        self.stats['drains'] += 1
+        if dropped:
+            logger.warning(f"\nThe console buffer dropped {dropped} messages; "
+                           f"its capacity is {self.capacity}.")
+        return [_to_dict(entry) for entry in raw], dropped
+
+    def _append(self, kind, level, text, location):
+        if len(self._buffer) == self.capacity:
+            self._dropped += 1
+            self.stats['dropped'] += 1
+        self.stats[kind] += 1
+        self._buffer.append((next(self._seq), time.time(), kind, level, text,
+                             location))
+
+    def _on_console(self, message):
+        self._append('console', message.type, message.text, message.location)
+
+    def _on_pageerror(self, error):
+        self._append('pageerror', 'error', error.message, error.stack)
+
+    def _on_requestfailed(self, request):
+        self._append('requestfailed', 'error',
+                     f"{request.method} {request.url} failed: {request.failure}",
+                     request.resource_type)
+
+
+def _to_dict(entry):
+    """
+        :param entry: tuple, as appended by ConsoleRecorder._append()
+        :return: dict, the message for the console log file
+    """
+    seq, timestamp, kind, level, text, detail = entry
+    message = {'seq': seq, 'timestamp': timestamp, 'source': kind,
+               'type': level, 'text': text}
+    if kind == 'console' and detail:
+        message['location'] = f"{detail.get('url')}:" \
+                              f"{detail.get('lineNumber')}:" \
+                              f"{detail.get('columnNumber')}"
+    elif kind == 'pageerror' and detail:
+        message['stack'] = detail
+    elif kind == 'requestfailed':
+        message['resource type'] = detail
+    return message
@@ -27,3 +27,31 @@ class PageUnloadException(Exception):
     def __init__(self, errors=None):
         Exception.__init__(self, errors)
         self.errors = errors
+
+
+# ######################################
+# page-object-model-focused exceptions
+# ######################################
+class RoutingException(Exception):
+    """
+        Raise this exception when a wrapper's routings map can't be
+        compiled, or when a page object id has no route.
+        Capture the errors and make them available.
+    """
+    def __init__(self, errors=None):
+        Exception.__init__(self, errors)
+        self.errors = errors
+
+
+# ######################################
+# network-focused exceptions
+# ######################################
+class NetworkReplayException(Exception):
+    """
+        Raise this exception when a test replaying recorded network traffic
+        has no recording, or makes requests that are not in the recording.
+        Capture the errors (e.g. the missed urls) and make them available.
+    """
+    def __init__(self, errors=None):
+        Exception.__init__(self, errors)
+        self.errors = errors
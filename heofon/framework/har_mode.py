@@ -0,0 +1,176 @@
+"""
+    Record and replay the network traffic of UI tests, as HAR files.
+
+    `--network-mode` picks how the `pwpage` fixture's context talks to the
+    network:
+    + live: the real network (the default)
+    + record: the traffic of each test is recorded to a HAR file, with
+      context.route_from_har(update=True); Playwright writes it when the
+      context closes
+    + replay: every request is served from the recording, with
+      context.route_from_har(); nothing goes to the network
+
+    The recordings live in a HAR folder (`--har-dir`), either one per test
+    (`--har-scope=test`, `<har dir>/<test key>.har`) or one per app wrapper
+    (`--har-scope=app`, `<har dir>/<app>.har`). With the app scope, each test
+    is still recorded on its own (to `<har dir>/<app>.parts/`), and the parts
+    are merged into the app's HAR at the end of the session (merge_hars()).
+
+    In replay mode, a request that is not in the recording is aborted, and
+    the test errors at teardown, with the list of missed urls. Replay can
+    add latency to every request (`--replay-latency-ms`), to exercise the
+    tests' waits without a slow tier.
+"""
+import json
+import logging
+import shutil
+
+from heofon.framework import utils_file
+from heofon.framework.exceptions import NetworkReplayException
+
+logger = logging.getLogger(__name__)
+
+NETWORK_MODES = ['live', 'record', 'replay']
+HAR_SCOPES = ['test', 'app']
+PARTS_SUFFIX = '.parts'
+
+
+def har_path(folder, scope, nodeid, app=None):
+    """
+        :param folder: Path, the HAR folder
+        :param scope: str enum, 'test' or 'app'
+        :param nodeid: str, pytest node id of the test
+        :param app: str, name of the test's app wrapper fixture, e.g.
+                    'sweetshop'; None if the test has none
+        :return: Path to the test's HAR file
+    """
+    if scope == 'app' and app:
+        return folder / f"{app}.har"
+    return folder / f"{utils_file.test_key(nodeid)}.har"
+
+
+def recording_path(folder, scope, nodeid, app=None):
+    """
+        :return: Path to record the test's HAR file to; with the app scope,
+                 a part to be merged by merge_hars()
+    """
+    if scope == 'app' and app:
+        return folder / f"{app}{PARTS_SUFFIX}" / \
+            f"{utils_file.test_key(nodeid)}.har"
+    return har_path(folder, scope, nodeid, app)
+
+
+class HarSession(object):
+    """
+        Record or replay the network traffic of one test's context.
+
+        :param mode: str enum, 'record' or 'replay'
+        :param path: Path to the HAR file
+        :param latency_ms: int, with 'replay', delay added to every request
+    """
+
+    def __init__(self, mode, path, latency_ms=0):
+        if mode not in NETWORK_MODES[1:]:
+            msg = f"Unsupported network mode '{mode}'; " \
+                  f"expected one of {NETWORK_MODES[1:]}."
+            logger.error(msg)
+            raise ValueError(msg)
+        if mode == 'replay' and not path.exists():
+            msg = f"No network recording to replay: {path}; " \
+                  f"run with --network-mode=record first."
+            logger.error(msg)
+            raise NetworkReplayException(msg)
+        self.mode = mode
+        self.path = path
+        self.latency_ms = latency_ms
+        # (method, url) of the requests missing from the recording
+        self.misses = []
+        self._page = None
+
+    def start(self, context, pwpage):
+        """
+            Route the context's requests to the HAR file; call this before
+            the page navigates.
+
+            :param context: Playwright BrowserContext instance
+            :param pwpage: playwright page instance, used for the latency
+            :return: None
+        """
+        if self.mode == 'record':
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            context.route_from_har(self.path, update=True,
+                                   update_content='embed',
+                                   update_mode='full')
+            logger.info(f"\nRecording network traffic to {self.path}.")
+            return
+
+        # routes run in the reverse order of registration: the latency
+        # first, then the recording, and the misses last
+        context.route('**/*', self._on_miss)
+        context.route_from_har(self.path, not_found='fallback')
+        if self.latency_ms:
+            self._page = pwpage
+            context.route('**/*', self._on_latency)
+        logger.info(f"\nReplaying network traffic from {self.path} "
+                    f"(latency {self.latency_ms}ms).")
+
+    def check(self):
+        """
+            Fail the test if it made requests that are not in the recording.
+
+            :return: None
+        """
+        if not self.misses:
+            return
+        urls = '\n'.join(f"    {method} {url}" for method, url in self.misses)
+        msg = f"{len(self.misses)} requests were not in the network " \
+              f"recording {self.path}:\n{urls}"
+        logger.error(msg)
+        raise NetworkReplayException(msg)
+
+    def _on_miss(self, route, request):
+        self.misses.append((request.method, request.url))
+        logger.warning(f"\nNot in the network recording: "
+                       f"{request.method} {request.url}")
+        route.abort('internetdisconnected')
+
+    def _on_latency(self, route, request):
+        # the sync API runs each handler in its own greenlet, so this wait
+        # doesn't hold up the other requests
+        self._page.wait_for_timeout(self.latency_ms)
+        route.fallback()
+
+
+def merge_hars(folder):
+    """
+        Merge the per-test parts recorded with the app scope into one HAR
+        per app, and remove the parts. For a request recorded by several
+        tests, the last recording wins.
+
+        :param folder: Path, the HAR folder
+        :return: list of Path, the merged HAR files
+    """
+    merged = []
+    for parts in sorted(folder.glob(f"*{PARTS_SUFFIX}")):
+        target = folder / f"{parts.name[:-len(PARTS_SUFFIX)]}.har"
+        har, entries = None, {}
+        for path in sorted(parts.glob('*.har')):
+            with open(path) as f:
+                part = json.load(f)
+            har = har or part
+            for entry in part['log']['entries']:
+                request = entry['request']
+                key = (request['method'], request['url'],
+                       (request.get('postData') or {}).get('text'))
+                entries.pop(key, None)
+                entries[key] = entry
+        if har is None:
+            continue
+        har['log']['entries'] = list(entries.values())
+        har['log'].pop('pages', None)
+        with open(target, 'w') as f:
+            json.dump(har, f)
+        shutil.rmtree(parts, ignore_errors=True)
+        logger.info(f"\nMerged {len(entries)} recorded requests into {target}.")
+        merged.append(target)
+    return merged
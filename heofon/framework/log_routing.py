@@ -0,0 +1,189 @@
+"""
+    Per-test log routing.
+
+    The framework logs the test run to the testrun's runlog.txt, and each
+    test case to its own testlog.txt. Instead of rebuilding the logging
+    configuration at every test setup and teardown, logging is configured
+    once with a RoutedQueueHandler on the root logger:
+
+    + on the logging thread, each record is stamped with the current route
+      (the current test's log file, or None for the run log); the route is
+      held in a ContextVar, so concurrent tests can each log to their own file
+    + also on the logging thread, the record's message is rendered
+      (getMessage(), so a utils.lazy_plog() arg is formatted there), since
+      the args may change once the call returns
+    + the record is put on a queue, and a QueueListener thread applies the
+      formatter (timestamp, logger name, level) and does the file I/O
+    + the listener's RoutingFileHandler keeps a small LRU of open files and
+      writes each record to the file it was routed to
+
+    Switching a test's log file is then just route_to() / reset_route().
+"""
+import collections
+import contextvars
+import logging
+import logging.handlers
+from queue import SimpleQueue
+
+logger = logging.getLogger(__name__)
+
+# name of the record attribute that carries the route
+ROUTE_ATTRIBUTE = 'heofon_log_path'
+
+_route = contextvars.ContextVar('heofon_log_route', default=None)
+
+
+def route_to(path):
+    """
+        Send log records from this thread of execution to `path`.
+
+        :param path: Path or str, full path to the log file
+        :return token: contextvars Token, to pass to reset_route()
+    """
+    return _route.set(str(path))
+
+
+def reset_route(token):
+    """
+        Restore the log route that was in place before the matching
+        route_to() call.
+
+        :param token: contextvars Token
+        :return: None
+    """
+    _route.reset(token)
+
+
+def current_route():
+    """
+        :return: str, path of the current log route, or None for the run log
+    """
+    return _route.get()
+
+
+class RoutingFileHandler(logging.Handler):
+    """
+        Write each record to the file named by its route, falling back to
+        the default file. Open files are kept in an LRU, so a long run
+        doesn't accumulate open file handles.
+
+        :param filename: str, path to the default (run) log file
+        :param max_open_files: int, max number of log files kept open
+    """
+
+    def __init__(self, filename, max_open_files=8):
+        logging.Handler.__init__(self)
+        self.filename = str(filename)
+        self.max_open_files = max_open_files
+        self._files = collections.OrderedDict()
+
+    def emit(self, record):
+        path = getattr(record, ROUTE_ATTRIBUTE, None) or self.filename
+        try:
+            handler = self._files[path]
+            self._files.move_to_end(path)
+        except KeyError:
+            handler = self._open(path)
+        handler.emit(record)
+
+    def setFormatter(self, fmt):
+        logging.Handler.setFormatter(self, fmt)
+        for handler in self._files.values():
+            handler.setFormatter(fmt)
+
+    def close(self):
+        self.acquire()
+        try:
+            for handler in self._files.values():
+                handler.close()
+            self._files.clear()
+        finally:
+            self.release()
+        logging.Handler.close(self)
+
+    def _open(self, path):
+        while len(self._files) >= self.max_open_files:
+            _, oldest = self._files.popitem(last=False)
+            oldest.close()
+        handler = logging.FileHandler(path, mode='a', delay=False)
+        handler.setFormatter(self.formatter)
+        self._files[path] = handler
+        return handler
+
+
+class RoutedQueueHandler(logging.handlers.QueueHandler):
+    """
+        A QueueHandler that stamps every record with the current log route
+        and hands the line formatting and the file I/O to a QueueListener
+        thread.
+
+        Attach it to the root logger with install(). It isn't set up through
+        logging.config.dictConfig(): from Python 3.12, dictConfig() builds
+        QueueHandler subclasses with the queue as the first positional
+        argument, and replaces their `listener` with one of its own that it
+        doesn't start; 3.12 also insists on a `handlers` key, which 3.11
+        would pass to __init__(). The signature still takes the queue first,
+        and this handler's listener is kept under another name, so that
+        dictConfig() can't break it.
+
+        The message itself is rendered on the logging thread, by
+        QueueHandler.prepare(); the formatter is applied on the listener
+        thread, by the RoutingFileHandler.
+
+        :param queue: queue for the records; None for a new SimpleQueue
+        :param filename: str, path to the default (run) log file
+        :param max_open_files: int, max number of log files kept open
+    """
+
+    def __init__(self, queue=None, *, filename, max_open_files=8):
+        if queue is None:
+            queue = SimpleQueue()
+        logging.handlers.QueueHandler.__init__(self, queue)
+        self.filename = str(filename)
+        self.router = RoutingFileHandler(filename, max_open_files=max_open_files)
+        self._listener = logging.handlers.QueueListener(self.queue, self.router)
+        self._listener.start()
+        self._listening = True
+
+    def setFormatter(self, fmt):
+        # the log line is formatted by the router, on the listener thread
+        self.router.setFormatter(fmt)
+
+    def prepare(self, record):
+        record = logging.handlers.QueueHandler.prepare(self, record)
+        setattr(record, ROUTE_ATTRIBUTE, _route.get())
+        return record
+
+    def flush(self):
+        """
+            Block until every record queued so far has been written.
+
+            :return: None
+        """
+        # stopping the listener drains the queue; start it back up after
+        if self._listening:
+            self._listener.stop()
+            self._listener.start()
+
+    def close(self):
+        if self._listening:
+            self._listening = False
+            self._listener.stop()
+        self.router.close()
+        logging.handlers.QueueHandler.close(self)
+
+
+def install(filename, formatter, max_open_files=8):
+    """
+        Attach a RoutedQueueHandler to the root logger.
+
+        :param filename: str, path to the default (run) log file
+        :param formatter: logging.Formatter for the log lines
+        :param max_open_files: int, max number of log files kept open
+        :return: RoutedQueueHandler instance
+    """
+    handler = RoutedQueueHandler(filename=filename,
+                                 max_open_files=max_open_files)
+    handler.setFormatter(formatter)
+    logging.getLogger().addHandler(handler)
+    return handler
@@ -0,0 +1,348 @@
+"""
+    Network capture through Playwright page events.
+
+    A NetworkRecorder listens to the page's 'request', 'response',
+    'requestfinished' and 'requestfailed' events, and keeps one row per
+    request: url, method, resource type, status, request and response sizes,
+    and the timing phases from `request.timing` (dns, connect, tls, wait,
+    download, total).
+
+    The rows live in column buffers (`array.array`, one per field, with the
+    strings interned in a small string table), not in a list of dicts: on a
+    page that loads hundreds of assets a row costs under 100 bytes plus its
+    url, instead of ~1KB for a dict.
+
+    At each page transition, flush() takes the completed rows as a
+    NetworkChunk, with a summary (request count, bytes, count and bytes per
+    resource type, the slowest requests); requests still in flight are
+    carried over to the next chunk. At the end of the test, a last flush
+    takes the requests made since the last transition, with the ones still
+    in flight marked `unfinished`. The chunks are appended to the test's
+    `network/network.jsonl`, one compact line per transition; read_chunks()
+    turns them back into rows.
+"""
+import array
+import heapq
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+NETWORK_FILENAME = 'network.jsonl'
+NETWORK_CAPTURE_MODES = ['off', 'on']
+SLOWEST_KEPT = 5
+
+# column name -> array typecode; string columns hold string table indices,
+# sizes and timings are -1 when unknown (as in Playwright's request.timing)
+COLUMNS = {'url': 'I',
+           'method': 'I',
+           'resource_type': 'I',
+           'status': 'h',
+           'failed': 'b',
+           'unfinished': 'b',  # still in flight at the end of the test
+           'request_bytes': 'q',
+           'response_bytes': 'q',
+           'start': 'd',  # epoch ms
+           'dns': 'd',  # ms
+           'connect': 'd',
+           'tls': 'd',
+           'wait': 'd',
+           'download': 'd',
+           'total': 'd'}
+STRING_COLUMNS = ['url', 'method', 'resource_type']
+TIMING_COLUMNS = ['start', 'dns', 'connect', 'tls', 'wait', 'download', 'total']
+
+
+class ColumnBuffer(object):
+    """
+        Rows of request data, stored column by column.
+    """
+
+    def __init__(self):
+        self.columns = {name: array.array(typecode)
+                        for name, typecode in COLUMNS.items()}
+        self.strings = []
+        self._string_index = {}
+
+    def __len__(self):
+        return len(self.columns['status'])
+
+    @property
+    def nbytes(self):
+        return sum(column.itemsize * len(column)
+                   for column in self.columns.values()) + \
+               sum(len(string) for string in self.strings)
+
+    def intern(self, string):
+        """
+            :param string: str
+            :return: int, index of `string` in the string table
+        """
+        index = self._string_index.get(string)
+        if index is None:
+            index = self._string_index[string] = len(self.strings)
+            self.strings.append(string)
+        return index
+
+    def append(self, url, method, resource_type):
+        """
+            Add a row for a new request, with the rest of its fields unknown.
+
+            :return: int, the row index
+        """
+        columns = self.columns
+        columns['url'].append(self.intern(url))
+        columns['method'].append(self.intern(method))
+        columns['resource_type'].append(self.intern(resource_type))
+        columns['status'].append(0)
+        columns['failed'].append(0)
+        columns['unfinished'].append(0)
+        for name in ['request_bytes', 'response_bytes'] + TIMING_COLUMNS:
+            columns[name].append(-1)
+        return len(self) - 1
+
+    def copy_row(self, other, row):
+        """
+            Append row `row` of ColumnBuffer `other` to this buffer.
+
+            :return: int, the row index in this buffer
+        """
+        for name, column in self.columns.items():
+            value = other.columns[name][row]
+            if name in STRING_COLUMNS:
+                value = self.intern(other.strings[value])
+            column.append(value)
+        return len(self) - 1
+
+    def row(self, index):
+        """
+            :param index: int, row index
+            :return: dict, the row with the strings resolved
+        """
+        row = {name: column[index] for name, column in self.columns.items()}
+        for name in STRING_COLUMNS:
+            row[name] = self.strings[row[name]]
+        return row
+
+
+class NetworkChunk(object):
+    """
+        The requests of one page transition, with their summary.
+
+        :param page: str, name of the page object
+        :param event: str, e.g. "loaded page 'sweetshop home page'"
+        :param buffer: ColumnBuffer with the completed requests
+    """
+
+    def __init__(self, page, event, buffer):
+        self.page = page
+        self.event = event
+        self.buffer = buffer
+        self.summary = summarize(buffer)
+
+    @property
+    def nbytes(self):
+        return self.buffer.nbytes
+
+
+class NetworkRecorder(object):
+    """
+        Record the requests of one page, in column buffers.
+    """
+
+    def __init__(self):
+        self._buffer = ColumnBuffer()
+        # in-flight Playwright Request -> row index in the buffer
+        self._rows = {}
+        self._page = None
+        # name of the page object of the last flush
+        self.last_page = None
+        self.stats = {'requests': 0, 'failed': 0, 'unfinished': 0,
+                      'chunks': 0}
+
+    def attach(self, pwpage):
+        """
+            Start recording the requests of a page.
+
+            :param pwpage: playwright page instance
+            :return: None
+        """
+        pwpage.on('request', self._on_request)
+        pwpage.on('response', self._on_response)
+        pwpage.on('requestfinished', self._on_requestfinished)
+        pwpage.on('requestfailed', self._on_requestfailed)
+        self._page = pwpage
+
+    def detach(self):
+        """
+            Stop recording; the rows already recorded are kept.
+
+            :return: None
+        """
+        if self._page is None:
+            return
+        self._page.remove_listener('request', self._on_request)
+        self._page.remove_listener('response', self._on_response)
+        self._page.remove_listener('requestfinished', self._on_requestfinished)
+        self._page.remove_listener('requestfailed', self._on_requestfailed)
+        self._page = None
+
+    def flush(self, pageobject_name, event, final=False):
+        """
+            Take the requests completed since the last flush.
+
+            :param pageobject_name: str, name of the page object
+            :param event: str, the page transition event
+            :param final: bool, the last flush of the test: the requests
+                          still in flight are taken too, marked unfinished,
+                          instead of being carried over
+            :return: NetworkChunk
+        """
+        completed = self._buffer
+        in_flight = self._rows
+        self._buffer = ColumnBuffer()
+        self._rows = {}
+        if in_flight and final:
+            for row in in_flight.values():
+                completed.columns['unfinished'][row] = 1
+            self.stats['unfinished'] += len(in_flight)
+        elif in_flight:
+            # carry the requests still in flight over to the next chunk
+            keep = ColumnBuffer()
+            carried = set()
+            for request, row in in_flight.items():
+                self._rows[request] = self._buffer.copy_row(completed, row)
+                carried.add(row)
+            for row in range(len(completed)):
+                if row not in carried:
+                    keep.copy_row(completed, row)
+            completed = keep
+        self.stats['chunks'] += 1
+        self.last_page = pageobject_name
+        return NetworkChunk(pageobject_name, event, completed)
+
+    def _on_request(self, request):
+        self._rows[request] = self._buffer.append(
+            request.url, request.method, request.resource_type)
+        self.stats['requests'] += 1
+
+    def _on_response(self, response):
+        row = self._rows.get(response.request)
+        if row is None:
+            return
+        columns = self._buffer.columns
+        columns['status'][row] = response.status
+        length = response.headers.get('content-length')
+        if length and length.isdigit():
+            columns['response_bytes'][row] = int(length)
+
+    def _on_requestfinished(self, request):
+        self._finish(request, failed=False)
+
+    def _on_requestfailed(self, request):
+        self.stats['failed'] += 1
+        self._finish(request, failed=True)
+
+    def _finish(self, request, failed):
+        row = self._rows.pop(request, None)
+        if row is None:
+            return
+        columns = self._buffer.columns
+        columns['failed'][row] = int(failed)
+        body = request.post_data_buffer
+        columns['request_bytes'][row] = len(body) if body else 0
+        for name, value in timing_phases(request.timing).items():
+            columns[name][row] = value
+
+
+def timing_phases(timing):
+    """
+        Turn Playwright's request.timing (times relative to startTime, -1
+        when not available) into phase durations.
+
+        :param timing: dict, from request.timing
+        :return: dict, TIMING_COLUMNS name -> ms, -1 if unknown
+    """
+    def phase(begin, end):
+        start, stop = timing.get(begin, -1), timing.get(end, -1)
+        if start < 0 or stop < 0:
+            return -1
+        return round(stop - start, 1)
+
+    response_end = timing.get('responseEnd', -1)
+    return {'start': timing.get('startTime', -1),
+            'dns': phase('domainLookupStart', 'domainLookupEnd'),
+            'connect': phase('connectStart', 'connectEnd'),
+            'tls': phase('secureConnectionStart', 'connectEnd'),
+            'wait': phase('requestStart', 'responseStart'),
+            'download': phase('responseStart', 'responseEnd'),
+            'total': round(response_end, 1) if response_end >= 0 else -1}
+
+
+def summarize(buffer, slowest=SLOWEST_KEPT):
+    """
+        :param buffer: ColumnBuffer
+        :param slowest: int, number of slowest requests listed
+        :return: dict, with the request, failed and unfinished counts, total
+                 bytes, count and bytes per resource type, and the slowest
+                 requests
+    """
+    columns = buffer.columns
+    by_type = {}
+    total_bytes = 0
+    for row in range(len(buffer)):
+        size = max(0, columns['request_bytes'][row]) + \
+               max(0, columns['response_bytes'][row])
+        total_bytes += size
+        kind = by_type.setdefault(buffer.strings[columns['resource_type'][row]],
+                                  {'count': 0, 'bytes': 0})
+        kind['count'] += 1
+        kind['bytes'] += size
+    rows = heapq.nlargest(slowest, range(len(buffer)),
+                          key=columns['total'].__getitem__)
+    return {'requests': len(buffer),
+            'failed': sum(columns['failed']),
+            'unfinished': sum(columns['unfinished']),
+            'bytes': total_bytes,
+            'by_type': by_type,
+            'slowest': [[buffer.strings[columns['url'][row]],
+                         columns['total'][row], columns['status'][row]]
+                        for row in rows if columns['total'][row] >= 0]}
+
+
+def serialize_chunk(chunk):
+    """
+        :param chunk: NetworkChunk
+        :return: str, one compact json line
+    """
+    record = {'page': chunk.page,
+              'event': chunk.event,
+              'summary': chunk.summary,
+              'strings': chunk.buffer.strings,
+              'columns': {name: column.tolist()
+                          for name, column in chunk.buffer.columns.items()}}
+    return json.dumps(record, separators=(',', ':')) + '\n'
+
+
+def read_chunks(path):
+    """
+        Read a network file back, one dict per transition, with the rows
+        rebuilt from the columns.
+
+        :param path: Path to a network.jsonl file
+        :return: list of dicts with 'page', 'event', 'summary' and 'rows'
+    """
+    chunks = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            strings, columns = record.pop('strings'), record.pop('columns')
+            for name in STRING_COLUMNS:
+                columns[name] = [strings[index] for index in columns[name]]
+            names = list(columns)
+            record['rows'] = [dict(zip(names, values))
+                              for values in zip(*columns.values())]
+            chunks.append(record)
+    return chunks
@@ -0,0 +1,359 @@
+"""
+    Page-load performance metrics, collected at every page object transition.
+
+    At each RootPageObject.load_po() (which _click_and_load_new_page() goes
+    through too), a PageMetricsRecorder takes one record with:
+    + the Navigation Timing of the current document (time to first byte,
+      DOMContentLoaded, load, transfer size), if the transition loaded a new
+      document; a single-page-app transition that stays in the same document
+      has no new navigation timing
+    + a summary of the Resource Timing entries since the previous record for
+      the same document: count, transfer size, total and slowest duration,
+      and counts per initiator type
+    + with Chromium, a few counters from the CDP Performance.getMetrics
+      command (script, layout and style durations, JS heap, DOM nodes)
+
+    Each record carries the page object name, the event, and what triggered
+    the transition (e.g. "clicked 'basket link'"), the acceleration profile
+    and the number of requests it blocked (see heofon.framework.acceleration),
+    and is appended as one compact json line to the test's
+    `metrics/metrics.jsonl`.
+
+    The conftest records metrics when `--page-metrics` is on and the capture
+    policy is not 'off'. With 'on-failure', the records are still written
+    for every test, not kept in the flight recorder: the aggregate is about
+    every page load of the run, not only those of the failed tests.
+
+    At the end of the session, aggregate() turns the records from every test
+    into a table with the p50, p95 and max of each metric, per page object;
+    it is written to `metrics.json` and `metrics.txt` in the testrun folder.
+    Given the `metrics.json` of an earlier run as a baseline (e.g. a run
+    without acceleration, compared with one with `--acceleration=declared`),
+    the table also has the load-time savings per page: the baseline's p50
+    and p95 load time minus this run's.
+"""
+import json
+import logging
+import math
+import time
+
+from heofon.framework import artifacts, run_context
+
+logger = logging.getLogger(__name__)
+
+METRICS_FILENAME = 'metrics.jsonl'
+PAGE_METRICS_MODES = ['off', 'on']
+
+# Navigation Timing, and the Resource Timing entries since the last call
+# (the index of the last entry read is kept on the document, so it starts
+# over on each new document); times are in ms from the navigation start
+METRICS_SCRIPT = """
+() => {
+    const round = (value) => Math.round(value * 10) / 10;
+    const result = {timeOrigin: performance.timeOrigin, nav: null};
+    const nav = performance.getEntriesByType('navigation')[0];
+    if (nav) {
+        result.nav = {
+            type: nav.type,
+            ttfb: round(nav.responseStart - nav.startTime),
+            dom_content_loaded: round(nav.domContentLoadedEventEnd - nav.startTime),
+            load: round(nav.loadEventEnd - nav.startTime),
+            transfer_kb: round((nav.transferSize || 0) / 1024),
+        };
+    }
+    const entries = performance.getEntriesByType('resource');
+    const start = window.__heofonResourceIndex || 0;
+    window.__heofonResourceIndex = entries.length;
+    const summary = {count: 0, transfer_kb: 0, duration: 0, slowest: 0,
+                     slowest_name: null, by_type: {}};
+    for (let i = start; i < entries.length; i++) {
+        const entry = entries[i];
+        summary.count += 1;
+        summary.transfer_kb += (entry.transferSize || 0) / 1024;
+        summary.duration += entry.duration;
+        if (entry.duration > summary.slowest) {
+            summary.slowest = entry.duration;
+            summary.slowest_name = entry.name;
+        }
+        const type = entry.initiatorType || 'other';
+        summary.by_type[type] = (summary.by_type[type] || 0) + 1;
+    }
+    summary.transfer_kb = round(summary.transfer_kb);
+    summary.duration = round(summary.duration);
+    summary.slowest = round(summary.slowest);
+    result.resources = summary;
+    return result;
+}
+"""
+
+# the CDP Performance.getMetrics counters that are kept; durations are in
+# seconds (cumulative for the page), sizes in bytes
+CDP_METRICS = ['ScriptDuration', 'LayoutDuration', 'RecalcStyleDuration',
+               'TaskDuration', 'JSHeapUsedSize', 'Nodes', 'LayoutCount',
+               'RecalcStyleCount', 'JSEventListeners']
+
+# (section, metric) pairs in the run-level aggregate
+AGGREGATE_METRICS = [('nav', 'ttfb'),
+                     ('nav', 'dom_content_loaded'),
+                     ('nav', 'load'),
+                     ('nav', 'transfer_kb'),
+                     ('resources', 'count'),
+                     ('resources', 'transfer_kb'),
+                     ('resources', 'slowest'),
+                     ('acceleration', 'blocked'),
+                     ('cdp', 'ScriptDuration'),
+                     ('cdp', 'TaskDuration'),
+                     ('cdp', 'JSHeapUsedSize')]
+
+
+class PageMetricsRecorder(object):
+    """
+        Collect page-load metrics for one test's page.
+
+        :param pwpage: playwright page instance
+        :param cdp: bool, try to use a CDP session for the Chromium
+                    performance counters
+    """
+
+    def __init__(self, pwpage, cdp=True):
+        self.pwpage = pwpage
+        self._cdp = None
+        self._time_origin = None
+        self.stats = {'records': 0, 'cdp': False}
+        if cdp:
+            self._cdp = open_cdp_session(pwpage)
+            self.stats['cdp'] = self._cdp is not None
+
+    def record(self, pageobject_name, event, trigger=None, acceleration=None):
+        """
+            Take a metrics record for the page the browser is on, and queue
+            it for the test's metrics file.
+
+            :param pageobject_name: str, name of the page object
+            :param event: str, e.g. "loaded page 'sweetshop home page'"
+            :param trigger: str, what caused the transition, e.g.
+                            "clicked 'basket link'"; None if unknown
+            :param acceleration: dict, the active acceleration profile and
+                                 the requests it blocked (see
+                                 Accelerator.drain()); None if acceleration
+                                 is off
+            :return: dict, the record
+        """
+        content = self.pwpage.evaluate(METRICS_SCRIPT)
+        new_document = content['timeOrigin'] != self._time_origin
+        self._time_origin = content['timeOrigin']
+
+        record = {'t': round(time.time(), 3),
+                  'page': pageobject_name,
+                  'event': event,
+                  'trigger': trigger,
+                  'url': self.pwpage.url,
+                  'new_document': new_document,
+                  'nav': content['nav'] if new_document else None,
+                  'resources': content['resources'],
+                  'acceleration': acceleration}
+        if self._cdp is not None:
+            record['cdp'] = get_cdp_metrics(self._cdp)
+        self.stats['records'] += 1
+
+        testcase = run_context.current_testcase()
+        path = testcase.folder_for('metrics') / METRICS_FILENAME
+        # metrics go straight to the writer, also with the on-failure
+        # policy: they are monitoring data, not failure diagnostics
+        artifacts.get_writer().submit(path, record, serializer=serialize_record,
+                                      mode='a', owner=testcase.name)
+        return record
+
+    def close(self):
+        """
+            Detach the CDP session, if there is one.
+
+            :return: None
+        """
+        if self._cdp is not None:
+            try:
+                self._cdp.detach()
+            except Exception as e:
+                logger.debug(f"\nCould not detach the CDP session: {e}")
+            self._cdp = None
+
+
+def open_cdp_session(pwpage):
+    """
+        Open a CDP session for the page, with the Performance domain enabled.
+
+        :param pwpage: playwright page instance
+        :return: Playwright CDPSession, or None if the browser doesn't speak
+                 CDP (Firefox, WebKit)
+    """
+    try:
+        session = pwpage.context.new_cdp_session(pwpage)
+        session.send('Performance.enable')
+    except Exception as e:
+        logger.info(f"\nNo CDP performance metrics for this browser: {e}")
+        return None
+    return session
+
+
+def get_cdp_metrics(session):
+    """
+        :param session: Playwright CDPSession with the Performance domain
+        :return: dict, CDP_METRICS counter name to value
+    """
+    response = session.send('Performance.getMetrics')
+    return {metric['name']: metric['value'] for metric in response['metrics']
+            if metric['name'] in CDP_METRICS}
+
+
+def serialize_record(record):
+    """
+        :param record: dict, a metrics record
+        :return: str, one compact json line
+    """
+    return json.dumps(record, separators=(',', ':')) + '\n'
+
+
+def read_records(testrun_folder):
+    """
+        Read the metrics records of every test case in the run.
+
+        :param testrun_folder: Path, path to the testrun output folder
+        :return: list of record dicts
+    """
+    records = []
+    for path in sorted(testrun_folder.glob(f"*/metrics/{METRICS_FILENAME}")):
+        with open(path) as f:
+            records.extend(json.loads(line) for line in f if line.strip())
+    return records
+
+
+def percentile(ordered, fraction):
+    """
+        Nearest-rank percentile.
+
+        :param ordered: list of numbers, sorted
+        :param fraction: float, 0-1, e.g. 0.95
+        :return: number
+    """
+    rank = max(1, math.ceil(len(ordered) * fraction))
+    return ordered[rank - 1]
+
+
+def aggregate(records):
+    """
+        Summarize the records per page object: the p50, p95 and max of each
+        of AGGREGATE_METRICS.
+
+        :param records: list of record dicts
+        :return: dict, page object name to {'records': n, 'profiles': list
+                 of acceleration profile names, 'blocked': total requests
+                 blocked, metric name to {'n', 'p50', 'p95', 'max'}}
+    """
+    values = {}
+    profiles = {}
+    for record in records:
+        page = values.setdefault(record['page'], {'records': 0})
+        page['records'] += 1
+        profile = (record.get('acceleration') or {}).get('profile')
+        if profile:
+            profiles.setdefault(record['page'], set()).add(profile)
+        for section, metric in AGGREGATE_METRICS:
+            value = (record.get(section) or {}).get(metric)
+            # a document that had not finished loading reports 0 or less
+            if value is None or (section == 'nav' and value <= 0):
+                continue
+            page.setdefault(f"{section}.{metric}", []).append(value)
+
+    table = {}
+    for name, page in sorted(values.items()):
+        row = {'records': page.pop('records'),
+               'profiles': sorted(profiles.get(name, ())),
+               'blocked': sum(page.get('acceleration.blocked', ()))}
+        for metric, series in page.items():
+            series.sort()
+            row[metric] = {'n': len(series),
+                           'p50': percentile(series, 0.5),
+                           'p95': percentile(series, 0.95),
+                           'max': series[-1]}
+        table[name] = row
+    return table
+
+
+def load_savings(table, baseline):
+    """
+        Compare the load times per page with a baseline aggregate, and add
+        the savings to the table's rows, as 'load_savings'.
+
+        :param table: dict, from aggregate()
+        :param baseline: dict, from aggregate(), e.g. an earlier metrics.json
+        :return: dict, page object name to {'p50', 'p95'} savings in ms (a
+                 negative saving is a slowdown), for the pages in both
+    """
+    savings = {}
+    for name, row in table.items():
+        current = row.get('nav.load')
+        before = (baseline.get(name) or {}).get('nav.load')
+        if not current or not before:
+            continue
+        savings[name] = {'p50': round(before['p50'] - current['p50'], 1),
+                         'p95': round(before['p95'] - current['p95'], 1)}
+        row['load_savings'] = savings[name]
+    return savings
+
+
+def format_table(table):
+    """
+        :param table: dict, from aggregate()
+        :return: str, the aggregate as a plain text table
+    """
+    lines = [f"{'page':<40} {'metric':<24} {'n':>5} {'p50':>10} "
+             f"{'p95':>10} {'max':>10}"]
+    for name, row in table.items():
+        lines.append(f"{name:<40} {'records':<24} {row['records']:>5}")
+        if row.get('profiles'):
+            lines.append(f"{'':<40} {'acceleration':<24} "
+                         f"{', '.join(row['profiles'])}; "
+                         f"{row['blocked']} requests blocked")
+        for metric, summary in row.items():
+            if metric in ('records', 'profiles', 'blocked', 'load_savings'):
+                continue
+            lines.append(f"{'':<40} {metric:<24} {summary['n']:>5} "
+                         f"{summary['p50']:>10.4g} {summary['p95']:>10.4g} "
+                         f"{summary['max']:>10.4g}")
+        if 'load_savings' in row:
+            saved = row['load_savings']
+            lines.append(f"{'':<40} {'load saved (ms)':<24} {'':>5} "
+                         f"{saved['p50']:>10.4g} {saved['p95']:>10.4g}")
+    return '\n'.join(lines) + '\n'
+
+
+def write_aggregate(testrun_folder, baseline=None, json_name='metrics.json',
+                    text_name='metrics.txt'):
+    """
+        Aggregate the run's metrics records, and write the table to the
+        testrun folder as json and as text.
+
+        :param testrun_folder: Path, path to the testrun output folder
+        :param baseline: Path to the metrics.json of an earlier run, to
+                         report the load-time savings against; None for none
+        :param json_name: str, file name for the json table
+        :param text_name: str, file name for the text table
+        :return: dict, the table; empty if there were no records
+    """
+    table = aggregate(read_records(testrun_folder))
+    if not table:
+        return table
+    if baseline is not None:
+        try:
+            with open(baseline) as f:
+                load_savings(table, json.load(f))
+        except (OSError, ValueError) as e:
+            logger.warning(f"\nCould not read the metrics baseline "
+                           f"{baseline}: {e}")
+    with open(testrun_folder / json_name, 'w') as f:
+        json.dump(table, f, indent=4)
+    text = format_table(table)
+    with open(testrun_folder / text_name, 'w') as f:
+        f.write(text)
+    logger.info(f"\nPage metrics:\n{text}")
+    return table
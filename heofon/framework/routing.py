@@ -0,0 +1,169 @@
+"""
+    Compiled route table for the page object models.
+
+    Each app wrapper has a routings.py module that maps a page object's str
+    id to the module and class name of its page object. Instead of importing
+    those modules on every page transition, the maps for every app wrapper are
+    compiled once, at session start, into a single table:
+
+        (app, auth_mode, po_id) --> page object class
+
+    Compiling also validates the maps, so a typo in a routings.py file fails
+    the test run before any test starts instead of in the middle of a test.
+"""
+import importlib
+import logging
+import pkgutil
+
+from heofon.framework.exceptions import RoutingException
+
+logger = logging.getLogger(__name__)
+
+# the package that holds the app wrappers
+APPS_PACKAGE = 'heofon.apps'
+
+# for each auth mode, the names of the routing map and module path
+# attributes in a wrapper's routings.py
+AUTH_MODES = {
+    'noauth': ('noauth_pageobjects', 'NOAUTH_PATH'),
+    'auth': ('auth_pageobjects', 'AUTH_PATH'),
+}
+
+# the compiled table, and the apps that have been compiled into it
+_ROUTES = {}
+_COMPILED_APPS = set()
+
+
+def app_from_routings_path(routings_path):
+    """
+        Get the app name from a wrapper's `routings_path`, e.g.
+        'heofon.apps.sweetshop.' --> 'sweetshop'.
+
+        :param routings_path: str, dot-notation path to the wrapper package
+        :return: str, app name
+    """
+    return routings_path.rstrip('.').rpartition('.')[2]
+
+
+def compile_routes(package=APPS_PACKAGE):
+    """
+        Compile the routing maps of every app wrapper in `package` into the
+        route table.
+
+        A sub-package of `package` is an app wrapper if it has a routings
+        module. Every error in every wrapper is collected before raising, so
+        one run reports all of the broken routes.
+
+        :param package: str, dot-notation path to the apps package
+        :return: dict, the compiled route table
+    """
+    apps_package = importlib.import_module(package)
+    errors = []
+    for module_info in pkgutil.iter_modules(apps_package.__path__):
+        if not module_info.ispkg:
+            continue
+        routings_path = f"{package}.{module_info.name}."
+        try:
+            routings = _import_routings(routings_path)
+        except ModuleNotFoundError:
+            # not an app wrapper
+            continue
+        errors.extend(_compile_app(module_info.name, routings))
+
+    if errors:
+        msg = 'Invalid page object routings:\n' + '\n'.join(errors)
+        logger.error(msg)
+        raise RoutingException(errors)
+
+    logger.info(f"\nCompiled {len(_ROUTES)} page object routes for apps: "
+                f"{sorted(_COMPILED_APPS)}.")
+    return _ROUTES
+
+
+def resolve_route(routings_path, auth_mode, po_id):
+    """
+        Look up the page object class for `po_id`.
+
+        If the app has not been compiled yet (e.g. the page objects are being
+        driven from outside of pytest), the app's routings are compiled now.
+
+        :param routings_path: str, dot-notation path to the wrapper package
+        :param auth_mode: str enum, 'noauth' or 'auth'
+        :param po_id: str, key for the page object in the POM data model
+        :return: page object class
+    """
+    app = app_from_routings_path(routings_path)
+    try:
+        return _ROUTES[(app, auth_mode, po_id)]
+    except KeyError:
+        pass
+
+    if app not in _COMPILED_APPS:
+        errors = _compile_app(app, _import_routings(routings_path))
+        if errors:
+            msg = 'Invalid page object routings:\n' + '\n'.join(errors)
+            logger.error(msg)
+            raise RoutingException(errors)
+        if (app, auth_mode, po_id) in _ROUTES:
+            return _ROUTES[(app, auth_mode, po_id)]
+
+    msg = f"No {auth_mode} page object '{po_id}' in the '{app}' routings."
+    logger.error(msg)
+    raise RoutingException([msg])
+
+
+def _import_routings(routings_path):
+    import_path = routings_path + 'routings'
+    try:
+        return importlib.import_module(import_path)
+    except ModuleNotFoundError as e:
+        if e.name != import_path:
+            # the routings module exists, but it imports something that doesn't
+            raise RoutingException([f"{import_path}: {e}"])
+        raise
+
+
+def _compile_app(app, routings):
+    """
+        Resolve every entry in one wrapper's routing maps to its class.
+
+        :param app: str, app name
+        :param routings: the wrapper's routings module
+        :return errors: list of str, one per invalid entry
+    """
+    errors = []
+    for auth_mode, (map_name, path_name) in AUTH_MODES.items():
+        routing_map = getattr(routings, map_name, None)
+        if routing_map is None:
+            # this auth mode is not implemented for this wrapper
+            continue
+        root_path_to_module = getattr(routings, path_name, None)
+        if not root_path_to_module:
+            errors.append(f"{app}: '{map_name}' is set, but '{path_name}' is not.")
+            continue
+
+        for po_id, page_object_data in routing_map.items():
+            where = f"{app} {auth_mode} '{po_id}'"
+            try:
+                module_path = root_path_to_module + page_object_data['module']
+                object_name = page_object_data['object']
+            except (KeyError, TypeError):
+                errors.append(f"{where}: needs 'module' and 'object' keys.")
+                continue
+
+            try:
+                module = importlib.import_module(module_path)
+            except ImportError as e:
+                errors.append(f"{where}: can't import '{module_path}' ({e}).")
+                continue
+
+            pageobject_class = getattr(module, object_name, None)
+            if not isinstance(pageobject_class, type):
+                errors.append(f"{where}: '{module_path}' has no class "
+                              f"'{object_name}'.")
+                continue
+
+            _ROUTES[(app, auth_mode, po_id)] = pageobject_class
+
+    _COMPILED_APPS.add(app)
+    return errors
@@ -0,0 +1,204 @@
+"""
+    Per-test run context.
+
+    The hacky `pytest.custom_namespace` dict is fine for run-level values
+    (tier, browser, testrun paths), but per-test values like the current test
+    case's output folders must not live in a single shared slot: under
+    pytest-xdist every worker runs its own tests, and anything keyed on
+    "the current test" or on a process-local counter will collide.
+
+    Each test gets a TestCaseContext instead. It is attached to the pytest
+    item and also published as the *current* test case through a ContextVar,
+    so framework code that has no access to the item (file writers, page
+    objects) can still find its test's folders.
+"""
+import contextvars
+import itertools
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# name of the worker id when pytest-xdist is not in play
+CONTROLLER = 'master'
+
+_current_testcase = contextvars.ContextVar('heofon_current_testcase',
+                                           default=None)
+
+
+class TestCaseContext(object):
+    """
+        Everything the framework needs to know about one running test.
+
+        :param name: str, name of the test case output folder
+        :param folder: Path, path to the test case output folder
+        :param nodeid: str, pytest node id for the test
+        :param worker: str, xdist worker id, or 'master'
+    """
+    # keep pytest from trying to collect this class
+    __test__ = False
+
+    def __init__(self, name, folder, nodeid='', worker=CONTROLLER):
+        self.name = name
+        self.folder = folder
+        self.nodeid = nodeid
+        self.worker = worker
+        # 'always', 'on-failure' or 'off' (see artifacts.CAPTURE_POLICIES)
+        self.capture_policy = 'always'
+        # where the artifact files go; None for the background writer,
+        # or an artifacts.FlightRecorder
+        self.artifact_sink = None
+        # map of folder kind (e.g. 'cookies') to Path; the folders are
+        # created by the artifact writer, on the first write
+        self.folders = {}
+        # state_delta.DeltaRecorder, if cookies and web storage are captured
+        # as deltas instead of full dumps
+        self.delta_recorder = None
+        # storage_journal.StorageJournal, if web storage mutations are
+        # drained from the page instead of scanned
+        self.storage_journal = None
+        # screenshots.ScreenshotPipeline for the test's page
+        self.screenshots = None
+        # trace_chunks.TraceRecorder, if the test is traced
+        self.tracer = None
+        # console_capture.ConsoleRecorder for the test's page
+        self.console_recorder = None
+        # page_metrics.PageMetricsRecorder for the test's page
+        self.page_metrics = None
+        # network_capture.NetworkRecorder for the test's page
+        self.network_recorder = None
+        # har_mode.HarSession, if the network is recorded or replayed
+        self.har_session = None
+        # acceleration.Accelerator for the test's context
+        self.accelerator = None
+        self._sequence = itertools.count(1)
+
+    def next_sequence(self):
+        """
+            Get the next number in this test's monotonic artifact sequence.
+
+            :return: int
+        """
+        return next(self._sequence)
+
+    def folder_for(self, kind):
+        """
+            Get the path to the `kind` output folder for this test case.
+
+            The folder may not exist yet: artifacts.ArtifactWriter creates it
+            when the first artifact is written to it.
+
+            :param kind: str, folder kind, e.g. 'cookies'
+            :return: Path
+        """
+        try:
+            return self.folders[kind]
+        except KeyError:
+            msg = f"Test case '{self.name}' has no '{kind}' folder; " \
+                  f"available: {sorted(self.folders)}."
+            logger.error(msg)
+            raise KeyError(msg)
+
+    def __repr__(self):
+        return f"<TestCaseContext {self.name} ({self.worker})>"
+
+
+def set_current_testcase(testcase):
+    """
+        Make `testcase` the current test case for this thread of execution.
+
+        :param testcase: TestCaseContext instance
+        :return token: contextvars Token, to pass to reset_current_testcase()
+    """
+    return _current_testcase.set(testcase)
+
+
+def reset_current_testcase(token):
+    """
+        Restore the current test case that was in place before the matching
+        set_current_testcase() call.
+
+        :param token: contextvars Token
+        :return: None
+    """
+    _current_testcase.reset(token)
+
+
+def current_testcase():
+    """
+        Get the TestCaseContext for the test that is running right now.
+
+        :return: TestCaseContext instance
+    """
+    testcase = _current_testcase.get()
+    if testcase is None:
+        msg = 'There is no current test case; this is only available ' \
+              'between test setup and test teardown.'
+        logger.error(msg)
+        raise RuntimeError(msg)
+    return testcase
+
+
+def worker_id(config):
+    """
+        Get the pytest-xdist worker id for this process.
+
+        :param config: pytest config object
+        :return: str, e.g. 'gw0', or 'master' if this is not a worker
+    """
+    workerinput = getattr(config, 'workerinput', None)
+    if workerinput is None:
+        return CONTROLLER
+    return workerinput['workerid']
+
+
+def is_worker(config):
+    """
+        :param config: pytest config object
+        :return: bool, True if this process is a pytest-xdist worker
+    """
+    return hasattr(config, 'workerinput')
+
+
+def merge_worker_runlogs(testrun_folder, runlog_name):
+    """
+        Fold the per-worker run logs into the testrun's run log.
+
+        Each xdist worker logs to its own `runlog-<worker>.txt`; once the
+        workers are done, append each of them (in worker order) to the
+        controller's run log and remove them.
+
+        :param testrun_folder: Path, path to the testrun output folder
+        :param runlog_name: str, file name of the testrun log, e.g. runlog.txt
+        :return: list of str, the ids of the merged workers
+    """
+    stem, _, suffix = runlog_name.rpartition('.')
+    worker_logs = sorted(testrun_folder.glob(f"{stem}-*.{suffix}"))
+    merged = []
+    with open(testrun_folder / runlog_name, 'a') as runlog:
+        for path in worker_logs:
+            worker = path.name[len(stem) + 1:-len(suffix) - 1]
+            runlog.write(f"\n{'#' * 30}\n### worker {worker} ###\n{'#' * 30}\n")
+            with open(path) as f:
+                for line in f:
+                    runlog.write(line)
+            path.unlink()
+            merged.append(worker)
+    return merged
+
+
+def write_testcase_index(testrun_folder, entries, filename='testcases.json'):
+    """
+        Write the index of test cases for this run: which folder holds the
+        output for which test, which worker ran it, and how it ended.
+
+        :param testrun_folder: Path, path to the testrun output folder
+        :param entries: list of dicts, one per test case
+        :return path: Path to the index file
+    """
+    path = testrun_folder / filename
+    ordered = sorted(entries, key=lambda e: e.get('index', 0))
+    with open(path, 'w') as f:
+        json.dump(ordered, f, indent=4, sort_keys=True)
+    logger.info(f"\nWrote test case index: {path}.")
+    return path
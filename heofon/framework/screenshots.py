@@ -0,0 +1,241 @@
+"""
+    Screenshot capture and encoding.
+
+    The browser encodes the screenshot, so the capture options decide most
+    of its cost: a JPEG is much cheaper to encode (and much smaller) than a
+    PNG, and a viewport or element capture is much smaller than a full-page
+    one. ScreenshotSettings holds those options.
+
+    After the capture, the raw bytes are handed off, and the test moves on:
+    + if the image has to be downscaled to `max_dimension`, that is done on a
+      worker pool (this needs Pillow, an optional dependency)
+    + the artifact writer waits for the encoded image and writes it, in
+      capture order (see artifacts and utils_file.write_screenshot_to_file)
+
+    A capture that is identical to the previous one for the same test (same
+    content hash) is skipped.
+"""
+import atexit
+import concurrent.futures
+import functools
+import hashlib
+import io
+import logging
+import threading
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+SCREENSHOT_FORMATS = ['png', 'jpeg']
+SCREENSHOT_MODES = ['full-page', 'viewport']
+DEFAULT_QUALITY = 80
+DEFAULT_WORKERS = 2
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class ScreenshotSettings(object):
+    """
+        How screenshots are captured and encoded.
+
+        :param image_format: str enum, 'png' or 'jpeg'
+        :param quality: int, 0-100, jpeg quality
+        :param mode: str enum, 'full-page' or 'viewport'
+        :param max_dimension: int, downscale images so that neither side is
+                              longer than this; 0 to keep the captured size
+    """
+
+    def __init__(self, image_format='png', quality=DEFAULT_QUALITY,
+                 mode='full-page', max_dimension=0):
+        if image_format not in SCREENSHOT_FORMATS:
+            msg = f"Unsupported screenshot format '{image_format}'; " \
+                  f"expected one of {SCREENSHOT_FORMATS}."
+            logger.error(msg)
+            raise ValueError(msg)
+        if mode not in SCREENSHOT_MODES:
+            msg = f"Unsupported screenshot mode '{mode}'; " \
+                  f"expected one of {SCREENSHOT_MODES}."
+            logger.error(msg)
+            raise ValueError(msg)
+        if isinstance(quality, bool) or not isinstance(quality, int) or \
+                not 0 <= quality <= 100:
+            msg = f"Unsupported screenshot quality {quality!r}; " \
+                  f"expected an int from 0 to 100."
+            logger.error(msg)
+            raise ValueError(msg)
+        self.image_format = image_format
+        self.quality = quality
+        self.mode = mode
+        self.max_dimension = max_dimension
+
+    @property
+    def suffix(self):
+        return '.jpg' if self.image_format == 'jpeg' else '.png'
+
+    def capture_options(self, full_page=True):
+        """
+            :param full_page: bool, False for an element capture
+            :return: dict, keyword arguments for Playwright's screenshot()
+        """
+        options = {'type': self.image_format}
+        if self.image_format == 'jpeg':
+            options['quality'] = self.quality
+        if full_page:
+            options['full_page'] = self.mode == 'full-page'
+        return options
+
+
+class EncodeJob(object):
+    """
+        A captured screenshot on its way to the file: either the raw bytes,
+        or a future for the downscaled image.
+
+        :param raw: bytes, the image as captured
+        :param settings: ScreenshotSettings
+    """
+    __slots__ = ('nbytes', '_raw', '_future')
+
+    def __init__(self, raw, settings):
+        self.nbytes = len(raw)
+        self._raw = raw
+        self._future = None
+        if settings.max_dimension and Image is not None:
+            self._future = get_pool().submit(downscale, raw, settings)
+
+    def result(self):
+        """
+            :return: bytes, the encoded image
+        """
+        if self._future is None:
+            return self._raw
+        return self._future.result()
+
+
+def encoded_bytes(job):
+    """
+        Serializer for an EncodeJob artifact; runs on the artifact writer's
+        thread, and waits for the worker pool if needed.
+
+        :param job: EncodeJob
+        :return: bytes
+    """
+    return job.result()
+
+
+def downscale(raw, settings):
+    """
+        Shrink an image so that its longest side fits in
+        `settings.max_dimension`, and re-encode it.
+
+        :param raw: bytes, the encoded image
+        :param settings: ScreenshotSettings
+        :return: bytes, the encoded image (`raw` itself if it already fits)
+    """
+    image = Image.open(io.BytesIO(raw))
+    if max(image.size) <= settings.max_dimension:
+        return raw
+    image.thumbnail((settings.max_dimension, settings.max_dimension))
+    output = io.BytesIO()
+    if settings.image_format == 'jpeg':
+        image.convert('RGB').save(output, format='JPEG',
+                                  quality=settings.quality)
+    else:
+        image.save(output, format='PNG')
+    return output.getvalue()
+
+
+class ScreenshotPipeline(object):
+    """
+        Capture screenshots for one test case with the same settings, and
+        skip consecutive identical captures.
+
+        :param settings: ScreenshotSettings; defaults to full-page png
+    """
+
+    def __init__(self, settings=None):
+        self.settings = settings or ScreenshotSettings()
+        self._last_digest = None
+        self.stats = {'captured': 0, 'duplicates': 0, 'bytes': 0}
+        if self.settings.max_dimension and Image is None:
+            _warn_no_pillow()
+
+    def capture(self, pwpage, element=None):
+        """
+            Take a screenshot of the page, or of one element.
+
+            :param pwpage: playwright page instance
+            :param element: Playwright Locator or ElementHandle to capture
+                            only that element; None for the page
+            :return: EncodeJob, or None if the capture is identical to the
+                     previous one
+        """
+        if element is not None:
+            raw = element.screenshot(
+                **self.settings.capture_options(full_page=False))
+        else:
+            raw = pwpage.screenshot(**self.settings.capture_options())
+        self.stats['captured'] += 1
+
+        digest = hashlib.blake2b(raw, digest_size=16).digest()
+        if digest == self._last_digest:
+            self.stats['duplicates'] += 1
+            return None
+        self._last_digest = digest
+        self.stats['bytes'] += len(raw)
+        return EncodeJob(raw, self.settings)
+
+
+@functools.lru_cache(maxsize=None)
+def _warn_no_pillow():
+    # once per process, not once per test
+    logger.warning("\nPillow is not installed; screenshots won't be "
+                   "downscaled.")
+
+
+def start_pool(max_workers=DEFAULT_WORKERS):
+    """
+        Start the worker pool for screenshot encoding, replacing any
+        previous one.
+
+        :param max_workers: int, number of worker threads
+        :return: ThreadPoolExecutor
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+        _pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='heofon-screenshots')
+        return _pool
+
+
+def get_pool():
+    """
+        :return: ThreadPoolExecutor, started on first use if needed
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = concurrent.futures.ThreadPoolExecutor(
+                max_workers=DEFAULT_WORKERS,
+                thread_name_prefix='heofon-screenshots')
+            atexit.register(stop_pool)
+        return _pool
+
+
+def stop_pool():
+    """
+        Finish the queued encodings and stop the worker pool.
+
+        :return: None
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+            _pool = None
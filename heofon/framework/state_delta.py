@@ -0,0 +1,236 @@
+"""
+    Delta-based capture of cookies and web storage.
+
+    Instead of writing a full dump of the cookies and of local and session
+    storage at every page transition, keep the last snapshot of each stream
+    for the test and append only what changed to a journal file:
+
+        {"seq": 7, "kind": "delta", "event": "loaded page 'sweetshop sweets page'",
+         "delta": {"added": {...}, "removed": [...], "changed": {...}}, ...}
+
+    When the individual writes are known (see storage_journal), a delta entry
+    also carries them as "mutations", so writes that were overwritten before
+    the event are not lost.
+
+    A full "baseline" entry is written for the first event of each stream,
+    and again every `baseline_every` events, so a journal can be read from
+    any baseline on. rebuild_state() replays a journal to get the full state
+    at any event.
+
+    The journals are JSON lines files, one per stream, e.g.
+    `cookies/cookies.jsonl`, `webstorage/local.jsonl`.
+"""
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASELINE_EVERY = 10
+
+
+def cookie_key(cookie):
+    """
+        Cookies are identified by name, domain and path.
+
+        :param cookie: dict, a Playwright cookie
+        :return: str key
+    """
+    return f"{cookie.get('name')}|{cookie.get('domain')}|{cookie.get('path')}"
+
+
+def cookies_to_state(cookies):
+    """
+        :param cookies: list of dicts, Playwright cookies
+        :return: dict of cookie_key() to cookie
+    """
+    return {cookie_key(cookie): cookie for cookie in cookies}
+
+
+def diff_state(old, new):
+    """
+        Compute the structured delta between two states.
+
+        :param old: dict, previous state
+        :param new: dict, current state
+        :return delta: dict with 'added' (key: value), 'removed' (list of
+                       keys) and 'changed' (key: new value)
+    """
+    added = {k: v for k, v in new.items() if k not in old}
+    removed = [k for k in old if k not in new]
+    changed = {k: v for k, v in new.items() if k in old and old[k] != v}
+    return {'added': added, 'removed': removed, 'changed': changed}
+
+
+def is_empty(delta):
+    return not (delta['added'] or delta['removed'] or delta['changed'])
+
+
+def apply_delta(state, delta):
+    """
+        Apply a delta from diff_state() to a state.
+
+        :param state: dict, the state before the delta
+        :param delta: dict, the delta
+        :return new_state: dict, a new state; `state` is left alone
+    """
+    new_state = dict(state)
+    for key in delta.get('removed', []):
+        new_state.pop(key, None)
+    new_state.update(delta.get('added', {}))
+    new_state.update(delta.get('changed', {}))
+    return new_state
+
+
+class DeltaRecorder(object):
+    """
+        Keep the last snapshot of each capture stream for one test, and turn
+        each new snapshot into a journal entry: a baseline or a delta.
+
+        :param baseline_every: int, write a full baseline every N events
+                               of a stream
+    """
+
+    def __init__(self, baseline_every=DEFAULT_BASELINE_EVERY):
+        self.baseline_every = max(1, baseline_every)
+        # per stream: {'state': dict, 'events': int}
+        self._streams = {}
+
+    def record(self, stream, state, seq, mutations=None, **meta):
+        """
+            Record the current `state` of `stream`.
+
+            :param stream: str, e.g. 'cookies' or 'local'
+            :param state: dict, the full current state
+            :param seq: int, the test's artifact sequence number for this event
+            :param mutations: list of dicts, the individual writes that led
+                              to this state, if known (see storage_journal)
+            :param meta: dict, extra fields for the journal entry
+                         (event, page, page object name, ...)
+            :return entry: dict journal entry, or None if nothing changed
+        """
+        previous = self._streams.get(stream)
+        events = previous['events'] if previous else 0
+        self._streams[stream] = {'state': state, 'events': events + 1}
+
+        entry = {'seq': seq}
+        entry.update(meta)
+        if mutations:
+            # keep the intermediate writes, which the delta can't show
+            entry['mutations'] = mutations
+        if previous is None or events % self.baseline_every == 0:
+            entry['kind'] = 'baseline'
+            entry['state'] = state
+            return entry
+
+        delta = diff_state(previous['state'], state)
+        if is_empty(delta) and not mutations:
+            return None
+        entry['kind'] = 'delta'
+        entry['delta'] = delta
+        return entry
+
+    def apply_mutations(self, stream, mutations, seq, **meta):
+        """
+            Record the state of `stream` that results from applying individual
+            writes to the last recorded state, without a full snapshot.
+
+            :param stream: str, e.g. 'local'
+            :param mutations: list of dicts, see apply_mutations()
+            :param seq: int, the test's artifact sequence number for this event
+            :param meta: dict, extra fields for the journal entry
+            :return entry: dict journal entry, or None if nothing changed
+        """
+        previous = self._streams.get(stream)
+        if previous is None:
+            msg = f"'{stream}' has no recorded state to apply mutations to."
+            logger.error(msg)
+            raise ValueError(msg)
+        state = apply_mutations(previous['state'], mutations)
+        return self.record(stream, state, seq, mutations=mutations, **meta)
+
+    def needs_baseline(self, stream):
+        """
+            :param stream: str, e.g. 'local'
+            :return: bool, True if the next event of `stream` is a baseline
+        """
+        previous = self._streams.get(stream)
+        return previous is None or \
+            previous['events'] % self.baseline_every == 0
+
+
+def apply_mutations(state, mutations):
+    """
+        Apply individual storage writes, in order, to a state.
+
+        :param state: dict, the state before the writes
+        :param mutations: list of dicts with an 'op' of 'set' (with 'key' and
+                          'value'), 'remove' (with 'key') or 'clear'
+        :return new_state: dict, a new state; `state` is left alone
+    """
+    new_state = dict(state)
+    for mutation in mutations:
+        op = mutation['op']
+        if op == 'set':
+            new_state[mutation['key']] = mutation['value']
+        elif op == 'remove':
+            new_state.pop(mutation['key'], None)
+        elif op == 'clear':
+            new_state.clear()
+    return new_state
+
+
+def serialize_entry(entry):
+    """
+        Serialize a journal entry as one line of json.
+
+        :param entry: dict journal entry
+        :return: str
+    """
+    return json.dumps(entry, sort_keys=True, default=str) + '\n'
+
+
+def read_journal(path):
+    """
+        :param path: Path or str, path to a journal file
+        :return: list of dict journal entries, in order
+    """
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def iter_states(path):
+    """
+        Replay a journal, yielding the full state after each entry.
+
+        Entries before the first baseline can't be replayed, so they are
+        skipped (e.g. when the start of a journal was not kept).
+
+        :param path: Path or str, path to a journal file
+        :return: generator of (entry, state) tuples
+    """
+    state = None
+    for entry in read_journal(path):
+        if entry['kind'] == 'baseline':
+            state = entry['state']
+        elif state is None:
+            continue
+        else:
+            state = apply_delta(state, entry['delta'])
+        yield entry, state
+
+
+def rebuild_state(path, seq=None):
+    """
+        Rebuild the full state of a stream as of the event `seq`.
+
+        :param path: Path or str, path to a journal file
+        :param seq: int, artifact sequence number of the event; defaults to
+                    the last event in the journal
+        :return state: dict, or None if there is no baseline at or before seq
+    """
+    state = None
+    for entry, this_state in iter_states(path):
+        if seq is not None and entry['seq'] > seq:
+            break
+        state = this_state
+    return state
@@ -0,0 +1,195 @@
+"""
+    In-page journal of web storage mutations.
+
+    Scanning every key of localStorage and sessionStorage at each event costs
+    time in proportion to the size of the storage, and only ever sees the
+    final value of a key: a value that is written and then overwritten or
+    removed between two events never shows up.
+
+    Instead, an init script is added to the browser context. It wraps
+    Storage.prototype.setItem, removeItem and clear, and records each
+    mutation (with a timestamp) in a bounded ring buffer on the page:
+
+        {seq: 12, ts: 1700000000123, area: 'local', op: 'set',
+         key: 'basket', value: '[...]'}
+
+    At each event the framework drains only the new mutations, in the same
+    evaluate() call that takes the rest of the browser state snapshot (see
+    utils_playwright.BROWSER_STATE_SCRIPT), and applies them to the last
+    known state (see state_delta.DeltaRecorder.apply_mutations).
+
+    The journal lives in the document, so the full storage is still scanned
+    when it can't be trusted:
+    + the first time, and whenever the test's delta recorder is due for a
+      baseline;
+    + after a navigation to a new document, since mutations made by the old
+      document after the last drain are gone;
+    + when the ring buffer overflowed and mutations were dropped.
+
+    Writes that don't go through the Storage methods (e.g.
+    `localStorage.foo = 'bar'`, or another tab) are not journaled; they
+    are picked up by the next scan.
+"""
+import logging
+import uuid
+
+from heofon.framework import utils_webstorage
+
+logger = logging.getLogger(__name__)
+
+# max number of mutations kept on the page between two drains
+DEFAULT_CAPACITY = 1000
+
+# name of the journal object on the page's window
+JOURNAL_NAME = '__heofonStorageJournal'
+
+# Installed once per document, before any of the page's own scripts run.
+# Reading window.localStorage throws on opaque origins, so the area lookup
+# is guarded.
+_INIT_SCRIPT = """(() => {
+    if (window.%(name)s) {
+        return;
+    }
+    const journal = {
+        doc: %(doc)s + '-' + Math.random().toString(36).slice(2),
+        capacity: %(capacity)d,
+        seq: 0,
+        dropped: 0,
+        entries: []
+    };
+    Object.defineProperty(window, '%(name)s', {value: journal});
+
+    const areaOf = (storage) => {
+        try {
+            if (storage === window.localStorage) {
+                return 'local';
+            }
+            if (storage === window.sessionStorage) {
+                return 'session';
+            }
+        } catch (e) {}
+        return null;
+    };
+    const record = (storage, op, key, value) => {
+        const area = areaOf(storage);
+        if (area === null) {
+            return;
+        }
+        journal.seq += 1;
+        journal.entries.push({seq: journal.seq, ts: Date.now(), area: area,
+                              op: op, key: key, value: value});
+        if (journal.entries.length > journal.capacity) {
+            journal.entries.shift();
+            journal.dropped += 1;
+        }
+    };
+
+    const proto = Storage.prototype;
+    const setItem = proto.setItem;
+    const removeItem = proto.removeItem;
+    const clear = proto.clear;
+    proto.setItem = function (key, value) {
+        const result = setItem.call(this, key, value);
+        record(this, 'set', String(key), String(value));
+        return result;
+    };
+    proto.removeItem = function (key) {
+        const result = removeItem.call(this, key);
+        record(this, 'remove', String(key), null);
+        return result;
+    };
+    proto.clear = function () {
+        const result = clear.call(this);
+        record(this, 'clear', null, null);
+        return result;
+    };
+})();"""
+
+
+def init_script(capacity=DEFAULT_CAPACITY):
+    """
+        Build the init script that installs the storage journal.
+
+        :param capacity: int, max number of mutations kept between drains
+        :return: str, script for BrowserContext.add_init_script()
+    """
+    # the document id prefix is unique per test run, so that documents from
+    # different contexts can't be mistaken for each other
+    return _INIT_SCRIPT % {'name': JOURNAL_NAME,
+                           'doc': f"'{uuid.uuid4().hex[:8]}'",
+                           'capacity': max(1, capacity)}
+
+
+def install(context, capacity=DEFAULT_CAPACITY):
+    """
+        Add the storage journal to every page of a browser context.
+
+        :param context: Playwright BrowserContext instance
+        :param capacity: int, max number of mutations kept between drains
+        :return: None
+    """
+    context.add_init_script(script=init_script(capacity))
+    logger.info(f"\nStorage journal installed (capacity {capacity}).")
+
+
+class StorageJournal(object):
+    """
+        The test's side of the in-page journal: remembers which document was
+        drained last, and decides when a full scan is needed.
+
+        :param capacity: int, the ring buffer capacity, for the record
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        # id of the document that was drained last
+        self.doc = None
+        self.stats = {'drains': 0, 'mutations': 0, 'scans': 0, 'dropped': 0}
+
+    def drain_options(self, scan=False):
+        """
+            :param scan: bool, force a full scan of the storage
+            :return: dict, the argument for BROWSER_STATE_SCRIPT
+        """
+        return {'journal': JOURNAL_NAME, 'doc': self.doc, 'scan': scan}
+
+    def update(self, drained):
+        """
+            Book-keeping for the result of a drain.
+
+            :param drained: dict, the 'journal' part of BROWSER_STATE_SCRIPT's
+                            result
+            :return: None
+        """
+        self.doc = drained.get('doc')
+        self.stats['drains'] += 1
+        self.stats['mutations'] += len(drained.get('entries', []))
+        if drained.get('scanned'):
+            self.stats['scans'] += 1
+        if drained.get('dropped'):
+            self.stats['dropped'] += drained['dropped']
+            logger.warning(f"\nThe storage journal dropped {drained['dropped']} "
+                           f"mutations; the storage was scanned instead.")
+
+
+def mutations_by_area(entries):
+    """
+        Split drained journal entries by storage area, converting the values
+        the same way the full scans do (see utils_webstorage).
+
+        :param entries: list of dicts, drained journal entries
+        :return: dict, {'local': [...], 'session': [...]}
+    """
+    mutations = {'local': [], 'session': []}
+    for entry in entries:
+        mutation = dict(entry)
+        area = mutation.pop('area')
+        if mutation['op'] == 'set':
+            mutation['value'] = utils_webstorage.convert_web_storage_value(
+                mutation['value'])
+        else:
+            del mutation['value']
+            if mutation['op'] == 'clear':
+                del mutation['key']
+        mutations[area].append(mutation)
+    return mutations
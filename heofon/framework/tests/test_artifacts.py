@@ -0,0 +1,160 @@
+import logging
+
+import pytest
+
+from heofon.framework.artifacts import ArtifactWriter, FlightRecorder, \
+    approximate_size
+
+logger = logging.getLogger(__name__)
+
+
+class FakeWriter(object):
+    """
+        Collects what a FlightRecorder releases.
+    """
+
+    def __init__(self):
+        self.jobs = []
+
+    def submit(self, path, content, serializer=None, mode='w', owner=None):
+        self.jobs.append((path, content))
+
+
+def released(recorder):
+    """
+        :return: list of str, the paths of the kept artifacts, oldest first
+    """
+    writer = FakeWriter()
+    count = recorder.release(writer)
+    assert count == len(writer.jobs)
+    return [path for path, _ in writer.jobs]
+
+
+class FlightRecorderTests(object):
+
+    def test_ring_evicts_by_count(self):
+        recorder = FlightRecorder(max_snapshots=3)
+        for index in range(5):
+            recorder.submit(f"{index}.txt", 'x', owner='1_foo')
+        assert released(recorder) == ['2.txt', '3.txt', '4.txt']
+        assert recorder.stats == {'artifacts': 5, 'evicted': 2}
+
+    def test_ring_evicts_by_bytes(self):
+        recorder = FlightRecorder(max_snapshots=10, max_bytes=25)
+        for index in range(4):
+            recorder.submit(f"{index}.txt", 'x' * 10)
+        # 3 x 10 bytes is over the cap, so only the last 2 are kept
+        assert recorder.size == 20
+        assert released(recorder) == ['2.txt', '3.txt']
+        assert recorder.size == 0
+
+    def test_newest_snapshot_is_kept(self):
+        """
+            A snapshot bigger than the memory cap is still kept, on its own.
+
+            :return: None
+        """
+        recorder = FlightRecorder(max_bytes=10)
+        recorder.submit('small.txt', 'x')
+        recorder.submit('big.png', b'x' * 100)
+        assert released(recorder) == ['big.png']
+        assert recorder.stats['evicted'] == 1
+
+    def test_snapshot_grouping(self):
+        """
+            Consecutive artifacts with the same snapshot key are one
+            snapshot, and are evicted together; None starts a new snapshot
+            every time.
+
+            :return: None
+        """
+        recorder = FlightRecorder(max_snapshots=2)
+        recorder.submit('1_local.txt', 'x', snapshot=1)
+        recorder.submit('1_session.txt', 'x', snapshot=1)
+        recorder.submit('2_local.txt', 'x', snapshot=2)
+        recorder.submit('2_session.txt', 'x', snapshot=2)
+        assert released(recorder) == ['1_local.txt', '1_session.txt',
+                                      '2_local.txt', '2_session.txt']
+
+        recorder.submit('a.txt', 'x')
+        recorder.submit('b.txt', 'x')
+        recorder.submit('c.txt', 'x')
+        assert released(recorder) == ['b.txt', 'c.txt']
+
+    def test_same_key_later_is_a_new_snapshot(self):
+        recorder = FlightRecorder(max_snapshots=2)
+        recorder.submit('1_a.txt', 'x', snapshot=1)
+        recorder.submit('2_a.txt', 'x', snapshot=2)
+        recorder.submit('1_b.txt', 'x', snapshot=1)
+        assert released(recorder) == ['2_a.txt', '1_b.txt']
+
+    def test_release_keeps_the_job(self, tmp_path):
+        """
+            Released artifacts are written exactly as they were submitted.
+
+            :return: None
+        """
+        recorder = FlightRecorder()
+        path = tmp_path / 'cookies' / '0001_cookies.txt'
+        recorder.submit(path, {'a': 1}, serializer=repr, mode='w',
+                        owner='1_foo', snapshot=1)
+        writer = ArtifactWriter()
+        try:
+            assert recorder.release(writer) == 1
+            writer.flush()
+        finally:
+            writer.close()
+        assert path.read_text() == "{'a': 1}"
+
+    def test_discard(self):
+        recorder = FlightRecorder()
+        recorder.submit('a.txt', 'x', snapshot=1)
+        recorder.submit('b.txt', 'x', snapshot=1)
+        recorder.submit('c.txt', 'x')
+        assert recorder.discard() == 3
+        assert recorder.size == 0
+        assert released(recorder) == []
+
+
+class ArtifactWriterTests(object):
+
+    @pytest.fixture
+    def writer(self):
+        writer = ArtifactWriter(max_pending=2)
+        yield writer
+        writer.close()
+
+    def test_write_creates_the_folder(self, writer, tmp_path):
+        text = tmp_path / 'console' / 'log.txt'
+        image = tmp_path / 'screenshots' / 'page.png'
+        writer.submit(text, 'line\n', owner='1_foo')
+        writer.submit(text, 'more\n', mode='a', owner='1_foo')
+        writer.submit(image, b'\x89PNG', owner='1_foo')
+        writer.flush()
+        assert text.read_text() == 'line\nmore\n'
+        assert image.read_bytes() == b'\x89PNG'
+        assert writer.stats['written'] == 3
+        assert writer.stats['folders'] == 2
+
+    def test_errors_per_test_case(self, writer, tmp_path):
+        def broken(content):
+            raise ValueError('no')
+
+        writer.submit(tmp_path / 'a.txt', 'x', serializer=broken,
+                      owner='1_foo')
+        writer.submit(tmp_path / 'b.txt', 'x', owner='2_bar')
+        writer.flush()
+        errors = writer.pop_errors('1_foo')
+        assert len(errors) == 1 and 'ValueError: no' in errors[0]
+        assert writer.pop_errors('1_foo') == []
+        assert writer.pop_errors('2_bar') == []
+
+
+class ApproximateSizeTests(object):
+
+    def test_sizes(self):
+        assert approximate_size(b'abc') == 3
+        assert approximate_size('abcd') == 4
+        assert approximate_size({'ab': 'cde'}) == 5
+        assert approximate_size(['ab', ('c', b'de')]) == 5
+        assert approximate_size(42) == 8
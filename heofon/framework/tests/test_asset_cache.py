@@ -0,0 +1,259 @@
+import email.utils
+import logging
+import os
+
+import pytest
+
+from heofon.framework.asset_cache import AssetCache, is_cacheable, expires_at
+
+logger = logging.getLogger(__name__)
+
+HEADERS = {'cache-control': 'max-age=60', 'content-type': 'text/css'}
+NOW = 1700000000.0
+
+
+def http_date(timestamp):
+    return email.utils.formatdate(timestamp, usegmt=True)
+
+
+class FakeResponse(object):
+
+    def __init__(self, body, headers=None, status=200):
+        self.status = status
+        self.headers = dict(HEADERS if headers is None else headers)
+        self._body = body
+
+    def body(self):
+        return self._body
+
+
+class FakeRequest(object):
+
+    def __init__(self, url, method='GET', resource_type='stylesheet'):
+        self.url = url
+        self.method = method
+        self.resource_type = resource_type
+        self.headers = {}
+
+
+class FakeRoute(object):
+    """
+        Records what the asset cache does with a request.
+
+        :param response: FakeResponse, returned by fetch()
+    """
+
+    def __init__(self, response=None):
+        self.response = response
+        self.fetched = []
+        self.fulfilled = None
+        self.fell_back = False
+
+    def fetch(self, headers=None):
+        self.fetched.append(headers)
+        return self.response
+
+    def fulfill(self, response=None, status=None, headers=None, body=None):
+        self.fulfilled = response.body() if response is not None else body
+
+    def fallback(self):
+        self.fell_back = True
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return AssetCache(tmp_path / 'asset-cache', max_bytes=10)
+
+
+def get(cache, url, body=b''):
+    """
+        Request `url` through the cache.
+
+        :param cache: AssetCache instance
+        :param url: str, the asset url
+        :param body: bytes, what the network would answer
+        :return: FakeRoute, with what the cache did
+    """
+    route = FakeRoute(FakeResponse(body))
+    cache.handle(route, FakeRequest(url))
+    return route
+
+
+class AssetCacheTests(object):
+
+    def test_store_same_url_twice(self, cache):
+        """
+            Storing a url again with the same body keeps the body file, so
+            the url is still served from the cache.
+
+            :return: None
+        """
+        url = 'https://example.test/app.css'
+        cache.store(url, b'body', HEADERS)
+        cache.store(url, b'body', HEADERS)
+        route = get(cache, url)
+        assert route.fetched == []
+        assert route.fulfilled == b'body'
+        assert cache.stats['hits'] == 1
+
+    def test_evict_then_restore(self, cache):
+        """
+            A url evicted over the size budget is fetched and stored again.
+
+            :return: None
+        """
+        first, second = 'https://example.test/a.css', \
+            'https://example.test/b.css'
+        cache.store(first, b'aaaaaa', HEADERS)
+        cache.store(second, b'bbbbbb', HEADERS)
+        assert cache.stats['evicted'] == 1
+
+        route = get(cache, first, b'aaaaaa')
+        assert len(route.fetched) == 1
+        assert route.fulfilled == b'aaaaaa'
+        # storing `first` again evicted `second`
+        assert cache.stats['evicted'] == 2
+
+        route = get(cache, first)
+        assert route.fetched == []
+        assert route.fulfilled == b'aaaaaa'
+
+    def test_body_removed_by_another_process(self, cache):
+        """
+            A body file removed by another process is a miss, and the
+            response is stored again.
+
+            :return: None
+        """
+        url = 'https://example.test/app.css'
+        cache.store(url, b'body', HEADERS)
+        for name in os.listdir(cache.folder):
+            os.remove(os.path.join(cache.folder, name))
+
+        route = get(cache, url, b'body')
+        assert len(route.fetched) == 1
+        assert route.fulfilled == b'body'
+
+        route = get(cache, url)
+        assert route.fetched == []
+        assert route.fulfilled == b'body'
+
+    def test_other_requests_fall_back(self, cache):
+        """
+            Non-GET requests and non-static resource types are left to the
+            network.
+
+            :return: None
+        """
+        url = 'https://example.test/app.js'
+        for request in [FakeRequest(url, method='POST'),
+                        FakeRequest(url, resource_type='fetch')]:
+            route = FakeRoute()
+            cache.handle(route, request)
+            assert route.fell_back
+            assert route.fetched == []
+        assert cache.stats['passed'] == 2
+
+    def test_body_over_budget_is_not_stored(self, cache):
+        """
+            :return: None
+        """
+        assert cache.store('https://example.test/big.js', b'x' * 11,
+                           HEADERS) is None
+        assert os.listdir(cache.folder) == []
+
+
+class IsCacheableTests(object):
+
+    @pytest.mark.parametrize('status, headers, expected', [
+        (200, {'cache-control': 'max-age=60'}, True),
+        (200, {'cache-control': 'public, max-age=60'}, True),
+        (404, {'cache-control': 'max-age=60'}, False),
+        (206, {'cache-control': 'max-age=60'}, False),
+        (200, {'cache-control': 'no-store, max-age=60'}, False),
+        (200, {'cache-control': 'private, max-age=60'}, False),
+        (200, {'cache-control': 'max-age=60', 'set-cookie': 'a=1'}, False),
+        (200, {'cache-control': 'max-age=60', 'vary': 'Accept-Encoding'},
+         True),
+        (200, {'cache-control': 'max-age=60', 'vary': 'accept-encoding, '
+                                                      'User-Agent'}, False),
+        (200, {'cache-control': 'max-age=60', 'vary': '*'}, False),
+        # no lifetime, but a validator to revalidate with
+        (200, {'etag': '"v1"'}, True),
+        (200, {'cache-control': 'no-cache', 'etag': '"v1"'}, True),
+        # no lifetime and no validator
+        (200, {}, False),
+        (200, {'cache-control': 'max-age=0'}, False),
+    ])
+    def test_is_cacheable(self, status, headers, expected):
+        """
+            :param status: int, HTTP status
+            :param headers: dict, response headers
+            :param expected: bool, whether the response can be stored
+            :return: None
+        """
+        assert is_cacheable(status, headers) is expected
+
+
+class ExpiresAtTests(object):
+
+    def test_max_age(self):
+        assert expires_at({'cache-control': 'max-age=60'}, NOW) == NOW + 60
+
+    def test_max_age_minus_age(self):
+        """
+            The time the response already spent in upstream caches counts.
+
+            :return: None
+        """
+        headers = {'cache-control': 'max-age=60', 'age': '20'}
+        assert expires_at(headers, NOW) == NOW + 40
+
+    def test_max_age_wins_over_expires(self):
+        headers = {'cache-control': 'max-age=60',
+                   'date': http_date(NOW),
+                   'expires': http_date(NOW + 3600)}
+        assert expires_at(headers, NOW) == NOW + 60
+
+    def test_no_cache(self):
+        headers = {'cache-control': 'no-cache, max-age=60'}
+        assert expires_at(headers, NOW) == NOW
+
+    def test_expires_relative_to_date(self):
+        """
+            Expires is taken relative to the server's Date, so a skewed
+            client clock doesn't change the lifetime.
+
+            :return: None
+        """
+        server_now = NOW - 7200
+        headers = {'date': http_date(server_now),
+                   'expires': http_date(server_now + 300)}
+        assert expires_at(headers, NOW) == NOW + 300
+
+    def test_expires_in_the_past(self):
+        headers = {'date': http_date(NOW), 'expires': http_date(NOW - 60)}
+        assert expires_at(headers, NOW) <= NOW
+
+    def test_invalid_expires(self):
+        headers = {'date': http_date(NOW), 'expires': '0'}
+        assert expires_at(headers, NOW) == NOW
+
+    def test_last_modified_heuristic(self):
+        """
+            Without an explicit lifetime, a response is fresh for 10% of the
+            time since it was last modified.
+
+            :return: None
+        """
+        headers = {'date': http_date(NOW),
+                   'last-modified': http_date(NOW - 1000)}
+        assert expires_at(headers, NOW) == NOW + 100
+
+    def test_last_modified_heuristic_is_capped(self):
+        headers = {'date': http_date(NOW),
+                   'last-modified': http_date(NOW - 365 * 24 * 3600)}
+        assert expires_at(headers, NOW) == NOW + 24 * 3600
+
+    def test_no_freshness_information(self):
+        assert expires_at({}, NOW) == NOW
@@ -0,0 +1,271 @@
+import logging
+
+from heofon.framework.network_capture import NetworkRecorder, read_chunks, \
+    serialize_chunk, summarize, timing_phases
+
+logger = logging.getLogger(__name__)
+
+TIMING = {'startTime': 1700000000000.0,
+          'domainLookupStart': 1.0, 'domainLookupEnd': 3.0,
+          'connectStart': 3.0, 'secureConnectionStart': 5.0,
+          'connectEnd': 9.0, 'requestStart': 10.0, 'responseStart': 40.0,
+          'responseEnd': 50.0}
+
+
+class FakePage(object):
+    """
+        Emits Playwright page events to its listeners.
+    """
+
+    def __init__(self):
+        self.listeners = {}
+
+    def on(self, event, listener):
+        self.listeners.setdefault(event, []).append(listener)
+
+    def remove_listener(self, event, listener):
+        self.listeners[event].remove(listener)
+
+    def emit(self, event, arg):
+        for listener in list(self.listeners.get(event, [])):
+            listener(arg)
+
+
+class FakeRequest(object):
+
+    def __init__(self, url, resource_type='script', method='GET', body=None,
+                 timing=None):
+        self.url = url
+        self.method = method
+        self.resource_type = resource_type
+        self.post_data_buffer = body
+        self.timing = dict(TIMING if timing is None else timing)
+
+
+class FakeResponse(object):
+
+    def __init__(self, request, status=200, length=None):
+        self.request = request
+        self.status = status
+        self.headers = {} if length is None else {'content-length': str(length)}
+
+
+def start(page, request):
+    page.emit('request', request)
+
+
+def respond(page, request, status=200, length=None):
+    page.emit('response', FakeResponse(request, status, length))
+
+
+def finish(page, request, status=200, length=None):
+    respond(page, request, status, length)
+    page.emit('requestfinished', request)
+
+
+def rows(chunk):
+    return [chunk.buffer.row(index) for index in range(len(chunk.buffer))]
+
+
+class NetworkRecorderTests(object):
+
+    def setup_method(self):
+        self.page = FakePage()
+        self.recorder = NetworkRecorder()
+        self.recorder.attach(self.page)
+
+    def test_completed_request(self):
+        """
+            A finished request is one row with its status, sizes and
+            timing phases.
+
+            :return: None
+        """
+        request = FakeRequest('https://example.test/api', 'fetch', 'POST',
+                              body=b'{"a": 1}')
+        start(self.page, request)
+        finish(self.page, request, 201, length=120)
+
+        chunk = self.recorder.flush('home page', 'loaded home page')
+        assert chunk.page == 'home page'
+        assert rows(chunk) == [{
+            'url': 'https://example.test/api', 'method': 'POST',
+            'resource_type': 'fetch', 'status': 201, 'failed': 0,
+            'unfinished': 0, 'request_bytes': 8, 'response_bytes': 120,
+            'start': TIMING['startTime'], 'dns': 2.0, 'connect': 6.0,
+            'tls': 4.0, 'wait': 30.0, 'download': 10.0, 'total': 50.0}]
+        assert chunk.summary['requests'] == 1
+
+    def test_failed_request(self):
+        request = FakeRequest('https://example.test/missing.js')
+        start(self.page, request)
+        self.page.emit('requestfailed', request)
+
+        chunk = self.recorder.flush('home page', 'loaded home page')
+        assert [row['failed'] for row in rows(chunk)] == [1]
+        assert chunk.summary['failed'] == 1
+        assert self.recorder.stats['failed'] == 1
+
+    def test_in_flight_requests_are_carried_over(self):
+        """
+            A request still in flight at a flush is left out of that chunk,
+            and written, complete, with the chunk of the flush after it
+            finishes; the string tables of both chunks only hold their own
+            rows' strings.
+
+            :return: None
+        """
+        done = FakeRequest('https://example.test/done.js', 'script')
+        slow = FakeRequest('https://example.test/slow.css', 'stylesheet')
+        later = FakeRequest('https://example.test/later.png', 'image')
+        start(self.page, done)
+        start(self.page, slow)
+        # the response arrives before the flush, the end after it
+        respond(self.page, slow, 200, length=300)
+        finish(self.page, done, 200, length=100)
+
+        first = self.recorder.flush('home page', 'loaded home page')
+        assert [row['url'] for row in rows(first)] == \
+            ['https://example.test/done.js']
+        assert 'https://example.test/slow.css' not in first.buffer.strings
+        assert 'stylesheet' not in first.buffer.strings
+
+        start(self.page, later)
+        finish(self.page, later, 404)
+        self.page.emit('requestfinished', slow)
+
+        second = self.recorder.flush('sweets page', 'loaded sweets page')
+        carried = {row['url']: row for row in rows(second)}
+        assert list(carried) == ['https://example.test/slow.css',
+                                 'https://example.test/later.png']
+        assert carried['https://example.test/slow.css']['status'] == 200
+        assert carried['https://example.test/slow.css']['response_bytes'] == 300
+        assert carried['https://example.test/slow.css']['resource_type'] == \
+            'stylesheet'
+        assert carried['https://example.test/slow.css']['total'] == 50.0
+        assert carried['https://example.test/later.png']['status'] == 404
+        assert 'https://example.test/done.js' not in second.buffer.strings
+
+    def test_request_in_flight_across_several_flushes(self):
+        slow = FakeRequest('https://example.test/slow.js')
+        start(self.page, slow)
+        for index in range(3):
+            chunk = self.recorder.flush('home page', f"event {index}")
+            assert len(chunk.buffer) == 0
+        finish(self.page, slow)
+        chunk = self.recorder.flush('home page', 'event 3')
+        assert [row['url'] for row in rows(chunk)] == \
+            ['https://example.test/slow.js']
+
+    def test_final_flush_keeps_unfinished_requests(self):
+        """
+            The last flush of a test takes the requests still in flight,
+            marked unfinished, instead of carrying them over.
+
+            :return: None
+        """
+        done = FakeRequest('https://example.test/done.js')
+        hanging = FakeRequest('https://example.test/hanging')
+        start(self.page, done)
+        start(self.page, hanging)
+        finish(self.page, done)
+        self.recorder.detach()
+
+        chunk = self.recorder.flush(self.recorder.last_page, 'test teardown',
+                                    final=True)
+        assert {row['url']: row['unfinished'] for row in rows(chunk)} == \
+            {'https://example.test/done.js': 0,
+             'https://example.test/hanging': 1}
+        assert chunk.summary['unfinished'] == 1
+        assert self.recorder.stats['unfinished'] == 1
+        assert len(self.recorder.flush(None, 'again', final=True).buffer) == 0
+
+    def test_last_page(self):
+        assert self.recorder.last_page is None
+        self.recorder.flush('home page', 'loaded home page')
+        assert self.recorder.last_page == 'home page'
+
+    def test_detach(self):
+        self.recorder.detach()
+        start(self.page, FakeRequest('https://example.test/after.js'))
+        assert self.recorder.stats['requests'] == 0
+        assert all(not listeners for listeners in self.page.listeners.values())
+
+
+class SerializeTests(object):
+
+    def test_round_trip(self, tmp_path):
+        """
+            Chunks written with serialize_chunk() read back as the same
+            rows, one record per chunk.
+
+            :return: None
+        """
+        page, recorder = FakePage(), NetworkRecorder()
+        recorder.attach(page)
+        chunks = []
+        for index, urls in enumerate([['a.js', 'b.css', 'a.js'], ['c.png']]):
+            for url in urls:
+                request = FakeRequest(f"https://example.test/{url}")
+                start(page, request)
+                finish(page, request, length=index + 1)
+            chunks.append(recorder.flush(f"page {index}", f"event {index}"))
+
+        path = tmp_path / 'network.jsonl'
+        with open(path, 'w') as f:
+            for chunk in chunks:
+                line = serialize_chunk(chunk)
+                assert line.endswith('\n') and line.count('\n') == 1
+                f.write(line)
+
+        records = read_chunks(path)
+        assert [record['page'] for record in records] == ['page 0', 'page 1']
+        assert [record['event'] for record in records] == \
+            ['event 0', 'event 1']
+        for record, chunk in zip(records, chunks):
+            assert record['rows'] == rows(chunk)
+            assert record['summary'] == chunk.summary
+
+    def test_read_skips_blank_lines(self, tmp_path):
+        recorder = NetworkRecorder()
+        path = tmp_path / 'network.jsonl'
+        path.write_text(serialize_chunk(recorder.flush('p', 'e')) + '\n')
+        assert [record['rows'] for record in read_chunks(path)] == [[]]
+
+
+class SummaryTests(object):
+
+    def test_summarize(self):
+        page, recorder = FakePage(), NetworkRecorder()
+        recorder.attach(page)
+        for url, kind, total, length in [('a.js', 'script', 30.0, 100),
+                                         ('b.js', 'script', 10.0, 50),
+                                         ('c.png', 'image', 50.0, 1000),
+                                         ('d.png', 'image', -1, None)]:
+            request = FakeRequest(url, kind,
+                                  timing=dict(TIMING, responseEnd=total))
+            start(page, request)
+            finish(page, request, length=length)
+        buffer = recorder.flush('p', 'e').buffer
+
+        summary = summarize(buffer, slowest=2)
+        assert summary['requests'] == 4
+        assert summary['bytes'] == 1150
+        assert summary['by_type'] == {'script': {'count': 2, 'bytes': 150},
+                                      'image': {'count': 2, 'bytes': 1000}}
+        assert summary['slowest'] == [['c.png', 50.0, 200],
+                                      ['a.js', 30.0, 200]]
+
+    def test_timing_phases_unknown(self):
+        """
+            Phases with a missing end are -1, as in Playwright's timing.
+
+            :return: None
+        """
+        phases = timing_phases(dict(TIMING, domainLookupEnd=-1,
+                                    secureConnectionStart=-1, responseEnd=-1))
+        assert phases['dns'] == -1
+        assert phases['tls'] == -1
+        assert phases['download'] == -1
+        assert phases['total'] == -1
+        assert phases['wait'] == 30.0
@@ -0,0 +1,143 @@
+import json
+import logging
+
+import pytest
+
+from heofon.framework import page_metrics
+from heofon.framework.page_metrics import aggregate, load_savings, percentile
+
+logger = logging.getLogger(__name__)
+
+
+def record(page, load=None, ttfb=None, count=0, profile=None, blocked=0):
+    """
+        :return: dict, a metrics record with the fields aggregate() reads
+    """
+    nav = None if load is None else {'load': load, 'ttfb': ttfb,
+                                     'dom_content_loaded': None,
+                                     'transfer_kb': 0}
+    acceleration = None if profile is None else {'profile': profile,
+                                                 'blocked': blocked}
+    return {'page': page, 'event': f"loaded page '{page}'", 'nav': nav,
+            'resources': {'count': count}, 'acceleration': acceleration}
+
+
+class PercentileTests(object):
+
+    @pytest.mark.parametrize('fraction, expected', [
+        (0.5, 5), (0.95, 10), (0.1, 1), (0.01, 1), (1.0, 10)])
+    def test_nearest_rank(self, fraction, expected):
+        assert percentile(list(range(1, 11)), fraction) == expected
+
+    def test_single_value(self):
+        assert percentile([7], 0.5) == 7
+        assert percentile([7], 0.95) == 7
+
+
+class AggregateTests(object):
+
+    def test_per_page(self):
+        records = [record('home', load=100 + i, ttfb=10, count=i)
+                   for i in range(20)] + [record('basket', load=300)]
+        table = aggregate(records)
+        assert list(table) == ['basket', 'home']
+        home = table['home']
+        assert home['records'] == 20
+        assert home['nav.load'] == {'n': 20, 'p50': 109, 'p95': 118,
+                                    'max': 119}
+        assert home['nav.ttfb']['p50'] == 10
+        assert home['resources.count']['max'] == 19
+        assert table['basket']['nav.load']['n'] == 1
+
+    def test_missing_and_unfinished_values(self):
+        """
+            Records without navigation timing (single-page-app transitions)
+            and documents that had not finished loading (0 or less) don't
+            count towards the nav metrics.
+
+            :return: None
+        """
+        table = aggregate([record('home', load=100),
+                           record('home'),
+                           record('home', load=0),
+                           record('home', load=-1)])
+        assert table['home']['records'] == 4
+        assert table['home']['nav.load']['n'] == 1
+        # zero resources is a real value
+        assert table['home']['resources.count']['n'] == 4
+
+    def test_acceleration(self):
+        table = aggregate([record('home', load=100, profile='dom-only',
+                                  blocked=3),
+                           record('home', load=100, profile='no-analytics',
+                                  blocked=1),
+                           record('about', load=100)])
+        assert table['home']['profiles'] == ['dom-only', 'no-analytics']
+        assert table['home']['blocked'] == 4
+        assert table['about']['profiles'] == []
+        assert table['about']['blocked'] == 0
+
+    def test_no_records(self):
+        assert aggregate([]) == {}
+
+
+class LoadSavingsTests(object):
+
+    def test_savings(self):
+        baseline = aggregate([record('home', load=200), record('home', load=400),
+                              record('gone', load=100)])
+        table = aggregate([record('home', load=150), record('home', load=250),
+                           record('new', load=100)])
+        savings = load_savings(table, baseline)
+        assert savings == {'home': {'p50': 50, 'p95': 150}}
+        assert table['home']['load_savings'] == savings['home']
+        assert 'load_savings' not in table['new']
+
+    def test_slowdown_is_negative(self):
+        baseline = aggregate([record('home', load=100)])
+        table = aggregate([record('home', load=130)])
+        assert load_savings(table, baseline)['home']['p50'] == -30
+
+    def test_page_without_load_time(self):
+        baseline = aggregate([record('home', load=100)])
+        table = aggregate([record('home')])
+        assert load_savings(table, baseline) == {}
+
+
+class WriteAggregateTests(object):
+
+    def test_write_aggregate(self, tmp_path):
+        """
+            The records of every test case folder are aggregated, and the
+            savings are computed against a baseline metrics.json.
+
+            :return: None
+        """
+        for folder, loads in [('1_foo', [100, 120]), ('2_bar', [110])]:
+            path = tmp_path / folder / 'metrics' / page_metrics.METRICS_FILENAME
+            path.parent.mkdir(parents=True)
+            path.write_text(''.join(page_metrics.serialize_record(
+                record('home', load=load)) for load in loads) + '\n')
+        baseline = tmp_path / 'baseline.json'
+        baseline.write_text(json.dumps(aggregate([record('home', load=200)])))
+
+        table = page_metrics.write_aggregate(tmp_path, baseline=baseline)
+        assert table['home']['records'] == 3
+        assert table['home']['load_savings'] == {'p50': 90, 'p95': 80}
+        with open(tmp_path / 'metrics.json') as f:
+            assert json.load(f) == table
+        text = (tmp_path / 'metrics.txt').read_text()
+        assert 'nav.load' in text and 'load saved (ms)' in text
+
+    def test_unreadable_baseline(self, tmp_path):
+        path = tmp_path / '1_foo' / 'metrics' / page_metrics.METRICS_FILENAME
+        path.parent.mkdir(parents=True)
+        path.write_text(page_metrics.serialize_record(record('home', load=1)))
+        baseline = tmp_path / 'baseline.json'
+        baseline.write_text('not json')
+        table = page_metrics.write_aggregate(tmp_path, baseline=baseline)
+        assert 'load_savings' not in table['home']
+
+    def test_no_records(self, tmp_path):
+        assert page_metrics.write_aggregate(tmp_path) == {}
+        assert not (tmp_path / 'metrics.json').exists()
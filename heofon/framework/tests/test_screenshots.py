@@ -0,0 +1,39 @@
+import logging
+
+import pytest
+
+from heofon.framework.screenshots import ScreenshotSettings
+
+logger = logging.getLogger(__name__)
+
+
+class ScreenshotSettingsTests(object):
+
+    @pytest.mark.parametrize('quality', [0, 80, 100])
+    def test_quality(self, quality):
+        settings = ScreenshotSettings(image_format='jpeg', quality=quality)
+        assert settings.capture_options()['quality'] == quality
+
+    @pytest.mark.parametrize('quality', [-1, 101, 80.5, '80', None, True])
+    def test_invalid_quality(self, quality):
+        """
+            A quality Playwright would reject fails when the settings are
+            built, not in the middle of a test.
+
+            :param quality: an invalid jpeg quality
+            :return: None
+        """
+        with pytest.raises(ValueError):
+            ScreenshotSettings(image_format='jpeg', quality=quality)
+
+    @pytest.mark.parametrize('options', [{'image_format': 'gif'},
+                                         {'mode': 'element'}])
+    def test_invalid_format_and_mode(self, options):
+        with pytest.raises(ValueError):
+            ScreenshotSettings(**options)
+
+    def test_png_has_no_quality(self):
+        options = ScreenshotSettings(mode='viewport').capture_options()
+        assert options == {'type': 'png', 'full_page': False}
+        assert ScreenshotSettings().suffix == '.png'
+        assert ScreenshotSettings(image_format='jpeg').suffix == '.jpg'
@@ -0,0 +1,197 @@
+import logging
+
+import pytest
+
+from heofon.framework.state_delta import DeltaRecorder, apply_delta, \
+    apply_mutations, cookies_to_state, diff_state, iter_states, \
+    rebuild_state, serialize_entry
+
+logger = logging.getLogger(__name__)
+
+
+def storage_states(count):
+    """
+        A storage state per event: keys are added, changed and removed
+        along the way, and some events change nothing.
+
+        :param count: int, number of events
+        :return: list of dicts
+    """
+    states, state = [], {}
+    for event in range(count):
+        state = dict(state)
+        if event % 3 == 0:
+            state[f"key{event}"] = f"value{event}"
+        if event % 4 == 1:
+            state['counter'] = str(event)
+        if event % 5 == 4 and 'key0' in state:
+            del state['key0']
+        states.append(state)
+    return states
+
+
+def write_journal(path, stream, states, baseline_every):
+    """
+        Record `states`, one event each, and write the journal.
+
+        :return: dict, seq -> the state recorded at that event
+    """
+    recorder = DeltaRecorder(baseline_every=baseline_every)
+    recorded = {}
+    with open(path, 'w') as f:
+        for seq, state in enumerate(states, start=1):
+            entry = recorder.record(stream, state, seq,
+                                    event=f"event {seq}")
+            recorded[seq] = state
+            if entry is not None:
+                f.write(serialize_entry(entry))
+    return recorded
+
+
+class DiffStateTests(object):
+
+    def test_diff_and_apply(self):
+        old = {'a': 1, 'b': 2, 'c': 3}
+        new = {'a': 1, 'b': 20, 'd': 4}
+        delta = diff_state(old, new)
+        assert delta == {'added': {'d': 4}, 'removed': ['c'],
+                         'changed': {'b': 20}}
+        assert apply_delta(old, delta) == new
+        # the old state is left alone
+        assert old == {'a': 1, 'b': 2, 'c': 3}
+
+    def test_cookie_key_change(self):
+        """
+            A cookie whose path changes is a different cookie: the delta
+            removes the old one and adds the new one.
+
+            :return: None
+        """
+        cookie = {'name': 'session', 'domain': 'example.test', 'path': '/',
+                  'value': 'abc'}
+        moved = dict(cookie, path='/basket')
+        old, new = cookies_to_state([cookie]), cookies_to_state([moved])
+        delta = diff_state(old, new)
+        assert delta['removed'] == ['session|example.test|/']
+        assert delta['added'] == {'session|example.test|/basket': moved}
+        assert delta['changed'] == {}
+        assert apply_delta(old, delta) == new
+
+    def test_apply_mutations(self):
+        state = {'a': '1', 'b': '2'}
+        mutations = [{'op': 'set', 'key': 'c', 'value': '3'},
+                     {'op': 'remove', 'key': 'a'},
+                     {'op': 'remove', 'key': 'missing'},
+                     {'op': 'clear'},
+                     {'op': 'set', 'key': 'd', 'value': '4'}]
+        assert apply_mutations(state, mutations) == {'d': '4'}
+        assert state == {'a': '1', 'b': '2'}
+
+
+class DeltaRecorderTests(object):
+
+    def test_baseline_every_n_events(self):
+        recorder = DeltaRecorder(baseline_every=3)
+        kinds = []
+        for seq in range(1, 8):
+            entry = recorder.record('local', {'seq': str(seq)}, seq)
+            kinds.append(entry['kind'])
+        assert kinds == ['baseline', 'delta', 'delta', 'baseline', 'delta',
+                         'delta', 'baseline']
+
+    def test_unchanged_state_has_no_entry(self):
+        recorder = DeltaRecorder()
+        recorder.record('local', {'a': '1'}, 1)
+        assert recorder.record('local', {'a': '1'}, 2) is None
+        # unless writes happened in between
+        mutations = [{'op': 'set', 'key': 'a', 'value': '2'},
+                     {'op': 'set', 'key': 'a', 'value': '1'}]
+        entry = recorder.record('local', {'a': '1'}, 3, mutations=mutations)
+        assert entry['kind'] == 'delta'
+        assert entry['mutations'] == mutations
+
+    def test_streams_are_independent(self):
+        recorder = DeltaRecorder(baseline_every=2)
+        assert recorder.record('local', {}, 1)['kind'] == 'baseline'
+        assert recorder.record('cookies', {}, 2)['kind'] == 'baseline'
+        assert recorder.needs_baseline('local') is False
+        assert recorder.needs_baseline('session') is True
+
+    def test_apply_mutations(self):
+        recorder = DeltaRecorder()
+        recorder.record('local', {'a': '1'}, 1)
+        entry = recorder.apply_mutations(
+            'local', [{'op': 'set', 'key': 'b', 'value': '2'}], 2,
+            event='clicked')
+        assert entry['delta'] == {'added': {'b': '2'}, 'removed': [],
+                                  'changed': {}}
+        assert entry['event'] == 'clicked'
+
+    def test_apply_mutations_without_state(self):
+        with pytest.raises(ValueError):
+            DeltaRecorder().apply_mutations('local', [], 1)
+
+
+class RebuildStateTests(object):
+
+    @pytest.mark.parametrize('baseline_every', [1, 3, 10])
+    def test_round_trip(self, tmp_path, baseline_every):
+        """
+            The state rebuilt from the journal at any event is the state
+            that was recorded at that event.
+
+            :param baseline_every: int, events between full baselines
+            :return: None
+        """
+        path = tmp_path / 'local.jsonl'
+        recorded = write_journal(path, 'local', storage_states(25),
+                                 baseline_every)
+        for seq, state in recorded.items():
+            assert rebuild_state(path, seq) == state
+        assert rebuild_state(path) == recorded[25]
+
+    def test_cookies_round_trip(self, tmp_path):
+        cookie = {'name': 'session', 'domain': 'example.test', 'path': '/',
+                  'value': 'abc'}
+        snapshots = [[cookie],
+                     [dict(cookie, value='def')],
+                     [dict(cookie, value='def', path='/basket')],
+                     []]
+        path = tmp_path / 'cookies.jsonl'
+        recorded = write_journal(path, 'cookies',
+                                 [cookies_to_state(cookies)
+                                  for cookies in snapshots], 10)
+        for seq, state in recorded.items():
+            assert rebuild_state(path, seq) == state
+
+    def test_journal_from_a_later_baseline(self, tmp_path):
+        """
+            A journal whose start was not kept can still be read from its
+            first baseline on; events before it can't be rebuilt.
+
+            :return: None
+        """
+        path = tmp_path / 'local.jsonl'
+        recorded = write_journal(path, 'local', storage_states(12), 4)
+        lines = path.read_text().splitlines(keepends=True)
+        baselines = [index for index, line in enumerate(lines)
+                     if '"kind": "baseline"' in line]
+        assert len(baselines) == 3
+        # keep the end of the journal, from a few deltas before its second
+        # baseline
+        tail = tmp_path / 'tail.jsonl'
+        tail.write_text(''.join(lines[baselines[1] - 2:]))
+
+        replayed = list(iter_states(tail))
+        assert replayed[0][0]['kind'] == 'baseline'
+        first_seq = replayed[0][0]['seq']
+        for seq, state in recorded.items():
+            if seq < first_seq:
+                assert rebuild_state(tail, seq) is None
+            else:
+                assert rebuild_state(tail, seq) == state
+
+    def test_empty_journal(self, tmp_path):
+        path = tmp_path / 'local.jsonl'
+        path.write_text('')
+        assert rebuild_state(path) is None
@@ -0,0 +1,204 @@
+import logging
+
+import pytest
+
+from heofon.framework import visual
+
+np = pytest.importorskip('numpy')
+
+logger = logging.getLogger(__name__)
+
+
+def image(height=32, width=32, value=128):
+    """
+        :return: numpy array, a flat grey RGB image
+    """
+    return np.full((height, width, 3), value, dtype=np.uint8)
+
+
+def changed(base, x, y, width, height, delta=50):
+    """
+        :return: numpy array, a copy of `base` with a rectangle changed
+    """
+    other = base.copy()
+    other[y:y + height, x:x + width] += delta
+    return other
+
+
+class CompareArraysTests(object):
+
+    def test_identical(self):
+        result, mask = visual.compare_arrays(image(), image())
+        assert result['passed']
+        assert result['diff pixels'] == 0
+        assert result['changed blocks'] == 0
+        assert result['blocks'] == 4
+        assert not mask.any()
+
+    def test_pixel_tolerance(self):
+        """
+            A pixel differs when any one channel differs by more than the
+            tolerance.
+
+            :return: None
+        """
+        base = image()
+        within, over = base.copy(), base.copy()
+        within[0, 0] = (136, 120, 128)
+        over[0, 0, 2] = 137
+        result, _ = visual.compare_arrays(base, within, pixel_tolerance=8)
+        assert result['diff pixels'] == 0
+        result, mask = visual.compare_arrays(base, over, pixel_tolerance=8)
+        assert result['diff pixels'] == 1
+        assert mask[0, 0]
+
+    def test_difference_in_either_direction(self):
+        base = image()
+        darker = changed(base, 0, 0, 16, 16, delta=-50 % 256)
+        result, _ = visual.compare_arrays(base, darker)
+        assert result['diff pixels'] == 256
+        result, _ = visual.compare_arrays(darker, base)
+        assert result['diff pixels'] == 256
+
+    def test_changed_block(self):
+        base = image()
+        result, _ = visual.compare_arrays(base, changed(base, 20, 4, 8, 8))
+        assert not result['passed']
+        assert result['changed blocks'] == 1
+        assert result['changed area'] == [16, 0, 32, 16]
+        assert result['reason'] == '1 blocks changed (max 0)'
+
+    def test_max_changed_blocks(self):
+        base = image()
+        other = changed(base, 0, 0, 32, 8)
+        result, _ = visual.compare_arrays(base, other, max_changed_blocks=2)
+        assert result['changed blocks'] == 2
+        assert result['passed']
+        result, _ = visual.compare_arrays(base, other, max_changed_blocks=1)
+        assert not result['passed']
+
+    def test_block_threshold(self):
+        """
+            A block only counts as changed when more than the threshold
+            fraction of its pixels differ.
+
+            :return: None
+        """
+        base = image()
+        # 5 of a 16x16 block's 256 pixels: just under 2%
+        other = changed(base, 0, 0, 5, 1)
+        result, _ = visual.compare_arrays(base, other, block_threshold=0.02)
+        assert result['diff pixels'] == 5
+        assert result['changed blocks'] == 0
+        assert result['passed']
+        # 6 pixels: just over
+        other = changed(base, 0, 0, 6, 1)
+        result, _ = visual.compare_arrays(base, other, block_threshold=0.02)
+        assert result['changed blocks'] == 1
+
+    def test_ignore_regions(self):
+        base = image()
+        other = changed(base, 2, 2, 10, 10)
+        result, mask = visual.compare_arrays(base, other,
+                                             ignore_regions=[(0, 0, 12, 12)])
+        assert result['passed']
+        assert not mask.any()
+        # a region that covers part of the change
+        result, _ = visual.compare_arrays(base, other,
+                                          ignore_regions=[(0, 0, 7, 12)])
+        assert result['diff pixels'] == 50
+
+    def test_ignore_regions_with_negative_origin(self):
+        """
+            A region that starts above or left of the image covers only
+            the part inside it.
+
+            :return: None
+        """
+        base = image()
+        other = changed(base, 0, 0, 32, 32)
+        result, _ = visual.compare_arrays(base, other,
+                                          ignore_regions=[(-4, -4, 8, 8)])
+        assert result['diff pixels'] == 32 * 32 - 16
+
+    def test_ignore_regions_outside_the_image(self):
+        """
+            Regions entirely outside the image change nothing; in
+            particular, a negative end must not count from the far edge.
+
+            :return: None
+        """
+        base = image()
+        other = changed(base, 0, 0, 32, 32)
+        regions = [(-20, 0, 10, 32), (0, -20, 32, 10), (40, 0, 10, 32)]
+        result, _ = visual.compare_arrays(base, other,
+                                          ignore_regions=regions)
+        assert result['diff pixels'] == 32 * 32
+
+    def test_padding_at_the_edges(self):
+        """
+            An image that isn't a whole number of blocks is padded; the
+            partial blocks at the edges still count their changed pixels.
+
+            :return: None
+        """
+        base = image(height=20, width=40)
+        # the bottom right corner: a partial block of 8x4 pixels
+        other = changed(base, 36, 18, 4, 2)
+        result, _ = visual.compare_arrays(base, other)
+        assert result['blocks'] == 2 * 3
+        assert result['changed blocks'] == 1
+        assert result['changed area'] == [32, 16, 48, 32]
+        assert result['diff ratio'] == 8 / (20 * 40)
+
+    def test_size_change(self):
+        result, mask = visual.compare_arrays(image(32, 32), image(40, 32))
+        assert not result['passed']
+        assert result['reason'] == 'size changed from 32x32 to 32x40'
+        assert mask is None
+
+    def test_inputs_are_left_alone(self):
+        base = image()
+        other = changed(base, 0, 0, 8, 8)
+        copies = base.copy(), other.copy()
+        visual.compare_arrays(base, other)
+        assert (base == copies[0]).all()
+        assert (other == copies[1]).all()
+
+    def test_diff_mask_image(self):
+        actual = image(value=100)
+        mask = np.zeros((32, 32), dtype=bool)
+        mask[0, 0] = True
+        rendered = visual.diff_mask_image(actual, mask)
+        assert tuple(rendered[0, 0]) == (255, 0, 0)
+        assert tuple(rendered[1, 1]) == (30, 30, 30)
+
+
+class RunComparisonsTests(object):
+
+    def test_process_pool(self, tmp_path):
+        """
+            The jobs run in spawned worker processes, and the results come
+            back in the order of the jobs.
+
+            :return: None
+        """
+        Image = pytest.importorskip('PIL.Image')
+        base = image()
+        paths = {}
+        for name, array in [('baseline', base), ('same', base),
+                            ('different', changed(base, 0, 0, 16, 16))]:
+            paths[name] = tmp_path / f"{name}.png"
+            Image.fromarray(array).save(paths[name])
+
+        jobs = [visual.ComparisonJob('test_a', name, paths['baseline'],
+                                     paths[name], tmp_path / f"{name}-diff.png")
+                for name in ['same', 'different']]
+        jobs.append(visual.ComparisonJob('test_b', 'new', tmp_path / 'none.png',
+                                         paths['same'], tmp_path / 'x.png'))
+        results = visual.run_comparisons(jobs, workers=2)
+        assert [result['status'] for result in results] == \
+            ['passed', 'failed', 'missing baseline']
+        assert (tmp_path / 'different-diff.png').exists()
+        assert visual.summarize(results) == {'passed': 1, 'failed': 1,
+                                             'missing baseline': 1}
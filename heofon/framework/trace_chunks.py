@@ -0,0 +1,157 @@
+"""
+    Playwright tracing for a test case, in chunks.
+
+    With `--tracing=on`, a test records one trace for the whole test, and
+    writes it to the test case folder as trace.zip.
+
+    With `--tracing=retain-on-failure`, the trace is split into chunks with
+    tracing.start_chunk() / stop_chunk(), one per step of the test: a new
+    chunk starts each time RootPageObject.load_po() finishes a page
+    transition. When a step ends, its chunk is dropped without being written
+    (stop_chunk() without a path). If the test fails, only the chunk of the
+    failing step is written, as trace-<nnn>-<step>.zip.
+
+    With `chunks_kept` > 1, the chunks of the steps just before the failing
+    one are kept too. These have to be written as each step ends (to
+    `*.zip.pending` files), and are deleted when they fall out of the window
+    or when the test passes.
+"""
+import logging
+import os
+
+from heofon.framework import utils_file
+
+logger = logging.getLogger(__name__)
+
+TRACING_MODES = ['off', 'on', 'retain-on-failure']
+TRACE_FILENAME = 'trace.zip'
+PENDING_SUFFIX = '.pending'
+
+
+class TraceRecorder(object):
+    """
+        Record the Playwright trace for one test case.
+
+        :param context: Playwright BrowserContext instance
+        :param mode: str enum, 'on' or 'retain-on-failure'
+        :param folder: Path, the test case folder
+        :param chunks_kept: int, with 'retain-on-failure', the number of
+                            chunks written for a failure (the failing step's,
+                            and the ones just before it)
+        :param trace_filename: str, file name for the trace with 'on'
+    """
+
+    def __init__(self, context, mode, folder, chunks_kept=1,
+                 trace_filename=TRACE_FILENAME):
+        if mode not in TRACING_MODES[1:]:
+            msg = f"Unsupported tracing mode '{mode}'; " \
+                  f"expected one of {TRACING_MODES[1:]}."
+            logger.error(msg)
+            raise ValueError(msg)
+        self.context = context
+        self.mode = mode
+        self.folder = folder
+        self.chunks_kept = max(1, chunks_kept)
+        self.trace_filename = trace_filename
+        self._chunk = 0
+        self._title = None
+        # paths of the pending chunks from the steps before this one
+        self._pending = []
+        self.stats = {'chunks': 0, 'discarded': 0, 'written': 0}
+
+    @property
+    def chunked(self):
+        return self.mode == 'retain-on-failure'
+
+    def start(self):
+        """
+            Start tracing; call this before any test actions are taken.
+
+            :return: None
+        """
+        self.context.tracing.start(screenshots=True)
+        if self.chunked:
+            self._start_chunk('start')
+        logger.info(f"\nGenerating tracing content ({self.mode}).")
+
+    def step(self, event):
+        """
+            End the chunk for the step that just finished, and start the
+            chunk for the next one.
+
+            :param event: str, the event that ended the step, e.g.
+                          "loaded page 'sweetshop home page'"
+            :return: None
+        """
+        if not self.chunked:
+            return
+        self._end_chunk(keep=self.chunks_kept > 1)
+        self._start_chunk(f"after {event}")
+
+    def stop(self, failed):
+        """
+            Stop tracing, and write the trace (or the failing step's chunks).
+
+            :param failed: bool, whether the test failed
+            :return: list of str, paths of the trace files written
+        """
+        if not self.chunked:
+            path = str(self.folder / self.trace_filename)
+            self.context.tracing.stop(path=path)
+            logger.info(f"\nSaving tracing output: {path}.")
+            return [path]
+
+        written = []
+        if failed:
+            for pending in self._pending:
+                final = pending[:-len(PENDING_SUFFIX)]
+                os.replace(pending, final)
+                written.append(final)
+            written.append(self._end_chunk(keep=True, pending=False))
+        else:
+            for pending in self._pending:
+                _remove(pending)
+            self._end_chunk(keep=False)
+        self._pending = []
+        self.context.tracing.stop()
+        self.stats['written'] = len(written)
+        logger.info(f"\nTrace chunks: {self.stats}; written: {written}.")
+        return written
+
+    def _start_chunk(self, title):
+        self._chunk += 1
+        self._title = title
+        self.context.tracing.start_chunk(title=title)
+        self.stats['chunks'] += 1
+
+    def _end_chunk(self, keep, pending=True):
+        """
+            :param keep: bool, write the chunk; otherwise it is dropped
+                         without being written
+            :param pending: bool, write it as a pending chunk
+            :return: str, path of the chunk file, or None
+        """
+        if not keep:
+            self.context.tracing.stop_chunk()
+            self.stats['discarded'] += 1
+            return None
+
+        name = utils_file.path_proof_name(self._title)
+        path = str(self.folder / f"trace-{self._chunk:03d}-{name}.zip")
+        if pending:
+            path += PENDING_SUFFIX
+        self.context.tracing.stop_chunk(path=path)
+        if pending:
+            self._pending.append(path)
+            # only keep the steps just before the next one
+            while len(self._pending) > self.chunks_kept - 1:
+                _remove(self._pending.pop(0))
+                self.stats['discarded'] += 1
+        return path
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
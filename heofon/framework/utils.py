@@ -1,3 +1,4 @@
+import functools
 import logging
 import json
 import pathlib
@@ -6,7 +7,11 @@ from copy import deepcopy
 
 logger = logging.getLogger(__name__)
 
-def plog(content):
+# default size limit for lazy_plog() output, in characters
+LAZY_PLOG_MAX_CHARS = 20000
+
+
+def plog(content, max_chars=None, max_depth=None):
     """
         Format json content for pretty printing to the logger.
 
@@ -14,13 +19,22 @@ def plog(content):
         to format it appropriately.
 
         :param content: assumed to be json
+        :param max_chars: int, truncate the output to this many characters
+        :param max_depth: int, replace containers nested deeper than this
+                          with a '...' placeholder
         :return formatted_content:
 
         The typical usage will look like this:
         >>> from heofon.framework import utils
         >>> my_json = res.json()
         >>> logger.info(utils.plog.my_json)
+
+        To log without paying for the formatting unless the record is
+        actually emitted, use lazy_plog() with %-style logging args.
     """
+    if max_depth is not None:
+        content = _limit_depth(content, max_depth)
+
     # set a default pass-through value of an empty string in order
     # to catch None, because if a calling method tries to write()
     # the output of plog() will error out in the attempt.
@@ -31,16 +45,15 @@ def plog(content):
         # oops, this wasn't actually json
 
         # try pretty-printing based on the guessed content type
-        from requests.structures import CaseInsensitiveDict
-        import deepdiff
+        case_insensitive_dict, deep_diff = _optional_types()
 
         if isinstance(content, dict):
             formatted_content = pprint.pformat(content, indent=1, width=100)
         elif isinstance(content, list):
             formatted_content = pprint.pformat(content, indent=1, width=100)
-        elif isinstance(content, CaseInsensitiveDict):
+        elif case_insensitive_dict and isinstance(content, case_insensitive_dict):
             formatted_content = pprint.pformat(dict(content), indent=1, width=100)
-        elif isinstance(content, deepdiff.diff.DeepDiff):
+        elif deep_diff and isinstance(content, deep_diff):
             formatted_content = pprint.pformat(content, indent=1, width=160, depth=4)
         elif isinstance(content, bytes):
             # is this XML?
@@ -54,5 +67,100 @@ def plog(content):
                 logger.warning(msg)
                 pass
 
+    if max_chars is not None and len(formatted_content) > max_chars:
+        dropped = len(formatted_content) - max_chars
+        formatted_content = f"{formatted_content[:max_chars]}" \
+                            f"\n... [truncated {dropped} characters]"
+
     return formatted_content
 
+
+class LazyPlog(object):
+    """
+        A deferred plog(): the formatting only happens when the object is
+        converted to a string, which the logging module does when a handler
+        emits the record. Records that are filtered out by level never pay
+        for the json.dumps().
+
+        :param content: content to format, see plog()
+        :param max_chars: int, truncate the output to this many characters
+        :param max_depth: int, limit on the nesting depth of the output
+    """
+    __slots__ = ('content', 'max_chars', 'max_depth')
+
+    def __init__(self, content, max_chars=None, max_depth=None):
+        self.content = content
+        self.max_chars = max_chars
+        self.max_depth = max_depth
+
+    def __str__(self):
+        return plog(self.content, max_chars=self.max_chars,
+                    max_depth=self.max_depth)
+
+    def __repr__(self):
+        return f"<LazyPlog {type(self.content).__name__}>"
+
+
+def lazy_plog(content, max_chars=LAZY_PLOG_MAX_CHARS, max_depth=None):
+    """
+        Wrap `content` for deferred pretty printing in a log record.
+
+        This only saves time for records that are dropped by level: a record
+        that is emitted is formatted anyway, a little slower than with an
+        f-string. The framework logs at INFO by default, so the default
+        setup gets no speedup from it; raise the level to WARNING to skip
+        the formatting.
+
+        Pass the result as a %-style logging arg, not in an f-string (an
+        f-string would format it right away):
+        >>> logger.info('\\nbrowser interaction event:\\n%s',
+        ...             utils.lazy_plog(this_event))
+
+        :param content: content to format, see plog()
+        :param max_chars: int, truncate the output to this many characters;
+                          huge payloads are capped by default
+        :param max_depth: int, limit on the nesting depth of the output
+        :return: LazyPlog instance
+    """
+    return LazyPlog(content, max_chars=max_chars, max_depth=max_depth)
+
+
+@functools.lru_cache(maxsize=None)
+def _optional_types():
+    """
+        Import the non-json types that plog() knows how to format, once.
+
+        :return: tuple, CaseInsensitiveDict and DeepDiff classes (or None
+                 for each one that isn't installed)
+    """
+    try:
+        from requests.structures import CaseInsensitiveDict
+    except ImportError:
+        CaseInsensitiveDict = None
+    try:
+        from deepdiff import DeepDiff
+    except ImportError:
+        DeepDiff = None
+    return CaseInsensitiveDict, DeepDiff
+
+
+def _limit_depth(content, max_depth, depth=0):
+    """
+        Copy `content`, replacing dicts and lists nested deeper than
+        `max_depth` with a placeholder.
+
+        :param content: content to limit
+        :param max_depth: int, max nesting depth to keep
+        :param depth: int, current depth
+        :return: depth-limited copy of content
+    """
+    if isinstance(content, dict):
+        if depth >= max_depth:
+            return f"{{... {len(content)} keys}}"
+        return {k: _limit_depth(v, max_depth, depth + 1)
+                for k, v in content.items()}
+    if isinstance(content, (list, tuple)):
+        if depth >= max_depth:
+            return f"[... {len(content)} items]"
+        return [_limit_depth(v, max_depth, depth + 1) for v in content]
+    return content
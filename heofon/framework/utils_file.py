@@ -1,10 +1,9 @@
 import logging
 import json
 import pathlib
-import time
-import pytest
 
-from heofon.framework import utils
+from heofon.framework import utils, run_context, artifacts, state_delta
+from heofon.framework import network_capture
 
 logger = logging.getLogger(__name__)
 
@@ -31,6 +30,21 @@ def path_proof_name(name):
     return clean_name
 
 
+def test_key(nodeid):
+    """
+        Turn a pytest node id into a file or folder name that stays the
+        same across runs (unlike the numbered test case folders), e.g. for
+        visual baselines and network recordings.
+
+        :param nodeid: str, e.g. 'sweetshop/test_basket.py::BasketTests::test_add'
+        :return: str, e.g. 'sweetshop-test_basket.py--BasketTests--test_add'
+    """
+    key = nodeid.replace('::', '--').replace('/', '-')
+    for char in ' "\'<>:|?*':
+        key = key.replace(char, '_')
+    return key
+
+
 def create_test_output_folder(timestamped_name):
     """
         Every pytest invocation triggers a bunch of logging actions. During
@@ -83,57 +97,190 @@ def create_test_output_subfolder(path, folder):
     return folder_path
 
 
+def write_browser_state_to_files(state, current_url, pageobject_name, event):
+    """
+        Write a browser state snapshot to the cookies, webstorage and
+        console files for the current test case.
+
+        :param state: BrowserState snapshot from utils_playwright
+        :param current_url: str, url for the current page
+        :param pageobject_name: str, name for the current pageobject
+        :param event: str, descriptor for the event that triggered the snapshot
+        :return: None
+    """
+    write_cookies_to_file(state.cookies, current_url, fname=event)
+    write_console_log_to_file(log=state.console_log, url=current_url,
+                              fname=event, dropped=state.console_dropped)
+    write_webstorage_to_files(state.webstorage,
+                              current_url=current_url,
+                              pageobject_name=pageobject_name,
+                              event=event,
+                              mutations=state.storage_mutations)
+
+
+def submit_artifact(testcase, path, content, serializer=None, mode='w',
+                    snapshot=None):
+    """
+        Hand an artifact to the test case's artifact sink: the background
+        writer, or the test's flight recorder with the 'on-failure' capture
+        policy.
+
+        :param testcase: TestCaseContext for the current test case
+        :param path: Path or str, full path for the output file
+        :param content: the artifact; see artifacts.ArtifactWriter.submit()
+        :param serializer: callable that turns `content` into str or bytes
+        :param mode: str enum, 'w' to create/overwrite, 'a' to append
+        :param snapshot: key that groups artifacts captured for one event;
+                         only the flight recorder uses it
+        :return: None
+    """
+    if testcase.artifact_sink is None:
+        artifacts.get_writer().submit(path, content, serializer=serializer,
+                                      mode=mode, owner=testcase.name)
+    else:
+        testcase.artifact_sink.submit(path, content, serializer=serializer,
+                                      mode=mode, owner=testcase.name,
+                                      snapshot=snapshot)
+
+
+def sequenced_filename(testcase, name, suffix):
+    """
+        Build an artifact file name that starts with the test case's next
+        sequence number, so that files sort in capture order and two captures
+        never share (and silently append into) the same file.
+
+        :param testcase: TestCaseContext for the current test case
+        :param name: str, descriptive part of the file name
+        :param suffix: str, file name suffix including the dot, e.g. '.txt'
+        :return: str, e.g. '0007_loaded_page_sweetshop_home_page.txt'
+    """
+    return f"{testcase.next_sequence():04d}_{path_proof_name(name)}{suffix}"
+
+
 def write_cookies_to_file(cookies, url, fname=''):
     """
         Save cookies as json to a file.
 
+        The file is written by the background artifact writer.
+
         :param cookies: list of dicts
         :param url: str, url for the current page
-        :param fname: str, first part of filename, will be appended with
-                           timestamp; defaults to empty string
+        :param fname: str, last part of filename, will be prefixed with
+                           the artifact sequence number; defaults to empty string
         :return: None
     """
-    filename = f"{time.strftime('%H%M%S')}_{path_proof_name(fname)}.txt"
-    path = pytest.custom_namespace['current test case']['cookies folder'] / filename
-    with open(path, 'w') as f:
-        f.write(f"{url}\n")  # write the url as the first line
-        f.write(utils.plog(cookies))
-    logger.info(f"\nSaved cookies: {path}.")
+    testcase = run_context.current_testcase()
+    if testcase.delta_recorder is not None:
+        _write_journal_entry(testcase, testcase.next_sequence(), 'cookies',
+                             'cookies', state_delta.cookies_to_state(cookies),
+                             event=fname, page=url)
+        return
+
+    filename = sequenced_filename(testcase, fname, '.txt')
+    path = testcase.folder_for('cookies') / filename
+    submit_artifact(testcase, path, (url, cookies),
+                    serializer=_serialize_cookies)
+    logger.info(f"\nQueued cookies: {path}.")
+
+
+def _serialize_cookies(content):
+    url, cookies = content
+    # write the url as the first line
+    return f"{url}\n{utils.plog(cookies)}"
 
 
 def write_webstorage_to_files(data, current_url, pageobject_name,
-                              event):
+                              event, mutations=None):
     """
         Write the localStorage and sessionStorage content to a log file.
 
         Note 1: the data is a cleaned up representation of the json data;
                 however, the file is NOT json.
         Note 2: the timing of when the content is written may be significant.
+        Note 3: if the test captures deltas, only the changes since the last
+                event are appended to the `local.jsonl` and `session.jsonl`
+                journals instead. With `mutations` from the storage journal, a
+                storage dict can be None, and the mutations are applied to
+                the last recorded state.
 
         :param data: list, localStorage dict and sessionStorage dict
         :param current_url: str, url for the current page
         :param pageobject_name: str, name for the current pageobject
         :param event: str, descriptor for an interaction with the React app
+        :param mutations: dict, {'local': [...], 'session': [...]} writes
+                          drained from the storage journal
         :return: None
     """
-    base_filename = f"{time.strftime('%H%M%S')}_" \
-                    f"{path_proof_name(event)}"
-    path = pytest.custom_namespace['current test case']['webstorage folder'] / base_filename
+    testcase = run_context.current_testcase()
 
     # unpack the data
     local_storage, session_storage = data
 
+    if testcase.delta_recorder is not None:
+        seq = testcase.next_sequence()
+        for stream, storage in [('local', local_storage),
+                                ('session', session_storage)]:
+            _write_journal_entry(testcase, seq, 'webstorage', stream, storage,
+                                 event=event, page=current_url,
+                                 pageobject_name=pageobject_name,
+                                 mutations=(mutations or {}).get(stream))
+        return
+
+    base_filename = sequenced_filename(testcase, event, '')
+    path = testcase.folder_for('webstorage') / base_filename
+
     # write the local storage
     local_filename = f"{path}_local.json"
     _write_local_to_file(local_storage, event, pageobject_name,
-                         current_url, local_filename)
+                         current_url, local_filename, snapshot=base_filename)
 
     # write the session storage
     session_filename = f"{path}_session.json"
     _write_session_to_file(session_storage, event, pageobject_name,
-                           current_url, session_filename)
+                           current_url, session_filename,
+                           snapshot=base_filename)
 
-def _write_local_to_file(data, event, pageobject_name, source_url, output_url):
+
+def _write_journal_entry(testcase, seq, folder, stream, state, event, page,
+                         pageobject_name=None, mutations=None):
+    """
+        Record the state of a capture stream with the test's delta recorder,
+        and append the resulting baseline or delta to the stream's journal.
+
+        :param testcase: TestCaseContext for the current test case
+        :param seq: int, the artifact sequence number for this event
+        :param folder: str, kind of output folder, e.g. 'cookies'
+        :param stream: str, name of the stream and its journal, e.g. 'local'
+        :param state: dict, the full current state of the stream, or None
+                      to apply `mutations` to the last recorded state
+        :param event: str, descriptor for the event that triggered the capture
+        :param page: str, url for the current page
+        :param pageobject_name: str, name for the current pageobject
+        :param mutations: list of dicts, individual writes to the stream
+        :return: None
+    """
+    meta = {'event': event, 'page': page}
+    if pageobject_name:
+        meta['page object name'] = pageobject_name
+    recorder = testcase.delta_recorder
+    if state is None:
+        entry = recorder.apply_mutations(stream, mutations or [], seq, **meta)
+    else:
+        entry = recorder.record(stream, state, seq, mutations=mutations,
+                                **meta)
+    if entry is None:
+        logger.info(f"\nNo {stream} changes for '{event}'.")
+        return
+
+    path = testcase.folder_for(folder) / f"{stream}.jsonl"
+    submit_artifact(testcase, path, entry,
+                    serializer=state_delta.serialize_entry, mode='a',
+                    snapshot=seq)
+    logger.info(f"\nQueued {stream} {entry['kind']} for '{event}': {path}.")
+
+
+def _write_local_to_file(data, event, pageobject_name, source_url, output_url,
+                         snapshot=None):
     """
         Write the local storage to a json file in the webstorage folder.
 
@@ -144,20 +291,17 @@ def _write_local_to_file(data, event, pageobject_name, source_url, output_url):
         :param pageobject_name: str, name of pageobject
         :param source_url: str, full url of the page that generated the logs
         :param output_url: str, full local path for the output file
+        :param snapshot: key that groups this file with the session storage
+                         file for the same event
         :return: None
     """
-    # add key/value for the page url
-    data.update({'_storage type': 'local'})
-    data.update({'_page': source_url})
-    data.update({'_page object name': pageobject_name})
-    data.update({'_precipitating event': event})
-
-    with open(output_url, 'a') as f:
-        f.write(utils.plog(data))
-    logger.info(f"Saved local storage log: {output_url}.")
+    _write_storage_to_file(data, 'local', event, pageobject_name,
+                           source_url, output_url, snapshot)
+    logger.info(f"Queued local storage log: {output_url}.")
 
 
-def _write_session_to_file(data, event, pageobject_name, source_url, output_url):
+def _write_session_to_file(data, event, pageobject_name, source_url,
+                           output_url, snapshot=None):
     """
         Write the session storage to a json file in the webstorage folder.
 
@@ -168,38 +312,108 @@ def _write_session_to_file(data, event, pageobject_name, source_url, output_url)
         :param pageobject_name: str, name of pageobject
         :param source_url: str, full url of the page that generated the logs
         :param output_url: str, full local path for the output file
+        :param snapshot: key that groups this file with the local storage
+                         file for the same event
         :return: None
     """
-    # add key/value for the page url
-    data.update({'_storage type': 'session'})
-    data.update({'_page': source_url})
-    data.update({'_page object name': pageobject_name})
-    data.update({'_precipitating event': event})
+    _write_storage_to_file(data, 'session', event, pageobject_name,
+                           source_url, output_url, snapshot)
+    logger.info(f"Queued session storage log: {output_url}.")
 
-    with open(output_url, 'a') as f:
-        f.write(utils.plog(data))
-    logger.info(f"Saved session storage log: {output_url}.")
 
+def _write_storage_to_file(data, storage_type, event, pageobject_name,
+                           source_url, output_url, snapshot=None):
+    # add heofon key/values to a copy, so the caller's dict is left alone
+    content = dict(data)
+    content.update({'_storage type': storage_type})
+    content.update({'_page': source_url})
+    content.update({'_page object name': pageobject_name})
+    content.update({'_precipitating event': event})
 
-def write_console_log_to_file(log, url, fname=''):
+    submit_artifact(run_context.current_testcase(), output_url, content,
+                    serializer=utils.plog, snapshot=snapshot)
+
+
+def write_console_log_to_file(log, url, fname='', dropped=0):
     """
-        Write the chrome devtools console logs to a file.
+        Write the console messages, page errors and failed requests recorded
+        since the last write to a file.
 
-        :param log: dict
+        :param log: list of console messages
         :param url: str, url for the current page
-        :param fname: str, first part of filename, will be appended with
-                           timestamp; defaults to empty string
+        :param fname: str, last part of filename, will be prefixed with
+                           the artifact sequence number; defaults to empty string
+        :param dropped: int, number of messages lost to the recorder's buffer
+                        since the last write
         :return: None
     """
-    filename = f"{time.strftime('%H%M%S')}_{path_proof_name(fname)}.json"
-    path = pytest.custom_namespace['current test case']['console folder'] / filename
+    testcase = run_context.current_testcase()
+    filename = sequenced_filename(testcase, fname, '.json')
+    path = testcase.folder_for('console') / filename
+
+    content = [f"_page: {url}"]
+    if dropped:
+        content.append(f"_dropped: {dropped}")
+    content.extend(log)
+    logger.info("\nconsole logs: %s.", utils.lazy_plog(content))
+
+    submit_artifact(testcase, path, content, serializer=utils.plog)
+    logger.info(f"\nQueued console logs (and bad headers): {path}.")
+
+
+def write_screenshot_to_file(image, name, suffix='.png', serializer=None):
+    """
+        Write a screenshot image to the screenshots folder.
+
+        :param image: bytes, the encoded image, or an object that `serializer`
+                      turns into bytes (e.g. a screenshots.EncodeJob)
+        :param name: str, last part of filename, will be prefixed with
+                          the artifact sequence number
+        :param suffix: str, file name suffix for the image type
+        :param serializer: callable that turns `image` into bytes, on the
+                           artifact writer's thread
+        :return path: Path to the screenshot file
+    """
+    testcase = run_context.current_testcase()
+    filename = sequenced_filename(testcase, name, suffix)
+    path = testcase.folder_for('screenshots') / filename
+    submit_artifact(testcase, path, image, serializer=serializer)
+    logger.info(f"\nQueued screenshot: {path}.")
+    return path
 
-    log.insert(0, f"_page: {url}")
-    logger.info(f"\nconsole logs: {utils.plog(log)}.")
 
-    # # add key/value for the page url
-    # log.update({'_page': url})
+def write_network_to_file(chunk):
+    """
+        Append the requests of one page transition to the test's network
+        file, as one compact line of columns.
 
-    with open(path, 'a') as f:
-        f.write(utils.plog(log))
-    logger.info(f"\nSaved console logs (and bad headers): {path}.")
+        :param chunk: network_capture.NetworkChunk
+        :return path: Path to the network file
+    """
+    testcase = run_context.current_testcase()
+    path = testcase.folder_for('network') / network_capture.NETWORK_FILENAME
+    submit_artifact(testcase, path, chunk,
+                    serializer=network_capture.serialize_chunk, mode='a')
+    logger.info(f"\nQueued network requests for '{chunk.event}': {path}.")
+    return path
+
+
+def write_visual_check_to_file(image, name):
+    """
+        Write the screenshot for a visual check to the visual folder.
+
+        Unlike the other artifacts, this always goes straight to the artifact
+        writer, whatever the capture policy: the comparison at the end of
+        the session needs the file.
+
+        :param image: bytes, the png image
+        :param name: str, last part of filename, will be prefixed with
+                          the artifact sequence number
+        :return path: Path to the screenshot file
+    """
+    testcase = run_context.current_testcase()
+    filename = sequenced_filename(testcase, name, '.png')
+    path = testcase.folder_for('visual') / filename
+    artifacts.get_writer().submit(path, image, owner=testcase.name)
+    logger.info(f"\nQueued visual check screenshot: {path}.")
+    return path
@@ -1,34 +1,158 @@
 import logging
+import time
 
-from heofon.framework import utils_webstorage
+from heofon.framework import storage_journal, utils_webstorage
 
 logger = logging.getLogger(__name__)
 
-
-def get_console_log(pwpage):
+# One script that reads the storage for a snapshot, so that it costs a
+# single evaluate() round trip. Reading storage throws on
+# opaque origins (e.g. the 'data:,' boot page), so each area is guarded.
+#
+# With `options` from StorageJournal.drain_options(), the new mutations are
+# drained from the in-page storage journal instead, and the storage is only
+# scanned when the journal can't be trusted (see storage_journal).
+BROWSER_STATE_SCRIPT = """(options) => {
+    const dump = (getArea) => {
+        try {
+            const area = getArea();
+            const items = {};
+            for (let i = 0; i < area.length; i++) {
+                const key = area.key(i);
+                items[key] = area.getItem(key);
+            }
+            return items;
+        } catch (e) {
+            return {};
+        }
+    };
+    const content = {
+        url: window.location.href,
+        local: null,
+        session: null
+    };
+    let scan = true;
+    if (options) {
+        const journal = window[options.journal];
+        const drained = {doc: null, entries: [], dropped: 0, scanned: true};
+        if (journal) {
+            drained.doc = journal.doc;
+            drained.entries = journal.entries;
+            drained.dropped = journal.dropped;
+            journal.entries = [];
+            journal.dropped = 0;
+            scan = options.scan || journal.doc !== options.doc ||
+                drained.dropped > 0;
+        }
+        drained.scanned = scan;
+        content.journal = drained;
+    }
+    if (scan) {
+        content.local = dump(() => window.localStorage);
+        content.session = dump(() => window.sessionStorage);
+    }
+    return content;
+}"""
+
+
+class BrowserState(object):
+    """
+        A snapshot of the browser state for the current page: cookies,
+        local and session storage, and the console log.
+
+        When the snapshot was taken from the storage journal, the storage
+        dicts are None unless the storage was scanned, and the individual
+        writes since the last snapshot are in `storage_mutations`.
+
+        :param url: str, url of the page when the snapshot was taken
+        :param cookies: list of dicts, the context's cookies
+        :param local_storage: dict, converted localStorage content
+        :param session_storage: dict, converted sessionStorage content
+        :param console_log: list, console messages
+        :param console_dropped: int, number of console messages dropped from
+                                the recorder's buffer before this snapshot
+        :param storage_mutations: dict, {'local': [...], 'session': [...]}
+                                  mutations drained from the storage journal
     """
-        Get the current state of the browser console log.
+    def __init__(self, url, cookies, local_storage, session_storage,
+                 console_log, console_dropped=0, storage_mutations=None):
+        self.timestamp = time.time()
+        self.url = url
+        self.cookies = cookies
+        self.local_storage = local_storage
+        self.session_storage = session_storage
+        self.console_log = console_log
+        self.console_dropped = console_dropped
+        self.storage_mutations = storage_mutations
+
+    @property
+    def webstorage(self):
+        """
+            :return: tuple of local storage dict and session storage dict
+        """
+        return self.local_storage, self.session_storage
+
+
+def get_browser_state(pwpage, journal=None, scan=False, console=None):
+    """
+        Take a snapshot of the browser state for the current page.
 
-        NOTE: this doesn't actually work yet.
+        Local storage and session storage are collected in a single
+        evaluate() call; the cookies come from the context, because they are
+        not all visible to page scripts. The console log comes from the
+        page's console recorder, if there is one.
 
         :param pwpage: playwright page instance
-        :return content: dict
+        :param journal: storage_journal.StorageJournal, to drain the storage
+                        mutations instead of scanning the storage
+        :param scan: bool, with a journal, scan the storage anyway
+        :param console: console_capture.ConsoleRecorder for the page
+        :return state: BrowserState instance
+    """
+    options = journal.drain_options(scan=scan) if journal else None
+    content = pwpage.evaluate(BROWSER_STATE_SCRIPT, options)
+    cookies = pwpage.context.cookies()
+
+    storage_mutations = None
+    if journal:
+        journal.update(content['journal'])
+        storage_mutations = storage_journal.mutations_by_area(
+            content['journal']['entries'])
+
+    console_log, console_dropped = [], 0
+    if console:
+        console_log, console_dropped = get_console_log(console)
+
+    local_storage, session_storage = None, None
+    if content['local'] is not None:
+        local_storage = utils_webstorage.convert_web_storage_data_to_dict(
+            content['local'], source='local')
+        session_storage = utils_webstorage.convert_web_storage_data_to_dict(
+            content['session'], source='session')
+
+    return BrowserState(
+        url=content['url'],
+        cookies=cookies,
+        local_storage=local_storage,
+        session_storage=session_storage,
+        console_log=console_log,
+        console_dropped=console_dropped,
+        storage_mutations=storage_mutations)
+
+
+def get_console_log(recorder):
     """
+        Get the console messages, page errors and failed requests recorded
+        since the last call.
 
-    script = """() => {
-    if (console.history) {
-        return console.history.map(msg => ({
-            type: msg.level,
-            text: msg.args.join(' ')
-        }));
-    } else {
-        return [];
-        }
-    }"""
+        The console can't be read back from the page, so it is recorded as
+        it happens, by a console_capture.ConsoleRecorder attached to the page.
 
-    # run the script
-    content = pwpage.evaluate(script)
-    return content
+        :param recorder: console_capture.ConsoleRecorder for the page
+        :return content: tuple, (list of message dicts, int number of
+                         messages dropped since the last call)
+    """
+    return recorder.drain()
 
 
 def get_local_storage(pwpage):
@@ -1,12 +1,30 @@
-from copy import deepcopy
 import json
 import logging
 
-
 logger = logging.getLogger(__name__)
 
+# Use a faster json backend when one is installed; orjson.JSONDecodeError
+# is a subclass of ValueError, just like json.JSONDecodeError.
+try:
+    import orjson
+    _json_loads = orjson.loads
+    JSON_BACKEND = 'orjson'
+except ImportError:
+    _json_loads = json.loads
+    JSON_BACKEND = 'json'
+
+# the characters a json document can start with (after whitespace), other
+# than the non-standard NaN/Infinity literals
+_JSON_START = frozenset('{["-0123456789tfn')
+_WHITESPACE = ' \t\n\r'
+
+# how deep to keep json-loading values: 1 loads the top-level values,
+# 2 also loads the values of the dicts those turn into, and so on
+DEFAULT_MAX_DEPTH = 2
+
 
-def convert_web_storage_data_to_dict(content, source, verbose=False):
+def convert_web_storage_data_to_dict(content, source, verbose=False,
+                                     max_depth=DEFAULT_MAX_DEPTH):
     """
         Window sessionStorage consists of string keys and string values.
 
@@ -15,44 +33,89 @@ def convert_web_storage_data_to_dict(content, source, verbose=False):
 
         Keys are single quoted, and are kept as-is. Values, however,
         need to be cleaned up. Loop over values and loads as json; if the
-        result is a dict, json-load *that* too.
+        result is a dict, json-load *that* too, down to `max_depth` levels.
+
+        The input is never modified, so there is no need to copy it. A value
+        is only handed to the json parser if its first character could start
+        a json document, so plain strings don't cost a failed parse.
 
         :param content: dict, returned from window.sessionContent
         :param source: str enum, 'local' or 'session'
         :param verbose: bool, whether to output additional logging
+        :param max_depth: int, number of levels of values to json-load
         :return new_content: dict, cleaned up data structure
     """
     # container for "cleaned" keys and values
     new_content = {}
 
-    # use a deepcopy to avoid side effects
-    old_content = deepcopy(content)
-
-    def _to_json(data):
-        try:
-            jdata = json.loads(data)
-            return jdata
-        except TypeError:
-            # if it's not a string, that's ok; return the original value
-            return data
-        except json.decoder.JSONDecodeError:
-            # if it's a string but not a dict, that's ok; return original value
-            return data
-
     # iterate over the top-level keys
-    for k1, v1 in old_content.items():
+    for key, value in content.items():
         if verbose:
-            logger.info(f"--->> {k1}, {v1}")
-        first_data = _to_json(v1)
-        new_content[k1] = first_data
-        if isinstance(first_data, dict):
-            # iterate over the 2nd-tier keys
-            for k2, v2 in first_data.items():
-                if verbose:
-                    logger.info(f"--->> {k2}, {v2}")
-                second_data = _to_json(v2)
-                new_content[k1][k2] = second_data
+            logger.info(f"--->> {key}, {value}")
+        new_content[key] = _convert(value, 1, max_depth, verbose)
 
     if verbose:
         logger.info(f"\n{source}Storage data converted to dict.")
     return new_content
+
+
+def convert_web_storage_value(value, max_depth=DEFAULT_MAX_DEPTH):
+    """
+        Clean up a single web storage value, the same way
+        convert_web_storage_data_to_dict() cleans up each value.
+
+        :param value: str, a storage value
+        :param max_depth: int, number of levels of values to json-load
+        :return: the converted value
+    """
+    return _convert(value, 1, max_depth, False)
+
+
+def _convert(value, depth, max_depth, verbose):
+    """
+        Json-load `value` if it looks like json, and keep going into the
+        values of the resulting dict until `max_depth`.
+
+        :param value: a storage value, or a value inside a loaded one
+        :param depth: int, the level of `value`
+        :param max_depth: int, number of levels of values to json-load
+        :param verbose: bool, whether to output additional logging
+        :return: the converted value, or the original one
+    """
+    data = _to_json(value)
+    if depth < max_depth and isinstance(data, dict):
+        converted = {}
+        for key, child in data.items():
+            if verbose:
+                logger.info(f"--->> {key}, {child}")
+            converted[key] = _convert(child, depth + 1, max_depth, verbose)
+        return converted
+    return data
+
+
+def _to_json(data):
+    """
+        Json-load `data` if it is a string that looks like json.
+
+        :param data: value to load
+        :return: the loaded value, or `data` itself if it isn't json
+    """
+    if not isinstance(data, str) or not data:
+        # if it's not a string, that's ok; return the original value
+        return data
+
+    first = data[0]
+    if first in _WHITESPACE:
+        stripped = data.lstrip(_WHITESPACE)
+        if not stripped:
+            return data
+        first = stripped[0]
+    if first not in _JSON_START:
+        # it can't be json, so don't pay for a failed parse
+        return data
+
+    try:
+        return _json_loads(data)
+    except ValueError:
+        # if it's a string but not json, that's ok; return original value
+        return data
@@ -0,0 +1,358 @@
+"""
+    Visual regression checks for page object screenshots.
+
+    A test calls RootPageObject.check_visual() to compare the current page
+    against its baseline. The check itself is cheap: the screenshot is
+    written to the test's visual folder, and a ComparisonJob is queued.
+    At the end of the session all the queued jobs are run in a process pool
+    (see run_comparisons()), so the comparisons don't slow the tests down.
+
+    Baselines live in a BaselineStore, keyed by test and by page object name:
+        <baselines root>/<test key>/<page object name>.png
+
+    The comparison (compare_arrays()) works on decoded RGB arrays, with
+    vectorized NumPy operations:
+    + per-pixel: a pixel differs when any channel differs by more than
+      `pixel_tolerance`
+    + ignore regions: rectangles (x, y, width, height) that are masked out,
+      e.g. for clocks, ads or carousels
+    + block-level: the diff mask is summed over `block_size` square blocks,
+      and a block counts as changed when more than `block_threshold` of its
+      pixels differ; this keeps antialiasing noise from failing a check
+    + the check passes when no more than `max_changed_blocks` blocks changed
+
+    For a failed check, a diff-mask image is written next to the screenshot:
+    the current image, dimmed, with the differing pixels in red.
+
+    NumPy and Pillow are optional dependencies, only needed for visual checks.
+"""
+import concurrent.futures
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+
+from heofon.framework import utils_file
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PIXEL_TOLERANCE = 8
+DEFAULT_BLOCK_SIZE = 16
+DEFAULT_BLOCK_THRESHOLD = 0.02
+DEFAULT_MAX_CHANGED_BLOCKS = 0
+
+# comparisons queued by the tests in this process, run at session end
+_jobs = []
+# session settings, see configure()
+_settings = {'store': None, 'update': False, 'options': {}}
+
+
+def require_engine():
+    """
+        Fail early if the comparison engine's dependencies are missing.
+
+        :return: None
+    """
+    missing = [name for name, module in [('numpy', np), ('Pillow', Image)]
+               if module is None]
+    if missing:
+        msg = f"Visual checks need {' and '.join(missing)}; install them " \
+              f"to use check_visual()."
+        logger.error(msg)
+        raise ImportError(msg)
+
+
+class BaselineStore(object):
+    """
+        Baseline images, keyed by test and page object name.
+
+        :param root: Path, folder that holds the baselines
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def path_for(self, nodeid, name):
+        """
+            :param nodeid: str, pytest node id of the test
+            :param name: str, page object name (or other check name)
+            :return: Path to the baseline image
+        """
+        filename = name.replace('/', '-').replace(' ', '_')
+        return self.root / utils_file.test_key(nodeid) / f"{filename}.png"
+
+
+def configure(baselines_root, update=False, **options):
+    """
+        Set up visual checks for the session.
+
+        :param baselines_root: Path, folder that holds the baselines
+        :param update: bool, replace the baselines with the new screenshots
+        :param options: dict, keyword arguments for compare_arrays()
+        :return: None
+    """
+    _settings['store'] = BaselineStore(baselines_root)
+    _settings['update'] = update
+    _settings['options'] = options
+
+
+def settings():
+    """
+        :return: dict, with the session's BaselineStore ('store'), 'update'
+                 flag and compare_arrays() 'options'
+    """
+    if _settings['store'] is None:
+        msg = "Visual checks are not configured for this session."
+        logger.error(msg)
+        raise RuntimeError(msg)
+    return _settings
+
+
+class ComparisonJob(object):
+    """
+        One visual check, to be run at the end of the session.
+
+        :param nodeid: str, pytest node id of the test
+        :param name: str, page object name (or other check name)
+        :param baseline: str, path to the baseline image
+        :param actual: str, path to the screenshot to check
+        :param diff: str, path for the diff-mask image
+        :param ignore_regions: list of (x, y, width, height) tuples
+        :param update: bool, replace the baseline with the screenshot
+        :param options: dict, keyword arguments for compare_arrays()
+    """
+
+    def __init__(self, nodeid, name, baseline, actual, diff,
+                 ignore_regions=None, update=False, **options):
+        self.nodeid = nodeid
+        self.name = name
+        self.baseline = str(baseline)
+        self.actual = str(actual)
+        self.diff = str(diff)
+        self.ignore_regions = list(ignore_regions or [])
+        self.update = update
+        self.options = options
+
+
+def queue_comparison(job):
+    """
+        :param job: ComparisonJob
+        :return: None
+    """
+    _jobs.append(job)
+
+
+def take_jobs():
+    """
+        Take the queued comparison jobs.
+
+        :return: list of ComparisonJob
+    """
+    jobs = list(_jobs)
+    del _jobs[:]
+    return jobs
+
+
+def load_image(path):
+    """
+        :param path: str, path to an image file
+        :return: numpy array, height x width x 3, uint8
+    """
+    with Image.open(path) as image:
+        return np.asarray(image.convert('RGB'))
+
+
+def compare_arrays(baseline, actual, pixel_tolerance=DEFAULT_PIXEL_TOLERANCE,
+                   block_size=DEFAULT_BLOCK_SIZE,
+                   block_threshold=DEFAULT_BLOCK_THRESHOLD,
+                   max_changed_blocks=DEFAULT_MAX_CHANGED_BLOCKS,
+                   ignore_regions=None):
+    """
+        Compare two RGB images.
+
+        :param baseline: numpy array, height x width x 3
+        :param actual: numpy array, height x width x 3
+        :param pixel_tolerance: int, max per-channel difference for a pixel
+                                to count as unchanged
+        :param block_size: int, side of the square blocks, in pixels
+        :param block_threshold: float, fraction of a block's pixels that must
+                                differ for the block to count as changed
+        :param max_changed_blocks: int, max number of changed blocks for the
+                                   check to pass
+        :param ignore_regions: list of (x, y, width, height) tuples
+        :return: tuple, (result dict, diff mask: bool array height x width,
+                 or None if the sizes differ)
+    """
+    if baseline.shape != actual.shape:
+        result = {'passed': False,
+                  'reason': f"size changed from {baseline.shape[1]}x"
+                            f"{baseline.shape[0]} to {actual.shape[1]}x"
+                            f"{actual.shape[0]}"}
+        return result, None
+
+    # per-pixel: the largest channel difference, against the tolerance;
+    # max - min stays in uint8 (no wider copies of the image), and the
+    # channels are combined with element-wise maximum, which is much faster
+    # than a reduction over the last (3 wide) axis
+    difference = np.maximum(baseline, actual)
+    difference -= np.minimum(baseline, actual)
+    mask = np.maximum(np.maximum(difference[..., 0], difference[..., 1]),
+                      difference[..., 2]) > pixel_tolerance
+    for x, y, width, height in ignore_regions or []:
+        # clip to the image: a negative slice end would count from the end
+        mask[max(0, y):max(0, y + height), max(0, x):max(0, x + width)] = False
+
+    # block-level: pad the mask to whole blocks, then count per block
+    height, width = mask.shape
+    rows = -(-height // block_size)
+    columns = -(-width // block_size)
+    padded = np.zeros((rows * block_size, columns * block_size), dtype=bool)
+    padded[:height, :width] = mask
+    per_block = padded.reshape(rows, block_size, columns, block_size) \
+        .sum(axis=(1, 3))
+    changed_blocks = per_block > block_threshold * block_size * block_size
+
+    diff_pixels = int(mask.sum())
+    changed = int(changed_blocks.sum())
+    result = {'passed': changed <= max_changed_blocks,
+              'diff pixels': diff_pixels,
+              'diff ratio': diff_pixels / mask.size,
+              'changed blocks': changed,
+              'blocks': int(changed_blocks.size)}
+    if changed:
+        ys, xs = np.nonzero(changed_blocks)
+        result['changed area'] = [int(xs.min()) * block_size,
+                                  int(ys.min()) * block_size,
+                                  int(xs.max() + 1) * block_size,
+                                  int(ys.max() + 1) * block_size]
+    if not result['passed']:
+        result['reason'] = f"{changed} blocks changed " \
+                           f"(max {max_changed_blocks})"
+    return result, mask
+
+
+def diff_mask_image(actual, mask):
+    """
+        Render a diff mask: the image dimmed, with the differing pixels red.
+
+        :param actual: numpy array, height x width x 3
+        :param mask: bool array, height x width
+        :return: numpy array, height x width x 3, uint8
+    """
+    image = (actual.astype(np.uint16) * 3 // 10).astype(np.uint8)
+    image[mask] = (255, 0, 0)
+    return image
+
+
+def run_job(job):
+    """
+        Run one comparison; this is what the process pool workers run.
+
+        :param job: ComparisonJob
+        :return: dict, result of the comparison
+    """
+    result = {'test': job.nodeid, 'name': job.name, 'actual': job.actual,
+              'baseline': job.baseline}
+    try:
+        if job.update or not os.path.exists(job.baseline):
+            if not job.update:
+                result.update({'passed': None, 'status': 'missing baseline'})
+                return result
+            os.makedirs(os.path.dirname(job.baseline), exist_ok=True)
+            shutil.copyfile(job.actual, job.baseline)
+            result.update({'passed': None, 'status': 'baseline updated'})
+            return result
+
+        baseline = load_image(job.baseline)
+        actual = load_image(job.actual)
+        comparison, mask = compare_arrays(baseline, actual,
+                                          ignore_regions=job.ignore_regions,
+                                          **job.options)
+        result.update(comparison)
+        result['status'] = 'passed' if comparison['passed'] else 'failed'
+        if not comparison['passed'] and mask is not None:
+            # fast png compression; the diff is a debugging aid
+            Image.fromarray(diff_mask_image(actual, mask)).save(
+                job.diff, compress_level=1)
+            result['diff'] = job.diff
+    except Exception as e:
+        result.update({'passed': False, 'status': 'error',
+                       'reason': f"{type(e).__name__}: {e}"})
+    return result
+
+
+def summarize(results):
+    """
+        :param results: list of result dicts from run_job()
+        :return: dict, count of results per status
+    """
+    summary = {}
+    for result in results:
+        summary[result['status']] = summary.get(result['status'], 0) + 1
+    return summary
+
+
+def write_report(results, path):
+    """
+        :param results: list of result dicts from run_job()
+        :param path: Path for the json report
+        :return: None
+    """
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=4)
+    logger.info(f"\nWrote visual check report: {path}.")
+
+
+def read_reports(folder, report_name):
+    """
+        Read the reports written by write_report(): `report_name` itself,
+        and the per-worker `<stem>-<worker>.<suffix>` ones.
+
+        :param folder: Path, folder that holds the reports
+        :param report_name: str, e.g. 'visual.json'
+        :return: list of result dicts
+    """
+    stem, _, suffix = report_name.rpartition('.')
+    paths = [folder / report_name] + sorted(folder.glob(f"{stem}-*.{suffix}"))
+    results = []
+    for path in paths:
+        if path.exists():
+            with open(path) as f:
+                results.extend(json.load(f))
+    return results
+
+
+def run_comparisons(jobs, workers=None):
+    """
+        Run comparison jobs in a process pool.
+
+        The workers are spawned, not forked: the test process has other
+        threads running (the log listener, the artifact writer), and a
+        forked child could inherit a lock one of them holds.
+
+        :param jobs: list of ComparisonJob
+        :param workers: int, number of worker processes; defaults to the
+                        number of CPUs; 1 runs the jobs in this process
+        :return: list of result dicts, in the order of `jobs`
+    """
+    if not jobs:
+        return []
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(jobs) == 1:
+        return [run_job(job) for job in jobs]
+    chunksize = max(1, len(jobs) // (workers * 4))
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn')) as pool:
+        return list(pool.map(run_job, jobs, chunksize=chunksize))
@@ -1,10 +1,17 @@
+import functools
 import logging
 import pytest
 import time
 import sys
 from pathlib import Path
 
-from heofon.framework import utils, utils_file
+from heofon.framework import utils, utils_file, run_context, routing, artifacts
+from heofon.framework import log_routing, state_delta, storage_journal
+from heofon.framework import console_capture, trace_chunks, screenshots
+from heofon.framework import visual, page_metrics, network_capture
+from heofon.framework import asset_cache, har_mode, acceleration
+from heofon.framework.exceptions import RoutingException
+from heofon.framework.browser_pool import BrowserPool, launch_browser
 
 logger = logging.getLogger(__name__)
 
@@ -14,10 +21,31 @@ TESTRUN_LOGFILE_NAME = 'runlog.txt'
 TESTRUN_HTML_REPORT = 'report.html'
 TESTCASE_LOGFILE_NAME = 'testlog.txt'
 TESTCASE_PLAYWRIGHT_TRACING = 'trace.zip'
+VISUAL_REPORT_NAME = 'visual.json'
 
-# hacky global counter for iterating over collected
-# tests in pytest_runtest_setup()
-COUNT = 1
+# per-item storage for the collection-order number and the run context
+COLLECTION_INDEX = pytest.StashKey[int]()
+TESTCASE_CONTEXT = pytest.StashKey[run_context.TestCaseContext]()
+TESTCASE_TOKEN = pytest.StashKey[object]()
+LOG_ROUTE_TOKEN = pytest.StashKey[object]()
+DRY_RUN = pytest.StashKey[bool]()
+TESTCASE_FAILED = pytest.StashKey[bool]()
+VISUAL_SUMMARY = pytest.StashKey[dict]()
+PAGE_METRICS_TABLE = pytest.StashKey[dict]()
+
+# config.option attributes for invocations that collect, but don't run,
+# the tests: --collect-only, --setup-plan, --fixtures,
+# --fixtures-per-test, --markers
+DRY_RUN_OPTIONS = ['collectonly', 'setupplan', 'showfixtures',
+                   'show_fixtures_per_test', 'markers']
+
+# fixtures for the app wrappers that drive a browser
+WEB_APP_FIXTURES = ['sweetshop']
+
+# index of test case folders and outcomes, keyed by node id; this is only
+# populated in the process that receives the test reports (the controller,
+# when running with pytest-xdist)
+TESTCASE_INDEX = {}
 
 
 def update_namespace(data: dict, verbose: bool = False):
@@ -73,6 +101,309 @@ def pytest_addoption(parser):
                      default='stage',
                      help='Specify the tier: "qa", "stage", "prod".')
 
+    parser.addoption('--browser-pool',
+                     action='store',
+                     dest='browser_pool',
+                     choices=['off', 'session'],
+                     default='off',
+                     help='Re-use browser processes across tests: "off" launches '
+                          'a browser per test, "session" keeps a pool of browsers '
+                          'for the session (per worker when run with xdist).')
+
+    parser.addoption('--pool-max-contexts',
+                     action='store',
+                     dest='pool_max_contexts',
+                     type=int,
+                     default=25,
+                     help='Number of contexts a pooled browser serves before '
+                          'it is recycled.')
+
+    parser.addoption('--artifact-queue-size',
+                     action='store',
+                     dest='artifact_queue_size',
+                     type=int,
+                     default=artifacts.DEFAULT_MAX_PENDING,
+                     help='Max number of artifacts (cookies, webstorage, console '
+                          'logs, screenshots) waiting to be written before the '
+                          'test thread blocks.')
+
+    parser.addoption('--capture-policy',
+                     action='store',
+                     dest='capture_policy',
+                     choices=artifacts.CAPTURE_POLICIES,
+                     default='always',
+                     help='When to write page object artifacts (cookies, '
+                          'webstorage, console logs, screenshots): "always", '
+                          '"on-failure" (keep the last snapshots in memory and '
+                          'write them only if the test fails or errors), or '
+                          '"off".')
+
+    parser.addoption('--flight-recorder-size',
+                     action='store',
+                     dest='flight_recorder_size',
+                     type=int,
+                     default=artifacts.DEFAULT_RING_SIZE,
+                     help='With --capture-policy=on-failure, the number of '
+                          'snapshots kept in memory per test.')
+
+    parser.addoption('--flight-recorder-mb',
+                     action='store',
+                     dest='flight_recorder_mb',
+                     type=int,
+                     default=artifacts.DEFAULT_RING_MB,
+                     help='With --capture-policy=on-failure, the memory cap '
+                          'for the snapshots kept per test, in megabytes.')
+
+    parser.addoption('--screenshot-format',
+                     action='store',
+                     dest='screenshot_format',
+                     choices=screenshots.SCREENSHOT_FORMATS,
+                     default='png',
+                     help='Image format for page object screenshots.')
+
+    parser.addoption('--screenshot-quality',
+                     action='store',
+                     dest='screenshot_quality',
+                     type=int,
+                     default=screenshots.DEFAULT_QUALITY,
+                     help='Quality (0-100) for jpeg screenshots.')
+
+    parser.addoption('--screenshot-mode',
+                     action='store',
+                     dest='screenshot_mode',
+                     choices=screenshots.SCREENSHOT_MODES,
+                     default='full-page',
+                     help='Capture the full scrollable page, or only the '
+                          'viewport.')
+
+    parser.addoption('--screenshot-max-dimension',
+                     action='store',
+                     dest='screenshot_max_dimension',
+                     type=int,
+                     default=0,
+                     help='Downscale screenshots so that neither side is longer '
+                          'than this many pixels (needs Pillow); 0 keeps the '
+                          'captured size.')
+
+    parser.addoption('--screenshot-workers',
+                     action='store',
+                     dest='screenshot_workers',
+                     type=int,
+                     default=screenshots.DEFAULT_WORKERS,
+                     help='Number of worker threads for screenshot downscaling.')
+
+    parser.addoption('--trace-chunks-kept',
+                     action='store',
+                     dest='trace_chunks_kept',
+                     type=int,
+                     default=1,
+                     help='With --tracing=retain-on-failure, the number of '
+                          'trace chunks written for a failed test: the failing '
+                          "step's, and the ones just before it.")
+
+    parser.addoption('--storage-capture',
+                     action='store',
+                     dest='storage_capture',
+                     choices=['full', 'delta'],
+                     default='delta',
+                     help='How cookies and web storage are captured at each page '
+                          'transition: "full" dumps everything to a new file, '
+                          '"delta" appends only the changes to a per-test journal.')
+
+    parser.addoption('--baseline-every',
+                     action='store',
+                     dest='baseline_every',
+                     type=int,
+                     default=state_delta.DEFAULT_BASELINE_EVERY,
+                     help='With --storage-capture=delta, write a full baseline '
+                          'to the journals every N events.')
+
+    parser.addoption('--storage-journal-size',
+                     action='store',
+                     dest='storage_journal_size',
+                     type=int,
+                     default=storage_journal.DEFAULT_CAPACITY,
+                     help='With --storage-capture=delta, journal web storage '
+                          'writes in the page, keeping up to N writes between '
+                          'events, instead of scanning the storage at every '
+                          'event; 0 turns the journal off.')
+
+    parser.addoption('--console-buffer-size',
+                     action='store',
+                     dest='console_buffer_size',
+                     type=int,
+                     default=console_capture.DEFAULT_CAPACITY,
+                     help='Max number of console messages, page errors and '
+                          'failed requests kept between two console captures; '
+                          'older ones are dropped and counted.')
+
+    parser.addoption('--page-metrics',
+                     action='store',
+                     dest='page_metrics',
+                     choices=page_metrics.PAGE_METRICS_MODES,
+                     default='on',
+                     help='Record page-load timings at every page object '
+                          'transition (Chromium and Firefox), and aggregate '
+                          'them per page at the end of the run. Nothing is '
+                          'recorded with --capture-policy=off.')
+
+    parser.addoption('--metrics-baseline',
+                     action='store',
+                     dest='metrics_baseline',
+                     default=None,
+                     help='The metrics.json of an earlier run; the page '
+                          'metrics then report the load-time savings per '
+                          'page against it.')
+
+    parser.addoption('--acceleration',
+                     action='store',
+                     dest='acceleration',
+                     choices=acceleration.ACCELERATION_MODES +
+                     sorted(acceleration.PROFILES),
+                     default='off',
+                     help='"off" (the default) blocks nothing; "declared" '
+                          'uses the acceleration profile each page object '
+                          'declares; a profile name applies that profile to '
+                          'every page. Accelerated pages have no images or '
+                          'animations, so take visual baselines and network '
+                          'recordings with the same setting.')
+
+    parser.addoption('--network-capture',
+                     action='store',
+                     dest='network_capture',
+                     choices=network_capture.NETWORK_CAPTURE_MODES,
+                     default='on',
+                     help='Record every request (status, sizes, timing phases) '
+                          'and write them per page transition to the network '
+                          'folder (Chromium and Firefox).')
+
+    parser.addoption('--network-mode',
+                     action='store',
+                     dest='network_mode',
+                     choices=har_mode.NETWORK_MODES,
+                     default='live',
+                     help='"live" uses the network; "record" saves the traffic '
+                          'of each test to a HAR file; "replay" serves every '
+                          'request from the recording, offline.')
+
+    parser.addoption('--har-dir',
+                     action='store',
+                     dest='har_dir',
+                     default=None,
+                     help='Folder for the network recordings; defaults to the '
+                          'recordings folder next to output.')
+
+    parser.addoption('--har-scope',
+                     action='store',
+                     dest='har_scope',
+                     choices=har_mode.HAR_SCOPES,
+                     default='test',
+                     help='One recording per "test", or per "app" wrapper.')
+
+    parser.addoption('--replay-latency-ms',
+                     action='store',
+                     dest='replay_latency_ms',
+                     type=int,
+                     default=0,
+                     help='With --network-mode=replay, delay every request by '
+                          'this many milliseconds.')
+
+    parser.addoption('--asset-cache',
+                     action='store_true',
+                     dest='asset_cache',
+                     default=False,
+                     help='Serve cacheable static assets (scripts, styles, fonts, '
+                          'images) from a disk cache shared by every browser '
+                          'context in the session.')
+
+    parser.addoption('--asset-cache-mb',
+                     action='store',
+                     dest='asset_cache_mb',
+                     type=int,
+                     default=asset_cache.DEFAULT_MAX_MB,
+                     help='Size budget for the asset cache, in megabytes; the '
+                          'least recently used assets are evicted first.')
+
+    parser.addoption('--sweetshop-standin',
+                     action='store_true',
+                     dest='sweetshop_standin',
+                     default=False,
+                     help='Run the sweetshop tests against a local, in-process '
+                          'copy of the sweetshop pages instead of the live '
+                          'site.')
+
+    parser.addoption('--standin-latency-ms',
+                     action='store',
+                     dest='standin_latency_ms',
+                     type=int,
+                     default=0,
+                     help='Delay every stand-in response by this many '
+                          'milliseconds.')
+
+    parser.addoption('--standin-kb-per-second',
+                     action='store',
+                     dest='standin_kb_per_second',
+                     type=int,
+                     default=0,
+                     help='Bandwidth of the stand-in, in KB/s; 0 for '
+                          'unlimited.')
+
+    parser.addoption('--standin-error-rate',
+                     action='store',
+                     dest='standin_error_rate',
+                     type=float,
+                     default=0.0,
+                     help='Fraction (0-1) of the stand-in requests answered '
+                          'with an HTTP 500; the picks are seeded, so runs '
+                          'are repeatable.')
+
+    parser.addoption('--standin-port',
+                     action='store',
+                     dest='standin_port',
+                     type=int,
+                     default=0,
+                     help='Port for the stand-in; 0 (the default) picks a '
+                          'free one. Set it to record and replay the '
+                          'stand-in traffic. Not with pytest-xdist (-n).')
+
+    parser.addoption('--visual-baselines',
+                     action='store',
+                     dest='visual_baselines',
+                     default=None,
+                     help='Folder that holds the baselines for visual checks; '
+                          'defaults to the baselines folder next to output.')
+
+    parser.addoption('--visual-update',
+                     action='store_true',
+                     dest='visual_update',
+                     default=False,
+                     help='Replace the baselines with the screenshots from this '
+                          'run instead of comparing them.')
+
+    parser.addoption('--visual-workers',
+                     action='store',
+                     dest='visual_workers',
+                     type=int,
+                     default=0,
+                     help='Number of processes for the visual comparisons run '
+                          'at the end of the session; 0 for one per CPU.')
+
+    parser.addoption('--visual-pixel-tolerance',
+                     action='store',
+                     dest='visual_pixel_tolerance',
+                     type=int,
+                     default=visual.DEFAULT_PIXEL_TOLERANCE,
+                     help='Max per-channel difference (0-255) for a pixel to '
+                          'count as unchanged in a visual check.')
+
+    parser.addoption('--visual-max-changed-blocks',
+                     action='store',
+                     dest='visual_max_changed_blocks',
+                     type=int,
+                     default=visual.DEFAULT_MAX_CHANGED_BLOCKS,
+                     help='Max number of changed 16x16 blocks for a visual '
+                          'check to pass.')
+
     # parser.addoption('--xbrowser',
     #                  action='store',
     #                  dest='xbrowser',
@@ -99,10 +430,35 @@ def pytest_configure(config):
         2. extracting important options and adding them to the
           custom namespace
 
+        When no tests will run (see is_dry_run()), skip step 1: there is
+        no output folder, no logging configuration, no artifact writer and
+        no html report, so collecting a big suite starts fast and leaves
+        nothing behind.
+
         :param config: pytest Config object
         :return: None
     """
-    initialize_logging(config)
+    check_standin_port(config)
+    screenshot_settings(config)
+    config.stash[DRY_RUN] = any(getattr(config.option, option, False)
+                                for option in DRY_RUN_OPTIONS)
+    if is_dry_run(config):
+        # no report either; pytest-html reads htmlpath after this hook
+        config.option.htmlpath = None
+        update_namespace({'test cases': {}})
+    else:
+        initialize_logging(config)
+        artifacts.start_writer(
+            max_pending=config.getoption('artifact_queue_size'))
+        screenshots.start_pool(
+            max_workers=config.getoption('screenshot_workers'))
+        configure_visual_checks(config)
+        if config.getoption('asset_cache') and \
+                config.getoption('network_mode') == 'live':
+            # xdist workers share the controller's folder
+            testrun_folder = pytest.custom_namespace['testrun paths']['folder']
+            asset_cache.start_cache(testrun_folder / 'asset-cache',
+                                    max_mb=config.getoption('asset_cache_mb'))
     # logger.info(f"\nsys.argv: {utils.plog(sys.argv)}")
     # logger.info(f"\ndir(config.option): {utils.plog(dir(config.option))}")
     # for key in config.option.__dict__:
@@ -136,6 +492,18 @@ def pytest_configure(config):
         update_namespace({'devtools_supported': False}, verbose=True)
 
 
+# 1.0.1
+def is_dry_run(config):
+    """
+        Whether this pytest invocation only collects or plans the tests,
+        without running any of them.
+
+        :param config: pytest Config object
+        :return: bool
+    """
+    return config.stash.get(DRY_RUN, False)
+
+
 # 2.0
 def pytest_sessionstart(session):
     """
@@ -144,25 +512,98 @@ def pytest_sessionstart(session):
         Use configure_pytest_session() for any global test session and
         fixture logic.
 
+        Compile the page object route table for every app wrapper, so
+        that broken routings fail the run before any test starts.
+
         :param session: pytest request object (which is the context
                         of the calling text method)
         :return: None
     """
     logger.info(f"{'-' * 10}")
+    try:
+        routing.compile_routes()
+    except RoutingException as e:
+        raise pytest.UsageError('\n'.join(['Invalid page object routings:']
+                                          + e.errors))
     # the following line outputs some interesting info for debugging test runs
     # logging.info(f"\nsession.__dict__:\n{utils.plog(session.__dict__)}")
 
 
+# 1.0.2
+def check_standin_port(config):
+    """
+        Refuse a fixed `--standin-port` with pytest-xdist: every worker
+        starts its own stand-in, and only one of them could bind the port.
+        Offsetting the port per worker wouldn't help with record and
+        replay, since a test isn't always run by the same worker.
+
+        :param config: pytest Config object
+        :return: None
+    """
+    if config.getoption('standin_port') and \
+            getattr(config.option, 'numprocesses', None) and \
+            not run_context.is_worker(config):
+        msg = '--standin-port can\'t be used with -n: each pytest-xdist ' \
+              'worker starts its own stand-in, so they would all bind the ' \
+              'same port. Leave --standin-port at 0 for a free port.'
+        raise pytest.UsageError(msg)
+
+
+# 1.0.3
+def screenshot_settings(config):
+    """
+        Build the screenshot settings from the command line options, so a
+        bad value fails the run at startup instead of inside each test.
+
+        :param config: pytest Config object
+        :return: screenshots.ScreenshotSettings instance
+    """
+    try:
+        return screenshots.ScreenshotSettings(
+            image_format=config.option.screenshot_format,
+            quality=config.option.screenshot_quality,
+            mode=config.option.screenshot_mode,
+            max_dimension=config.option.screenshot_max_dimension)
+    except ValueError as e:
+        raise pytest.UsageError(str(e))
+
+
+# 2.1
+@pytest.hookimpl(optionalhook=True)
+def pytest_configure_node(node):
+    """
+        A pytest-xdist hook called on the controller for each worker node
+        before it starts.
+
+        Every worker must write into the testrun folder created by the
+        controller (instead of creating its own timestamped folder), so hand
+        the folder to the workers through `workerinput`.
+
+        :param node: xdist WorkerController
+        :return: None
+    """
+    if is_dry_run(node.config):
+        return
+    node.workerinput['heofon timestamp'] = pytest.custom_namespace['timestamp']
+    node.workerinput['heofon testrun folder'] = \
+        str(pytest.custom_namespace['testrun paths']['folder'])
+
+
 # 3.0
 def pytest_collection_modifyitems(items):
     """
         A pytest hook called after test collection used to modify or
         reorder test items.
 
+        Number the items in collection order. Every xdist worker collects
+        the same items in the same order, so this number is unique across
+        workers and is safe to use in test case folder names.
+
         :param items: list, list of test item objects
         :return: None
     """
-    logger.info("no actions taken.")
+    for index, item in enumerate(items, start=1):
+        item.stash[COLLECTION_INDEX] = index
 
 
 # 4.0
@@ -203,40 +644,52 @@ def pytest_runtest_setup(item):
         We use this to:
         1. Create the folder to hold the logger output for the test.
            That folder is named with this syntax:
-            <<number>>_<<test case name minus the "test">>_<<tier>>,
+            <<collection number>>_<<test case name minus the "test">>,
             which will look something like this:
                 1_foo[some param]
                 2_bar
 
-        2. Trigger the creation of sub-folders for specific kinds of
-           verbose output, depending on the types of applications being
-           tested against.
+        2. Register the sub-folders for specific kinds of verbose output,
+           depending on the types of applications being tested against.
+           Each sub-folder is created when the first file is written to it.
 
            For example, if we are testing against a webapp,
            we create this kind of folder structure:
            - output (already exists)
                |- 210927-123456 (testrun folder, already exists)
                    |- 1_foo (test folder, created here)
-                       |- accessibility (created here)
-                       |- console (created here)
-                       |- cookies (created here)
-                       |- downloads (created here)
-                       |- network (created here)
-                       |- screenshots (created here)
-                       |- webstorage (created here)
-
-        3. Switch the logger from the root logger to the apps logger.
+                       |- accessibility (on first write)
+                       |- console (on first write)
+                       |- cookies (on first write)
+                       |- downloads (on first write)
+                       |- metrics (on first write)
+                       |- network (on first write)
+                       |- screenshots (on first write)
+                       |- visual (on first write)
+                       |- webstorage (on first write)
+
+        3. Route the log records for this test case to its own log file.
            This in effect moves the logging "firehose" from pointing at
-           `TESTRUN_LOGFILE_NAME` to pointing at `TESTCASE_LOGFILE_NAME`.
+           `TESTRUN_LOGFILE_NAME` to pointing at `TESTCASE_LOGFILE_NAME`,
+           without re-configuring logging (see log_routing).
+
+        4. When the test case (test method) exits, the route is reset
+           and records go back to the run log.
 
-        4. When the test case (test method) exits, the logger is
-           re-pointed at the root logger.
+        Per-test state lives in a TestCaseContext, which is stashed on the
+        item and made the current test case for the framework code.
+
+        With --setup-plan, the setup only shows the fixtures; nothing is
+        set up for the test case.
 
         :param item: a test method.
         :return: None
     """
+    if is_dry_run(item.config):
+        yield
+        return
+
     logger.info(f"\n### Set up for test {item.name} ###")
-    namespace_data = {}
 
     # extract the test method name, tweak it, and use it for
     # naming a folder in the testrun folder for the logging
@@ -245,8 +698,10 @@ def pytest_runtest_setup(item):
         test_name = item.__dict__['name']
     except KeyError:
         test_name = item.name
-    # insert COUNT so that the folders sort by collection order
-    short_name = f"{COUNT}_{test_name[5:]}"
+    # insert the collection number so that the folders sort by collection
+    # order and don't collide between xdist workers
+    index = item.stash.get(COLLECTION_INDEX, 0)
+    short_name = f"{index}_{test_name[5:]}"
 
     # extract the fixture names associated with this current test
     fixtures = []
@@ -254,120 +709,273 @@ def pytest_runtest_setup(item):
     logger.info(f"\nreferenced_fixtures: {referenced_fixtures}")
     for this_fixture in referenced_fixtures:
         fixtures.append(this_fixture)
-    # `COUNT` is used in the naming of the test output folder;
-    # we need them to increment for each collected test
-    globals()['COUNT'] += 1  # this is hacky because there is no iterator
 
     # create the output folder for this test case
     test_run_path = pytest.custom_namespace['testrun paths']['folder']
     testcase_folder_path = test_run_path / short_name
     create_test_output_subfolder(testcase_folder_path)
 
+    # set up the run context for this test case
+    testcase = run_context.TestCaseContext(
+        short_name, testcase_folder_path, nodeid=item.nodeid,
+        worker=run_context.worker_id(item.config))
+    item.stash[TESTCASE_CONTEXT] = testcase
+    testcase.capture_policy = item.config.option.capture_policy
+    if testcase.capture_policy == 'on-failure':
+        testcase.artifact_sink = artifacts.FlightRecorder(
+            max_snapshots=item.config.option.flight_recorder_size,
+            max_bytes=item.config.option.flight_recorder_mb * 1024 * 1024)
+    if item.config.option.storage_capture == 'delta':
+        testcase.delta_recorder = state_delta.DeltaRecorder(
+            baseline_every=item.config.option.baseline_every)
+    item.stash[TESTCASE_TOKEN] = run_context.set_current_testcase(testcase)
+    item.user_properties.append(('heofon index', index))
+    item.user_properties.append(('heofon folder', short_name))
+    item.user_properties.append(('heofon worker', testcase.worker))
+
     # set up the appropriate sub-folders and
     # special log files for this test case
-    set_up_testcase_reporting(testcase_folder_path, fixtures)
+    set_up_testcase_reporting(testcase, fixtures)
 
-    # set up global namespace path-to-this-testcase value
-    namespace_data['this_test'] = testcase_folder_path
     logger.warning("\n### Changing log output path to the test case path. ###\n\n")
 
     # redirect logging from the test run logger to the test case logger
     path_to_logfile = str(testcase_folder_path / TESTCASE_LOGFILE_NAME)
     logger.info(f"\n{'#' * 30}\n=====>> Testcase {item.name} "
                 f"logged to {path_to_logfile}\n{'#' * 30}\n\n")
-    log_kwargs = {
-        'version': 1,
-        'disable_existing_loggers': False,
-        'formatters': {
-            'detailed': {
-                'class': 'logging.Formatter',
-                'format': '%(asctime)s %(name)s::%(funcName)s() [%(levelname)s] %(message)s'
-            },
-        },
-        'handlers': {
-            'default': {
-                'class': 'logging.FileHandler',
-                'filename': path_to_logfile,
-                'mode': 'a',
-                'formatter': 'detailed'
-            },
-            'foo': {
-                'class': 'logging.FileHandler',
-                'filename': path_to_logfile,
-                'mode': 'a',
-                'formatter': 'detailed'
-            }
-        },
-        'loggers': {
-            '': {  # root
-                'handlers': ['foo'],
-                'level': 'INFO',
-                'propagate': False
-            },
-            'heofon.apps': {
-                'handlers': ['foo'],
-                'level': 'INFO',
-                'propagate': False
-            },
-        }
-    }
-    filename = set_logging_config(log_kwargs)  # noqa: F841
-
-    # update our hacky namespace
-    update_namespace(namespace_data, verbose=True)
+    item.stash[LOG_ROUTE_TOKEN] = log_routing.route_to(path_to_logfile)
 
     yield
 
 
 # 8.0
+@pytest.hookimpl(hookwrapper=True)
 def pytest_runtest_teardown(item, nextitem):
     """
         A pytest hook run at test teardown.
 
+        This wraps the fixture teardowns, so fixtures still see (and log to)
+        this test case while they finalize.
+
         :param item: a test method
         :param nextitem: a test method to be run next
         :return: None
     """
-    logger.info(f"\n### Tear down for test {item.name} ###")
-    path_to_logfile = pytest.custom_namespace['testrun paths']['logfile']
-
-    log_kwargs = {
-        'version': 1,
-        'disable_existing_loggers': False,
-        'formatters': {
-            'detailed': {
-                'class': 'logging.Formatter',
-                'format': '%(asctime)s %(name)s::%(funcName)s() [%(levelname)s] %(message)s'
-            },
-        },
-        'handlers': {
-            'default': {
-                'class': 'logging.FileHandler',
-                'filename': path_to_logfile,
-                'mode': 'a',
-                'formatter': 'detailed'
-            },
-        },
-        'loggers': {
-            '': {  # root
-                'handlers': ['default'],
-                'level': 'INFO',
-                'propagate': False
-            },
-        }
-    }
+    outcome = yield
+    if is_dry_run(item.config):
+        return
 
+    logger.info(f"\n### Tear down for test {item.name} ###")
+    failed = item.stash.get(TESTCASE_FAILED, False) or \
+        outcome.excinfo is not None
+    release_flight_recorder(item, failed)
+    flush_testcase_artifacts(item)
+    token = item.stash.get(TESTCASE_TOKEN, None)
+    if token is not None:
+        run_context.reset_current_testcase(token)
+        del item.stash[TESTCASE_TOKEN]
     logger.info('\n### Closing test case logfile ###\n\n')
-    filename = set_logging_config(log_kwargs)
+    token = item.stash.get(LOG_ROUTE_TOKEN, None)
+    if token is not None:
+        log_routing.reset_route(token)
+        del item.stash[LOG_ROUTE_TOKEN]
+    filename = pytest.custom_namespace['testrun paths']['logfile']
     logger.info(f"\n### Reset logfile to {filename} ###\n\n\n")
 
 
+# 8.0.2
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_makereport(item, call):
+    """
+        Note whether the test's setup or call failed, so that the teardown
+        knows whether to write the flight recorder's artifacts.
+
+        :param item: a test method
+        :param call: pytest CallInfo for the setup, call or teardown phase
+        :return: None
+    """
+    outcome = yield
+    report = outcome.get_result()
+    if report.failed:
+        item.stash[TESTCASE_FAILED] = True
+
+
+# 8.1
+def pytest_runtest_logreport(report):
+    """
+        A pytest hook called for the setup, call and teardown report of
+        every test. With pytest-xdist, the reports from every worker arrive
+        in the controller, so this is where the test case index is built.
+
+        :param report: pytest TestReport
+        :return: None
+    """
+    properties = dict(report.user_properties)
+    if 'heofon folder' not in properties:
+        return
+
+    entry = TESTCASE_INDEX.setdefault(report.nodeid, {
+        'nodeid': report.nodeid,
+        'index': properties['heofon index'],
+        'folder': properties['heofon folder'],
+        'worker': properties['heofon worker'],
+        'outcome': 'passed',
+    })
+    if report.failed:
+        entry['outcome'] = 'failed' if report.when == 'call' else 'error'
+    elif report.skipped and entry['outcome'] == 'passed':
+        entry['outcome'] = 'skipped'
+
+
 # 9.0
 def pytest_sessionfinish(session, exitstatus):
     """
         This hook is called after the whole test run finishes.
+
+        On the controller (or in a run without pytest-xdist), merge the
+        worker run logs into the testrun's run log and write the index of
+        test case folders next to report.html.
+    """
+    # the writer waits for the pending screenshot encodings
+    artifacts.stop_writer()
+    screenshots.stop_pool()
+
+    # the cache is not an artifact; the controller removes the folder once
+    # the workers are done with it
+    cache_stats = asset_cache.stop_cache(
+        remove=not run_context.is_worker(session.config))
+    if cache_stats:
+        logger.info(f"\nAsset cache: {cache_stats}")
+
+    testrun_folder = pytest.custom_namespace.get('testrun paths', {}).get('folder')
+    if testrun_folder is not None:
+        # the screenshots are all written now
+        run_visual_checks(session.config, testrun_folder)
+
+    if run_context.is_worker(session.config):
+        return
+    if testrun_folder is None:
+        return
+
+    # the workers' metrics files are all written by now
+    table = page_metrics.write_aggregate(
+        testrun_folder, baseline=session.config.getoption('metrics_baseline'))
+    session.config.stash[PAGE_METRICS_TABLE] = table
+    if session.config.getoption('network_mode') == 'record' and \
+            session.config.getoption('har_scope') == 'app':
+        har_mode.merge_hars(har_folder(session.config))
+
+    summary = collect_visual_reports(testrun_folder)
+    if summary:
+        logger.info(f"\nVisual checks: {summary}")
+        session.config.stash[VISUAL_SUMMARY] = summary
+        if summary.get('failed') or summary.get('error'):
+            session.exitstatus = pytest.ExitCode.TESTS_FAILED
+
+    workers = run_context.merge_worker_runlogs(testrun_folder,
+                                               TESTRUN_LOGFILE_NAME)
+    if workers:
+        logger.info(f"\nMerged run logs from workers: {workers}")
+    if TESTCASE_INDEX:
+        run_context.write_testcase_index(testrun_folder,
+                                         list(TESTCASE_INDEX.values()))
+
+
+# 9.0.1
+def configure_visual_checks(config):
+    """
+        Set up the baselines and comparison options for visual checks (see
+        RootPageObject.check_visual()).
+
+        :param config: pytest config object
+        :return: None
+    """
+    baselines = config.getoption('visual_baselines')
+    if baselines:
+        baselines_root = Path(baselines).resolve()
+    else:
+        # the baselines folder sits next to the output folder
+        testrun_folder = pytest.custom_namespace['testrun paths']['folder']
+        baselines_root = testrun_folder.parents[1] / 'baselines'
+    visual.configure(
+        baselines_root,
+        update=config.getoption('visual_update'),
+        pixel_tolerance=config.getoption('visual_pixel_tolerance'),
+        max_changed_blocks=config.getoption('visual_max_changed_blocks'))
+
+
+# 9.0.2
+def run_visual_checks(config, testrun_folder):
     """
-    logger.info('No actions taken.')
+        Run the visual comparisons queued by this process's tests, in a
+        process pool, and write the results to the testrun folder.
+
+        With pytest-xdist, each worker runs its own comparisons and writes
+        its own report (`visual-<worker>.json`).
+
+        :param config: pytest config object
+        :param testrun_folder: Path, path to the testrun output folder
+        :return: None
+    """
+    jobs = visual.take_jobs()
+    if not jobs:
+        return
+    start = time.perf_counter()
+    results = visual.run_comparisons(
+        jobs, workers=config.getoption('visual_workers'))
+    logger.info(f"\nRan {len(jobs)} visual comparisons in "
+                f"{time.perf_counter() - start:.2f}s.")
+
+    report_name = VISUAL_REPORT_NAME
+    if run_context.is_worker(config):
+        worker = run_context.worker_id(config)
+        report_name = report_name.replace('.', f"-{worker}.", 1)
+    visual.write_report(results, testrun_folder / report_name)
+    for result in results:
+        if result['status'] != 'passed':
+            logger.info(f"\nVisual check {result['status']}: "
+                        f"{result['test']} '{result['name']}' "
+                        f"{result.get('reason', '')}")
+
+
+# 9.0.3
+def collect_visual_reports(testrun_folder):
+    """
+        Count the visual check results from this run's reports (the
+        controller's and every worker's).
+
+        :param testrun_folder: Path, path to the testrun output folder
+        :return: dict, count of results per status
+    """
+    results = visual.read_reports(testrun_folder, VISUAL_REPORT_NAME)
+    return visual.summarize(results)
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    """
+        Add the visual check results, and the requests blocked and the
+        load time saved by the acceleration profiles, to the terminal summary.
+    """
+    summary = config.stash.get(VISUAL_SUMMARY, None)
+    if summary:
+        counts = ', '.join(f"{count} {status}"
+                           for status, count in sorted(summary.items()))
+        terminalreporter.write_sep('-', f"visual checks: {counts}")
+
+    table = config.stash.get(PAGE_METRICS_TABLE, None)
+    if table and any(row['profiles'] for row in table.values()):
+        blocked = sum(row['blocked'] for row in table.values())
+        terminalreporter.write_sep('-', f"acceleration: {blocked} requests "
+                                        f"blocked")
+        for name, row in table.items():
+            if not row['profiles']:
+                continue
+            line = f"{name}: {', '.join(row['profiles'])}, " \
+                   f"{row['blocked']} blocked"
+            if 'load_savings' in row:
+                line += f", load p50 {row['load_savings']['p50']:+}ms " \
+                        f"p95 {row['load_savings']['p95']:+}ms saved"
+            terminalreporter.write_line(line)
 
 
 # 10.0
@@ -413,17 +1021,24 @@ def configure_test_session(request):
 # #########################################
 # framework fixtures ######################
 # #########################################
-def set_logging_config(kwargs):
+def set_logging_config(kwargs, filename):
     """
         Configure and start the framework logging.
 
+        The routed handler is attached to the root logger in code, not
+        through dictConfig(): from Python 3.12, dictConfig() builds
+        QueueHandler subclasses its own way (and differently in 3.12 and
+        3.13).
+
         :param kwargs: dict, logger config arguments
+        :param filename: str, path to the run log file
         :return filename: Path object for path to log file
     """
     import logging.config
     # start logging
     logging.config.dictConfig(kwargs)
-    filename = kwargs['handlers']['default']['filename']
+    formatter = logging.Formatter(kwargs['formatters']['detailed']['format'])
+    log_routing.install(filename, formatter)
     logger.info(f"\ncreated log file at '{filename}'.")
     return filename
 
@@ -438,18 +1053,26 @@ def initialize_logging(config):
     """
     namespace_data = {}
 
-    # set timestamp for the start of this test run;
-    # this is used globally for this run
-    timestamp = time.strftime('%y%m%d-%H%M%S')
+    if run_context.is_worker(config):
+        # pytest-xdist worker: use the controller's testrun folder, and
+        # log to a worker-specific run log that gets merged at the end
+        worker = run_context.worker_id(config)
+        timestamp = config.workerinput['heofon timestamp']
+        testrun_folder = Path(config.workerinput['heofon testrun folder'])
+        logfile_name = TESTRUN_LOGFILE_NAME.replace('.', f"-{worker}.", 1)
+    else:
+        # set timestamp for the start of this test run;
+        # this is used globally for this run
+        timestamp = time.strftime('%y%m%d-%H%M%S')
+        # create the output folder for this test run
+        framework_folder, testrun_folder = create_run_output_folder(timestamp)
+        logfile_name = TESTRUN_LOGFILE_NAME
     namespace_data['timestamp'] = timestamp
+    path_to_logfile = str(testrun_folder / logfile_name)
 
     # update our hacky namespace
     update_namespace(namespace_data, verbose=True)
 
-    # create the output folder for this test run
-    framework_folder, testrun_folder = create_run_output_folder(timestamp)
-    path_to_logfile = str(testrun_folder / TESTRUN_LOGFILE_NAME)
-
     # Change the path specified for the html test results report to include
     # the testrun's timestamp output folder. The report is generated by the
     # pytest-html report plugin, and is invoked by the command line argument
@@ -463,6 +1086,9 @@ def initialize_logging(config):
     config.option.htmlpath = html_path
 
     # start logging; nothing that happens before this gets logged!
+    # This is the only logging configuration for the run: the routed
+    # handler sends each test case's records to that test's log file
+    # (see pytest_runtest_setup), and does the file I/O on its own thread.
     log_kwargs = {
         'version': 1,
         'disable_existing_loggers': False,
@@ -472,28 +1098,20 @@ def initialize_logging(config):
                 'format': '%(asctime)s %(name)s::%(funcName)s() [%(levelname)s] %(message)s'
             },
         },
-        'handlers': {
-            'default': {
-                'class': 'logging.FileHandler',
-                'filename': path_to_logfile,
-                'mode': 'a',
-                'formatter': 'detailed'
-            },
-        },
         'loggers': {
-            '': {  # root logger
-                'handlers': ['default'],
+            '': {  # root logger; set_logging_config() adds the handler
+                'handlers': [],
                 'level': 'INFO',
                 'propagate': False
             },
         }
     }
-    set_logging_config(log_kwargs)
+    set_logging_config(log_kwargs, path_to_logfile)
 
     # create test run paths for namespace
     paths = {'testrun paths': {
                 'folder': testrun_folder,
-                'logfile': testrun_folder / TESTRUN_LOGFILE_NAME,
+                'logfile': testrun_folder / logfile_name,
                 'html report': htmlreport_path
     }}
     # update our hacky namespace
@@ -503,7 +1121,7 @@ def initialize_logging(config):
     # set up test case namespacing
     update_namespace({'test cases': {}})
 
-    logger.info(f"\nnamespace:\n{utils.plog(pytest.custom_namespace)}")
+    logger.info("\nnamespace:\n%s", utils.lazy_plog(pytest.custom_namespace))
 
 # 1.1.1
 def create_run_output_folder(timestamped_name):
@@ -555,100 +1173,154 @@ def create_test_output_subfolder(path):
     else:
         logger.info("\nSub-folder already exists.")
 
-# 7.2
-def set_up_testcase_reporting(testcase_folder, fixturenames):
+# 8.0.1
+def flush_testcase_artifacts(item):
     """
-        For every specific test instance being run, create the various output
-        folders needed for the different kinds of reporting and logging (beyond
-        the core framework log). Depending on the "types" of apps being pulled
-        into the test instance (via fixtures), different kinds of data will
-        be logged or saved, so create the folders appropriate to this test's
-        apps.
+        Wait for the background artifact writer to finish this test's files,
+        and surface any write errors in the test's report.
 
-        :param testcase_folder: Path, path to the current test case's folder
-        :param fixturenames: list, string fixture names for this testcase
+        :param item: a test method
         :return: None
     """
-    if '--collect-only' in sys.argv:
-        # if pytest is invoked with the --collect-only option, don't
-        # create the testrun subfolders
-        msg = "Subfolders NOT created because this testrun is collect-only."
-        logger.info(msg)
+    testcase = item.stash.get(TESTCASE_CONTEXT, None)
+    if testcase is None:
+        return
+    writer = artifacts.get_writer()
+    writer.flush()
+    errors = writer.pop_errors(testcase.name)
+    if errors:
+        item.add_report_section('teardown', 'artifact errors', '\n'.join(errors))
+        item.warn(pytest.PytestWarning(
+            f"{len(errors)} artifact(s) failed to write for {testcase.name}; "
+            f"see the 'artifact errors' report section."))
+
+
+# 8.0.3
+def release_flight_recorder(item, failed):
+    """
+        With the 'on-failure' capture policy, hand the test's kept artifacts
+        to the background writer if the test failed or errored, otherwise
+        drop them.
+
+        :param item: a test method
+        :param failed: bool, whether the test's setup, call or teardown failed
+        :return: None
+    """
+    testcase = item.stash.get(TESTCASE_CONTEXT, None)
+    if testcase is None or testcase.artifact_sink is None:
+        return
+    recorder = testcase.artifact_sink
+    testcase.artifact_sink = None
+    if failed:
+        count = recorder.release(artifacts.get_writer())
+        logger.info(f"\nTest failed; writing {count} artifacts from the "
+                    f"flight recorder.")
     else:
-        logger.info(f"\nfixturenames: {fixturenames}")
-        logger.info(f"\ntestcase_folder: {testcase_folder}")
-        testcase = testcase_folder.parts[-1]
-
-        # #############################################
-        # after you add an app fixture to conftest.py, you must add
-        # the str name for that app fixture to the appropriate list
-        # below. This allows you to use that app fixture as a test
-        # method argument and have the appropriate folders and
-        # logging in place.
-        # #############################################
-        integrations = ['auth']  # not used, but helps with context  # noqa: F841
-        drivers = ['driver']
-        web_apps = ['sweetshop']
-        apis = []
-
-        # set up config for folder requirements
-        required_folders = {
-            'api': ['requests'],
-            'driver': ['driver'],  # browser/driver logging
-            'web_app': ['cookies',  # cookies
-                        'screenshots',  # screenshots from POM and tests, etc.
-                        'accessibility',  # reports generated by POM for every page
-                        'webstorage'  # local and session
-                        ]
-        }
+        count = recorder.discard()
+        logger.info(f"\nTest passed; dropped {count} artifacts from the "
+                    f"flight recorder.")
+
+
+# 7.2
+def set_up_testcase_reporting(testcase, fixturenames):
+    """
+        For every specific test instance being run, register the various
+        output folders needed for the different kinds of reporting and logging
+        (beyond the core framework log). Depending on the "types" of apps being
+        pulled into the test instance (via fixtures), different kinds of data
+        will be logged or saved, so register the folders appropriate to this
+        test's apps.
+
+        The folders are not created here: the artifact writer creates each
+        one when the first artifact is written to it, so a test that doesn't
+        take screenshots doesn't get an empty screenshots folder.
+
+        :param testcase: TestCaseContext, run context for the current test case
+        :param fixturenames: list, string fixture names for this testcase
+        :return: None
+    """
+    logger.info(f"\ntestcase_folder: {testcase.folder}")
+
+    is_api, is_webapp, folder_kinds = testcase_folder_kinds(
+        frozenset(fixturenames),
+        bool(pytest.custom_namespace.get('devtools_supported')))
+    logger.info(f"\nfixturenames: {sorted(fixturenames)}")
+    logger.info(f"\napp types: is_api {is_api}; is_webapp: {is_webapp}")
+
+    # #############################################
+    # For the current test case, resolve the relevant child folders
+    # to which various logging and output will be written.
+    # The paths go into this test case's run context, which the
+    # framework write methods read through
+    # run_context.current_testcase(); nothing here is shared with
+    # other tests, so this is safe under pytest-xdist.
+    # #############################################
+    for folder in folder_kinds:
+        # update the test case's data model
+        testcase.folders[folder] = testcase.folder / folder
+
+    # manually *add* (not overwrite) this test case info to the namespace
+    pytest.custom_namespace['test cases'][testcase.name] = testcase.folders
+
+    logger.info("\ntest case folders:\n%s", utils.lazy_plog(testcase.folders))
+
+
+@functools.lru_cache(maxsize=None)
+def testcase_folder_kinds(fixturenames, devtools_supported):
+    """
+        Work out which kinds of output folders a test gets, from the app
+        fixtures in its fixture closure.
 
-        # only create folders and logs appropriate to the app fixtures
-        is_api = len(set(fixturenames).intersection(apis))
-        is_driver = len(set(fixturenames).intersection(drivers))
-        is_webapp = len(set(fixturenames).intersection(web_apps))
-        logger.info(f"\napp types: is_api {is_api}; is_webapp: {is_webapp}")
-
-        # some folders are common to all
-        folders_to_create = ['integrations', 'downloads']
-        if is_api:
-            folders_to_create.extend(required_folders['api'])
-        if is_driver:
-            folders_to_create.extend(required_folders['driver'])
-        if is_webapp:
-            folders_to_create.extend(required_folders['web_app'])
-            if pytest.custom_namespace.get('devtools_supported'):
-                # some capabilities are currently restricted to Chrome browsers
-                folders_to_create.extend(['network', 'console', 'metrics'])
-
-        # #############################################
-        # For the current test case, create the relevant child folders
-        # to which various logging and output will be written.
-        # Note: This mechanism relies on side effects! Specifically,
-        # various framework write methods pull paths from the custom
-        # namespace, and those paths are overwritten here in
-        # set_up_testcase_reporting(). This will be a problem
-        # if we attempt to parallelize the execution of the
-        # collected tests.
-        # #############################################
-        paths = {testcase: {}}  # set up individual test case namespace
-        current_testcase = {'current test case': {'name': testcase}}
-        for folder in folders_to_create:
-            this_folder_path = testcase_folder / folder
-            create_test_output_subfolder(this_folder_path)
-            logger.info(f"\ncreated folder '{folder}': {this_folder_path}")
-
-            # update local data model
-            paths[testcase][f"{folder} folder"] = this_folder_path
-
-        # manually *add* (not overwrite) this test case info to the namespace
-        pytest.custom_namespace['test cases'].update(paths)
-
-        # overwrite the namespace entry for 'current test case'
-        current_testcase['current test case'].update(paths[testcase])
-        update_namespace(current_testcase, verbose=True)
-
-        logger.info(f"\nnamespace after test folder creation:"
-                    f"\n{utils.plog(pytest.custom_namespace)}")
+        Tests share a handful of fixture closures, so this is computed once
+        per closure instead of at every test setup; it doesn't log, since a
+        cached call only runs for the first test of each closure.
+
+        :param fixturenames: frozenset, string fixture names for a testcase
+        :param devtools_supported: bool, whether the browser supports devtools
+        :return: tuple, int is_api, int is_webapp, and a tuple of str
+                 folder kinds
+    """
+    # #############################################
+    # after you add an app fixture to conftest.py, you must add
+    # the str name for that app fixture to the appropriate list
+    # below. This allows you to use that app fixture as a test
+    # method argument and have the appropriate folders and
+    # logging in place.
+    # #############################################
+    integrations = ['auth']  # not used, but helps with context  # noqa: F841
+    drivers = ['driver']
+    web_apps = WEB_APP_FIXTURES
+    apis = []
+
+    # set up config for folder requirements
+    required_folders = {
+        'api': ['requests'],
+        'driver': ['driver'],  # browser/driver logging
+        'web_app': ['cookies',  # cookies
+                    'screenshots',  # screenshots from POM and tests, etc.
+                    'visual',  # screenshots and diffs for visual checks
+                    'accessibility',  # reports generated by POM for every page
+                    'webstorage'  # local and session
+                    ]
+    }
+
+    # only register folders and logs appropriate to the app fixtures
+    is_api = len(fixturenames.intersection(apis))
+    is_driver = len(fixturenames.intersection(drivers))
+    is_webapp = len(fixturenames.intersection(web_apps))
+
+    # some folders are common to all
+    folder_kinds = ['integrations', 'downloads']
+    if is_api:
+        folder_kinds.extend(required_folders['api'])
+    if is_driver:
+        folder_kinds.extend(required_folders['driver'])
+    if is_webapp:
+        folder_kinds.extend(required_folders['web_app'])
+        if devtools_supported:
+            # some capabilities are currently restricted to Chrome browsers
+            folder_kinds.extend(['network', 'console', 'metrics'])
+    return is_api, is_webapp, tuple(folder_kinds)
 
 
 # # 0.2
@@ -773,15 +1445,18 @@ def playwright_tracing(request):
         so we need to make it our own for Heofon.
 
         Note: possible values for `tracing` are 'on', 'off', and
-        'retain-on-failure'. We only focus on the value 'on'.
+        'retain-on-failure'; anything else (e.g. a missing value) is 'off'.
+        See trace_chunks for how the modes are handled.
 
         :param request: pytest request object
-        :return: bool, updated value for the pytest request tracing option
+        :return: str, updated value for the pytest request tracing option
     """
-    tracing_recast = True if request.config.option.tracing == 'on' else False
-    request.config.option.tracing = tracing_recast
-    logger.info(f"converted `tracing` value: {tracing_recast}")
-    return tracing_recast
+    tracing = request.config.option.tracing
+    if tracing not in trace_chunks.TRACING_MODES:
+        tracing = 'off'
+    request.config.option.tracing = tracing
+    logger.info(f"converted `tracing` value: {tracing}")
+    return tracing
 
 
 def playwright_video(request):
@@ -790,26 +1465,78 @@ def playwright_video(request):
         so we need to make it our own for Heofon.
 
         Note: possible values for `video` are 'on', 'off', and
-        'retain-on-failure'. We only focus on the value 'on'.
+        'retain-on-failure'; anything else (e.g. a missing value) is 'off'.
+        With 'retain-on-failure', the video of a test that passed is deleted
+        when the context is closed (see discard_video()).
 
         :param request: pytest request object
-        :return: bool, updated value for the pytest request video option
+        :return: str, updated value for the pytest request video option
     """
-    video_recast = True if request.config.option.video == 'on' else False
-    request.config.option.video = video_recast
-    logger.info(f"converted `video` value: {video_recast}")
-    return video_recast
+    video = request.config.option.video
+    if video not in ['on', 'off', 'retain-on-failure']:
+        video = 'off'
+    request.config.option.video = video
+    logger.info(f"converted `video` value: {video}")
+    return video
+
+
+@pytest.fixture(scope='session')
+def browser_pool(request, browser_name):
+    """
+        A session-scoped pool of browser processes, enabled by the
+        `--browser-pool=session` CLI option.
+
+        Session fixtures are per-process, so when the suite is run with
+        pytest-xdist each worker gets its own pool.
+
+        :param request: pytest request object
+        :param browser_name: str, browser driver identifier
+        :yield pool: BrowserPool instance, or None if pooling is off
+    """
+    if request.config.option.browser_pool == 'off':
+        yield None
+        return
+
+    from playwright.sync_api import sync_playwright
+
+    playwright = sync_playwright().start()
+    pool = BrowserPool(playwright,
+                       browser_name,
+                       headed=request.config.option.headed,
+                       max_contexts=request.config.option.pool_max_contexts)
+    logger.info(f"\nStarted '{browser_name}' browser pool.")
+
+    yield pool
+
+    pool.close()
+    playwright.stop()
+    logger.info('\nStopped browser pool.')
+
+
+@pytest.fixture(scope='session')
+def browser_name(request):
+    """
+        Session-scoped twin of the `browser` fixture, for session fixtures
+        that need the browser identifier.
+
+        :param request: pytest request object
+        :return: str, identifier for the appropriate browser driver
+    """
+    return request.config.option.browser[0]  # just the first
 
 
 @pytest.fixture(scope="function")
-def pwpage(request, browser):
+def pwpage(request, browser, browser_pool):
     """
         Identify the appropriate browser driver to instantiate, and then
         instantiate a Playwright Page object for a single tab in that browser.
         (Note to be confused with anything from a page object model)
 
-        This fixture is scoped to `function`, so it will launch and quit the driver
-        for EACH calling test function.
+        This fixture is scoped to `function`. By default it will launch and
+        quit the browser for EACH calling test function; with
+        `--browser-pool=session` the browser comes from a session-lived pool,
+        and only the BrowserContext (and its page) is created and closed for
+        each test.
 
         Call this fixture by passing the name as a parameter:
         def some_test(self, page):
@@ -817,63 +1544,252 @@ def pwpage(request, browser):
 
         :param request: pytest request object (context of the calling test method)
         :param browser: str, browser driver identifier
+        :param browser_pool: BrowserPool instance, or None if pooling is off
         :yield pwpage: playwright page instance
     """
     logger.info(f"\nRequested '{browser}' driver.")
-    pwpage = None
+    logger.info(f"\nheaded: {request.config.option.headed}")
+
+    testcase = run_context.current_testcase()
+    # before the browser work: this fails if there is no recording to replay
+    testcase.har_session = har_session_for(request)
+
+    path_to_test = str(testcase.folder)
+    context_kwargs = {}
+    if request.config.option.video != 'off':
+        context_kwargs['record_video_dir'] = path_to_test
+
+    if browser_pool is not None:
+        context = browser_pool.new_context(**context_kwargs)
+        pwpage = open_pwpage(request, context)
+
+        yield pwpage
+
+        close_pwpage(request, context)
+        browser_pool.release(context)  # gracefully close and flush artifacts
+        logger.info(f"\nReleased context to the browser pool.")
+        discard_video(request, pwpage)
+        check_network_replay()
+        return
 
     from playwright.sync_api import sync_playwright
 
     with sync_playwright() as playwright:
-        logger.info(f"\nheaded: {request.config.option.headed}")
-
-        path_to_test = str(pytest.custom_namespace['this_test'])
-
-        if browser == 'chromium':
-            if request.config.option.headed:
-                this_browser = playwright.chromium.launch(headless=False)
-            else:
-                this_browser = playwright.chromium.launch(headless=True)
-        elif browser == 'firefox':
-            if request.config.option.headed:
-                this_browser = playwright.firefox.launch(headless=False)
-            else:
-                this_browser = playwright.firefox.launch(headless=True)
-        else:
-            msg = f"\nError: '{browser}' is not a valid selection."
-            logger.error(msg)
-            raise ValueError(msg)
-
-        context = this_browser.new_context()
-        if request.config.option.video:
-            context = this_browser.new_context(record_video_dir=path_to_test)
-
-        if request.config.option.tracing:
-            # To enable playwright tracing, we need to start it before
-            # any test actions are taken.
-            path_tracing = f"{path_to_test}/{TESTCASE_PLAYWRIGHT_TRACING}"
-            context.tracing.start(screenshots=True)
-            logger.info(f"\nGenerating tracing content.")
-
-
-        # Create the Playwright Page instance, which is a single tab
-        # in the browser. To disambiguate this while simultaneously
-        # making it very confusing, we'll call this `pwpage`.
-        pwpage = context.new_page()
-        # logger.info(f"\npwpage.__dict__: {utils.plog(pwpage.__dict__)}")
-        # logger.info(f"\ndir(pwpage): {utils.plog(dir(pwpage))}")
+        this_browser = launch_browser(playwright, browser,
+                                      headed=request.config.option.headed)
+        context = this_browser.new_context(**context_kwargs)
+        pwpage = open_pwpage(request, context)
 
         yield pwpage
 
-        if request.config.option.tracing:
-            # To generate the trace file, we need to stop it after.
-            context.tracing.stop(path=path_tracing)
-            logger.info(f"\nSaving tracing output.")
-
+        close_pwpage(request, context)
         context.close()  # gracefully close and flush artifacts
         logger.info(f"\nClosing context.")
+        discard_video(request, pwpage)
         this_browser.close()
         logger.info(f"\nQuitting browser.")
+    check_network_replay()
+
+
+def open_pwpage(request, context):
+    """
+        Per-test set up for a fresh context: route static assets through
+        the asset cache, install the storage journal and start tracing if
+        requested, then open the single tab the test will drive.
+
+        :param request: pytest request object
+        :param context: Playwright BrowserContext instance
+        :return pwpage: playwright page instance
+    """
+    testcase = run_context.current_testcase()
+    cache = asset_cache.get_cache()
+    if cache is not None:
+        cache.install(context)
+
+    capturing = testcase.capture_policy != 'off'
+    capacity = request.config.option.storage_journal_size
+    if capturing and testcase.delta_recorder is not None and capacity > 0:
+        # journal the web storage writes from every page in this context
+        storage_journal.install(context, capacity=capacity)
+        testcase.storage_journal = storage_journal.StorageJournal(capacity)
+
+    if request.config.option.tracing != 'off':
+        # To enable playwright tracing, we need to start it before
+        # any test actions are taken.
+        testcase.tracer = trace_chunks.TraceRecorder(
+            context, request.config.option.tracing, testcase.folder,
+            chunks_kept=request.config.option.trace_chunks_kept,
+            trace_filename=TESTCASE_PLAYWRIGHT_TRACING)
+        testcase.tracer.start()
+
+    # Create the Playwright Page instance, which is a single tab
+    # in the browser. To disambiguate this while simultaneously
+    # making it very confusing, we'll call this `pwpage`.
+    pwpage = context.new_page()
+
+    if testcase.har_session is not None:
+        # record or replay the network traffic of this context
+        testcase.har_session.start(context, pwpage)
+
+    mode = request.config.option.acceleration
+    if mode != 'off':
+        # block what the pages don't need; the page objects activate their
+        # profiles as they navigate
+        forced = acceleration.PROFILES.get(mode)
+        testcase.accelerator = acceleration.Accelerator(context, pwpage,
+                                                        forced=forced)
+
+    testcase.screenshots = screenshots.ScreenshotPipeline(
+        screenshot_settings(request.config))
+
+    if capturing:
+        # record the console as it happens; it can't be read back later
+        testcase.console_recorder = console_capture.ConsoleRecorder(
+            capacity=request.config.option.console_buffer_size)
+        testcase.console_recorder.attach(pwpage)
+
+    if capturing and request.config.option.network_capture != 'off' and \
+            'network' in testcase.folders:
+        testcase.network_recorder = network_capture.NetworkRecorder()
+        testcase.network_recorder.attach(pwpage)
+
+    # metrics are monitoring data for the whole run, so with on-failure
+    # they are still written for every test; 'off' turns them off too
+    if capturing and request.config.option.page_metrics != 'off' and \
+            'metrics' in testcase.folders:
+        testcase.page_metrics = page_metrics.PageMetricsRecorder(pwpage)
+    # logger.info(f"\npwpage.__dict__: {utils.plog(pwpage.__dict__)}")
+    # logger.info(f"\ndir(pwpage): {utils.plog(dir(pwpage))}")
+    return pwpage
+
+
+def close_pwpage(request, context):
+    """
+        Per-test tear down for a context, before the context is closed.
+
+        :param request: pytest request object
+        :param context: Playwright BrowserContext instance
+        :return: None
+    """
+    testcase = run_context.current_testcase()
+    if testcase.console_recorder is not None:
+        testcase.console_recorder.detach()
+        logger.info("\nconsole capture: %s", testcase.console_recorder.stats)
+
+    if testcase.network_recorder is not None:
+        save_last_network(testcase.network_recorder)
+
+    if testcase.page_metrics is not None:
+        testcase.page_metrics.close()
+        logger.info("\npage metrics: %s", testcase.page_metrics.stats)
+
+    if testcase.accelerator is not None:
+        logger.info("\nacceleration: %s", testcase.accelerator.stats)
+
+    if testcase.tracer is not None:
+        # To generate the trace file, we need to stop it after; with
+        # retain-on-failure, only a failed test writes its trace.
+        testcase.tracer.stop(failed=testcase_failed(request.node))
+        testcase.tracer = None
+
+
+def save_last_network(recorder):
+    """
+        Write the requests made since the last page transition, e.g. those
+        of a failed step, which no later transition will flush. The
+        requests still in flight are written too, marked unfinished.
+
+        :param recorder: network_capture.NetworkRecorder instance
+        :return: None
+    """
+    recorder.detach()
+    chunk = recorder.flush(recorder.last_page, 'test teardown', final=True)
+    summary = chunk.summary
+    if summary['requests']:
+        logger.info(f"\nnetwork after the last page transition: "
+                    f"{summary['requests']} requests ({summary['failed']} "
+                    f"failed, {summary['unfinished']} unfinished), "
+                    f"{summary['bytes']} bytes; "
+                    f"slowest: {summary['slowest']}")
+        utils_file.write_network_to_file(chunk)
+    logger.info("\nnetwork capture: %s", recorder.stats)
+
+
+def testcase_failed(item):
+    """
+        Whether the test's setup or call failed so far.
+
+        :param item: a test method
+        :return: bool
+    """
+    return item.stash.get(TESTCASE_FAILED, False)
+
+
+def discard_video(request, pwpage):
+    """
+        With `--video=retain-on-failure`, delete the video of a test that
+        passed. Playwright writes the video when the context is closed, so
+        call this after that.
+
+        :param request: pytest request object
+        :param pwpage: playwright page instance
+        :return: None
+    """
+    if request.config.option.video != 'retain-on-failure' or pwpage.video is None:
+        return
+    if testcase_failed(request.node):
+        logger.info(f"\nTest failed; keeping the video.")
+        return
+    pwpage.video.delete()
+    logger.info(f"\nTest passed; deleted the video.")
+
+
+def har_session_for(request):
+    """
+        Set up the network recording or replay for a test, per
+        `--network-mode`.
+
+        :param request: pytest request object
+        :return: har_mode.HarSession, or None for the live network
+    """
+    network_mode = request.config.option.network_mode
+    if network_mode == 'live':
+        return None
+    apps = [name for name in WEB_APP_FIXTURES if name in request.fixturenames]
+    app = apps[0] if apps else None
+    folder = har_folder(request.config)
+    scope = request.config.option.har_scope
+    if network_mode == 'record':
+        path = har_mode.recording_path(folder, scope, request.node.nodeid, app)
+    else:
+        path = har_mode.har_path(folder, scope, request.node.nodeid, app)
+    return har_mode.HarSession(
+        network_mode, path, latency_ms=request.config.option.replay_latency_ms)
+
+
+def check_network_replay():
+    """
+        With `--network-mode=replay`, error the test if it made requests
+        that are not in the recording. Call this once the browser is closed.
+
+        :return: None
+    """
+    har_session = run_context.current_testcase().har_session
+    if har_session is not None:
+        har_session.check()
+
+
+def har_folder(config):
+    """
+        :param config: pytest config object
+        :return: Path, the folder for the network recordings
+    """
+    har_dir = config.getoption('har_dir')
+    if har_dir:
+        return Path(har_dir).resolve()
+    # the recordings folder sits next to the output folder
+    return pytest.custom_namespace['testrun paths']['folder'].parents[1] / \
+        'recordings'
 
 
 @pytest.fixture(scope='session')
@@ -883,5 +1799,25 @@ def sweetshop(request):
         management for a generic web app.
         Note: not really, this is just an example to use for real apps
         that have actual users with real credentials in AWS.
+
+        With `--sweetshop-standin`, the sweetshop page objects are pointed
+        at a local stand-in server for the session (per worker with
+        pytest-xdist).
+
+        :param request: pytest request object
+        :yield: StandinServer instance, or None for the live site
     """
-    pass
+    option = request.config.option
+    if not option.sweetshop_standin:
+        yield None
+        return
+
+    from heofon.apps.sweetshop.noauth.pages import BasePage
+    from heofon.apps.sweetshop.standin.server import StandinServer, serve_app
+
+    server = StandinServer(latency_ms=option.standin_latency_ms,
+                           kb_per_second=option.standin_kb_per_second,
+                           error_rate=option.standin_error_rate,
+                           port=option.standin_port)
+    with server, serve_app(BasePage, server):
+        yield server